@@ -0,0 +1,60 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+from model.classification0430 import model_registry, shadow_evaluator, crop_list, crop_registry
+from model.deployment import DeploymentJob, start_job, get_job, stop_shadow, promote_shadow
+from model.shadow import ShadowStats
+from service.disease_table import DiseaseTableStats, disease_table
+from schema.request import DeployModelRequest, ShadowModelRequest
+from security import verify_admin_token
+
+# 운영자용 모델 교체 API (X-Admin-Token 헤더 필요)
+# 교체는 요청을 받은 워커에만 적용됨
+router = APIRouter(prefix="/admin", dependencies=[Depends(verify_admin_token)])
+
+
+# 새 버전 체크포인트를 백그라운드에서 로드/warm-up 후 교체
+# (백그라운드 작업을 이벤트 루프에 등록하므로 async 핸들러로 정의)
+# 바로 작업 상태를 반환하고, 진행 상황은 GET /admin/models/{crop}/deployment 로 확인
+@router.post("/models/{crop}/swap", status_code=202)
+async def swap_model_handler(crop: str, request: DeployModelRequest) -> DeploymentJob:
+    return start_job(crop, request.checkpoint, request.version, mode='swap')
+
+
+# 새 버전을 교체하지 않고 요청 일부에 같이 돌려서 서비스중인 모델과의 일치율만 기록
+@router.post("/models/{crop}/shadow", status_code=202)
+async def start_shadow_handler(crop: str, request: ShadowModelRequest) -> DeploymentJob:
+    return start_job(crop, request.checkpoint, request.version, mode='shadow', sample_rate=request.sample_rate)
+
+
+@router.delete("/models/{crop}/shadow", status_code=204)
+def stop_shadow_handler(crop: str) -> None:
+    stop_shadow(crop)
+
+
+# shadow 평가중인 후보 모델을 그대로 서비스 모델로 교체
+@router.post("/models/{crop}/shadow/promote", status_code=200)
+def promote_shadow_handler(crop: str) -> dict:
+    previous_version = promote_shadow(crop)
+    return {"crop": crop, "previous_version": previous_version, "version": model_registry.get_version(crop)}
+
+
+@router.get("/models/{crop}/deployment", status_code=200)
+def get_deployment_handler(crop: str) -> DeploymentJob:
+    job = get_job(crop)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"{crop} 모델 교체 기록이 없습니다.")
+    return job
+
+
+@router.get("/models/shadow", status_code=200)
+def get_shadow_stats_handler() -> List[ShadowStats]:
+    # 후보 모델별 top-1 / top-2 일치율
+    return shadow_evaluator.stats({crop: model_registry.get_version(crop) for crop in crop_list})
+
+
+# NCPMS 동기화나 Disease 테이블 수정 후 주기를 기다리지 않고 질병 매핑 테이블을 다시 만듦 (요청을 받은 워커만)
+@router.post("/disease_table/refresh", status_code=200)
+async def refresh_disease_table_handler() -> DiseaseTableStats:
+    await disease_table.load({spec.name: spec.class_names for spec in crop_registry})
+    return disease_table.stats()
@@ -1,19 +1,26 @@
+import asyncio
 from datetime import datetime
+from typing import List
+
+import config
 from database.connection import get_db
 from fastapi import Depends, HTTPException, APIRouter, UploadFile, File, Form
 from database.orm import DiagnosisResult
 from database.repository import UserRepository,DiagnosisResultRepository
-from model.classification0430 import predict
+from model.classification0430 import predict_many, embed_bytes, crop_registry, model_registry
 from schema.request import CreateDiagnosisResultRequest
 from schema.response import DiagnosticRecordSchema, DiagnosticRecordsListSchema, ClassificationResultSchema, \
-    DiseaseInfoSchema
+    DiseaseInfoSchema, MultiClassificationResultSchema, SimilarCaseSchema, SimilarCasesListSchema
 from database.orm import User
 from security import get_access_token
 from service.disease import get_ClassificationResultSchema_from_NCPMS_API, \
     get_ClassificationResultSchema_from_NCPMS_API_by_code, \
-    get_disease_id_from_NCPMS_API, get_disease_info_from_DB_by_name, get_disease_id_from_DB, \
-    get_disease_info_from_DB_by_id
-from service.firebase import upload_image_to_firebase_storage, delete_image_from_firebase_storage
+    get_disease_info_from_DB_by_name, get_disease_info_from_DB_by_id, \
+    DiseaseResolution, NcpmsResolver, resolve_disease
+from service.firebase import upload_image_bytes_to_firebase_storage, delete_image_from_firebase_storage
+from service.diagnosis import DiagnosisPipeline, to_percent
+from service.disease_table import disease_table
+from service.similar_cases import similar_case_index
 from service.user import UserService
 from sqlalchemy.orm import Session
 
@@ -31,107 +38,192 @@ ncpms_service_url = 'http://ncpms.rda.go.kr/npmsAPI/service?apiKey=2023e65d3f3a1
 async def get_classification_handler(
     plant: str = Form(...),
     img: UploadFile = File(...),
+    access_token: str = Depends(get_access_token),
+    # 요청마다 새로 생성되는 파이프라인 (단계별 결과를 요청 안에만 보관)
+    pipeline: DiagnosisPipeline = Depends()
+)->ClassificationResultSchema:
+    # 이미지는 한 번만 읽고, firebase 업로드와 모델 추론에 같은 바이트를 사용
+    image_bytes = await img.read()
+    return await pipeline.run(access_token, plant, image_bytes, img.filename, img.content_type)
+
+
+# 한 식물을 여러장 촬영한 사진으로 진단
+# 사진들을 한 번의 배치로 추론하고 확률을 평균내서 종합 판정, 질병 조회는 한 번만 수행
+# 진단기록은 사진마다 하나씩 한 트랜잭션으로 저장
+@router.post("/diagnose_multi", status_code=200)
+async def get_multi_classification_handler(
+    plant: str = Form(...),
+    imgs: List[UploadFile] = File(...),
     diagnosis_result_repo: DiagnosisResultRepository = Depends(),
     user_service: UserService = Depends(),
     user_repo: UserRepository = Depends(),
     access_token: str = Depends(get_access_token),
-    db: Session = Depends(get_db)  # 의존성 주입을 통해 DB 세션 추가
-)->ClassificationResultSchema:
-    global uploaded_img_info, prob1, prob2, disease_id1, disease_id2, disease_code1, disease_code2
+    db: Session = Depends(get_db)
+) -> MultiClassificationResultSchema:
     user_id: str = user_service.decode_jwt(access_token=access_token)["id"]
 
     user: User | None = user_repo.get_user_by_id(user_id=user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User Not Found")
 
-    available_plant_list = ['포도', '토마토', '딸기', '오이', '고추', '파프리카']
-
-    if plant not in available_plant_list:
+    if plant not in crop_registry:
         raise HTTPException(status_code=404, detail=f"진단 가능한 작물이 아닙니다. 입력된 작물명 {plant}")
 
+    if not imgs or len(imgs) > config.DIAGNOSE_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"사진은 1장 이상 {config.DIAGNOSE_MAX_IMAGES}장 이하로 보내주세요.")
+
+    # 사진 업로드와 배치 추론을 동시에 진행
+    image_bytes_list = [await img.read() for img in imgs]
+    # 한 장이라도 업로드에 실패하면 나머지 업로드가 끝날 때까지 기다린 뒤 올라간 사진을 모두 지움
+    uploads = asyncio.gather(*[
+        upload_image_bytes_to_firebase_storage(image_bytes, img.filename, img.content_type)
+        for image_bytes, img in zip(image_bytes_list, imgs)
+    ], return_exceptions=True)
+    upload_results, prediction = await asyncio.gather(
+        uploads, predict_many(image_bytes_list, plant), return_exceptions=True
+    )
+    upload_errors = [result for result in upload_results if isinstance(result, BaseException)]
+    if upload_errors:
+        print('에러가 발생 했습니다', upload_errors[0])
+        for uploaded_img_info in upload_results:
+            if not isinstance(uploaded_img_info, BaseException):
+                await delete_image_from_firebase_storage(uploaded_img_info.file_name)
+        raise HTTPException(status_code=500, detail="이미지 업로드 실패.")
+    uploaded_img_infos = upload_results
+    if isinstance(prediction, BaseException):
+        print('에러가 발생 했습니다', prediction)
+        for uploaded_img_info in uploaded_img_infos:
+            await delete_image_from_firebase_storage(uploaded_img_info.file_name)
+        if isinstance(prediction, HTTPException):
+            raise prediction
+        raise HTTPException(status_code=500, detail="진단에 실패했습니다.")
+    aggregated = prediction.aggregated
+
+    resolution: DiseaseResolution | None = disease_table.resolve(plant, aggregated.disease_name1, aggregated.disease_name2) \
+        or await resolve_disease(plant, aggregated.disease_name1, aggregated.disease_name2, db)
+    if not resolution:
+        print(f'확인되지 않는 질병: {aggregated.disease_name1}')
+        for uploaded_img_info in uploaded_img_infos:
+            await delete_image_from_firebase_storage(uploaded_img_info.file_name)
+        raise HTTPException(status_code=404, detail="확인되지 않는 질병입니다")
+
+    diagnosis_results: List[DiagnosisResult] = [
+        DiagnosisResult.create(
+            CreateDiagnosisResultRequest(
+                user_id=user_id,
+                img_url=uploaded_img_info.image_url,
+                is_approved=False,
+                percent1=to_percent(image_prediction.prob1),
+                percent2=to_percent(image_prediction.prob2),
+                disease_code1=resolution.disease_code1,
+                disease_code2=resolution.disease_code2,
+                disease_id1=resolution.disease_id1,
+                disease_id2=resolution.disease_id2
+            )
+        )
+        for uploaded_img_info, image_prediction in zip(uploaded_img_infos, prediction.per_image)
+    ]
     try:
-        uploaded_img_info = await upload_image_to_firebase_storage(img)
-        if uploaded_img_info:
-            print({"img_url": uploaded_img_info.image_url})
-        else:
-            raise HTTPException(status_code=404, detail="이미지 업로드 실패.")
+        diagnosis_result_repo.save_diagnosis_results(diagnosis_results)
     except Exception as ex:
-        print('에러가 발생 했습니다', ex)
+        print('진단기록 저장 실패', ex)
+        for uploaded_img_info in uploaded_img_infos:
+            await delete_image_from_firebase_storage(uploaded_img_info.file_name)
+        raise HTTPException(status_code=500, detail="진단기록 저장 실패")
+
+    return MultiClassificationResultSchema(
+        **resolution.result.model_dump(),
+        percent1=to_percent(aggregated.prob1),
+        percent2=to_percent(aggregated.prob2),
+        image_count=len(imgs),
+        diagnosis_result_ids=[diagnosis_result.result_id for diagnosis_result in diagnosis_results]
+    )
 
 
-    try:
-        global prob1, prob2, disease_name1, disease_name2
-        prob1, prob2, disease_name1, disease_name2 = await predict(img, plant)
-        # 타입 맞춰주기 위해 정수화
-        prob1 = int(prob1)
-        prob2 = int(prob2)
-    except Exception as ex:
-        print('에러가 발생 했습니다', ex)
-
-    # if disease_name1 == '정상':
-    #     diseaseName = '정상'
-    #     condition = ''
-    #     symptoms = ''
-    #     preventionMethod = ''
-    #     diseaseImg = ''
-    #     prob1 = None
-    #     prob2 = None
-    #     disease_code1 = ''
-    #     disease_code2 = ''
-    #
-    #     data = {
-    #         'diseaseName': diseaseName,
-    #         'condition': condition,
-    #         'symptoms': symptoms,
-    #         'preventionMethod': preventionMethod,
-    #         'diseaseImg': diseaseImg,
-    #         'plant_name':plant
-    #     }
-    #     result: ClassificationResultSchema = ClassificationResultSchema(**data)
-    #
-    # else:
-    result: ClassificationResultSchema = get_disease_info_from_DB_by_name(plant, disease_name1, db)
-    if result:
-        # wonjun-plan
-        # 여기 질병 데이터 추가 하면
-        # 1. disease_id1, disease_id2 에 대한 질병을
-        #    우리서버 db에서 검색해서 있으면 치환 없으면 '없는 질병입니다' 로 표기
-        # 2. disease_code1 = disease_id1, disease_code2 = disease_id2 후
-        disease_id1 = get_disease_id_from_DB(plant, disease_name1, db)
-        disease_id2 = get_disease_id_from_DB(plant, disease_name2, db)
-        disease_code1 = disease_id1
-        disease_code2 = disease_id2
-    else:
-        result = get_ClassificationResultSchema_from_NCPMS_API(plant, disease_name1)
+# 새 사진과 비슷한 과거 진단 k 건 조회 (진단기록은 남기지 않음)
+@router.post("/similar_cases", status_code=200)
+async def get_similar_cases_handler(
+    plant: str = Form(...),
+    img: UploadFile = File(...),
+    k: int = Form(5),
+    diagnosis_result_repo: DiagnosisResultRepository = Depends(),
+    user_service: UserService = Depends(),
+    user_repo: UserRepository = Depends(),
+    access_token: str = Depends(get_access_token)
+) -> SimilarCasesListSchema:
+    user_id: str = user_service.decode_jwt(access_token=access_token)["id"]
 
-        if not result:
-            print(f'확인되지 않는 질병: {disease_name1}')
-            await delete_image_from_firebase_storage(uploaded_img_info.file_name)
-            raise HTTPException(status_code=404, detail="확인되지 않는 질병입니다")
-        disease_id1 = None
-        disease_id2 = None
-        disease_code1 = get_disease_id_from_NCPMS_API(plant, disease_name1)
-        disease_code2 = get_disease_id_from_NCPMS_API(plant, disease_name2)
-
-    # wonjun-plan
-    # is_approved는 추후 승인과정이 생기면 변경해야함
-    # user_id 는 엑세스 금지 추가하면 돌려놓을것
-    diagnosis_result: DiagnosisResult = DiagnosisResult.create(
-        CreateDiagnosisResultRequest(
-            user_id=user_id,
-            img_url=uploaded_img_info.image_url,
-            is_approved=False,
-            percent1=prob1,
-            percent2=prob2,
-            disease_code1=disease_code1,
-            disease_code2=disease_code2,
-            disease_id1=disease_id1,
-            disease_id2=disease_id2
-        )
-    )
-    diagnosis_result_repo.save_diagnosis_result(diagnosis_result)
+    user: User | None = user_repo.get_user_by_id(user_id=user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User Not Found")
 
-    return result
+    if not config.SIMILAR_CASES_ENABLED:
+        raise HTTPException(status_code=404, detail="유사 사례 검색을 사용하지 않는 서버입니다.")
+    if plant not in crop_registry:
+        raise HTTPException(status_code=404, detail=f"진단 가능한 작물이 아닙니다. 입력된 작물명 {plant}")
+    if not 1 <= k <= config.SIMILAR_CASES_MAX_K:
+        raise HTTPException(status_code=400, detail=f"k 는 1 이상 {config.SIMILAR_CASES_MAX_K} 이하로 보내주세요.")
+
+    prediction = await embed_bytes(await img.read(), plant)
+    if prediction.embedding is None:
+        raise HTTPException(status_code=400, detail="현재 모델은 유사 사례 검색을 지원하지 않습니다.")
+
+    # 인덱스는 작물의 전체 진단기록을 담고 있으므로 여유있게 검색 후 요청한 사용자의 진단기록만 사용
+    # (삭제된 진단기록도 인덱스에 남아 있을 수 있음)
+    # 인덱스 검색은 이벤트 루프 밖에서 실행 (DB 에서 새 임베딩을 가져오는 것은 백그라운드 스레드에서)
+    matches = await asyncio.to_thread(similar_case_index.search, plant, model_registry.get_version(plant),
+                                      prediction.embedding, k * config.SIMILAR_CASES_CANDIDATE_FACTOR)
+    results = {result.result_id: result
+               for result in diagnosis_result_repo.get_diagnosis_results_by_ids([result_id for result_id, _ in matches],
+                                                                                user_id=user_id)}
+
+    similar_cases = []
+    for result_id, similarity in matches:
+        result = results.get(result_id)
+        if result is None:
+            continue
+        similar_cases.append(SimilarCaseSchema(
+            diagnosis_result_id=result.result_id,
+            similarity=similarity,
+            img_url=result.img_url,
+            percent1=result.percent1,
+            diseaseName=result.disease1.kor_name if result.disease1 else None,
+            disease_code1=result.disease_code1,
+            created_time=result.created_time
+        ))
+        if len(similar_cases) == k:
+            break
+    return SimilarCasesListSchema(similarCases=similar_cases)
+
+
+async def to_diagnostic_record(result: DiagnosisResult, db: Session, resolver: NcpmsResolver) -> DiagnosticRecordSchema:
+    # 진단기록 목록 API 공통, 진단기록에 질병 정보를 붙여서 반환
+    # disease1이 존재하는 경우에만 API를 호출
+    disease_info: ClassificationResultSchema
+    if result.disease_id1:
+        disease_info = get_disease_info_from_DB_by_id(result.disease_id1, db)
+    elif result.disease_code1:
+        # NCPMS 질병도 동기화된 경우 Disease 테이블에 sickKey 로 저장되어 있음 (service/ncpms_sync.py)
+        disease_info = get_disease_info_from_DB_by_id(result.disease_code1, db) \
+            or await get_ClassificationResultSchema_from_NCPMS_API_by_code(result.disease_code1, resolver)
+    else:
+        print('get_diagnoses_records_handler 에러발생. 입력된 질병정보 없음', result.disease1)
+        raise HTTPException(status_code=404, detail="get_diagnoses_records_handler 에러발생. 입력된 질병정보 없음")
+
+    return DiagnosticRecordSchema(
+        img_url=result.img_url,
+        is_approved=result.is_approved,
+        percent1=result.percent1,
+        percent2=result.percent2,
+        created_time=result.created_time,
+        diseaseName=disease_info.diseaseName,
+        condition=disease_info.condition,
+        symptoms=disease_info.symptoms,
+        preventionMethod=disease_info.preventionMethod,
+        diseaseImg=disease_info.diseaseImg,
+        diagnosis_result_id=result.result_id,
+        plant_name=disease_info.plant_name
+    )
 
 
 # 로그인중인 유저의 진단기록 확인
@@ -139,7 +231,7 @@ async def get_classification_handler(
 @router.get("/diagnosis_records", status_code=200)
 # query parameter 를 아래 함수에 인자 형태로 지정할 수 있음
 # None = None 조건을 추가하여 parameter 값이 필수로 들어가지 않게 조정 가능
-def get_diagnoses_records_handler(
+async def get_diagnoses_records_handler(
         access_token: str = Depends(get_access_token),
         order: str | None = None,
         user_service: UserService = Depends(),
@@ -160,49 +252,25 @@ def get_diagnoses_records_handler(
         reversed_results = diagnosis_results[::-1]
         diagnosis_results = reversed_results
 
-    processed_results = []
-    for result in diagnosis_results:
-        # disease1이 존재하는 경우에만 API를 호출
-        disease_info: ClassificationResultSchema
-        if result.disease_id1:
-            disease_info = get_disease_info_from_DB_by_id(result.disease_id1)
-        elif result.disease_code1:
-            disease_info = get_ClassificationResultSchema_from_NCPMS_API_by_code(result.disease_code1)
-        else:
-            print('get_diagnoses_records_handler 에러발생. 입력된 질병정보 없음', result.disease1)
-            raise HTTPException(status_code=404, detail="get_diagnoses_records_handler 에러발생. 입력된 질병정보 없음")
-
-        processed_result = DiagnosticRecordSchema(
-            img_url=result.img_url,
-            is_approved=result.is_approved,
-            percent1=result.percent1,
-            percent2=result.percent2,
-            created_time=result.created_time,
-            diseaseName=disease_info.diseaseName,
-            condition=disease_info.condition,
-            symptoms=disease_info.symptoms,
-            preventionMethod=disease_info.preventionMethod,
-            diseaseImg=disease_info.diseaseImg,
-            diagnosis_result_id=result.result_id,
-            plant_name=disease_info.plant_name
-        )
-
-        processed_results.append(processed_result)
+    # NCPMS 질병 정보는 기록마다 동시에 조회, 같은 질병 코드는 한 번만 조회
+    resolver = NcpmsResolver()
+    processed_results = await asyncio.gather(*[to_diagnostic_record(result, diagnosis_repo.session, resolver)
+                                               for result in diagnosis_results])
 
-    return DiagnosticRecordsListSchema(diagnosisResults=processed_results)
+    return DiagnosticRecordsListSchema(diagnosisResults=list(processed_results))
 
 
 
 # status code의 default 값은 따로 명시하지 않은경우 200
 @router.get("/about", status_code=200)
-def get_disease_handler(
+async def get_disease_handler(
     plantName: str,
     diseaseName: str,
     db: Session = Depends(get_db)  # 의존성 주입을 통해 DB 세션 추가
 ) -> DiseaseInfoSchema:
     result: ClassificationResultSchema = get_disease_info_from_DB_by_name(plantName, diseaseName, db)
     if not result:
-        result: ClassificationResultSchema = get_ClassificationResultSchema_from_NCPMS_API(plantName, diseaseName)
+        result: ClassificationResultSchema = await get_ClassificationResultSchema_from_NCPMS_API(plantName, diseaseName)
         print('DB에서 조회 불가한 병명 검색 시도 NCPMS에서 확인...')
         if not result:
             raise HTTPException(status_code=404, detail="확인되지 않는 질병입니다")
@@ -220,14 +288,14 @@ def get_disease_handler(
     return disease_info
 
 @router.get("/about_all", status_code=200)
-def get_disease_handler(
+async def get_disease_handler(
     plantName: str,
     diseaseName: str,
     db: Session = Depends(get_db)  # 의존성 주입을 통해 DB 세션 추가
 ) -> DiseaseInfoSchema:
     result: ClassificationResultSchema = get_disease_info_from_DB_by_name(plantName, diseaseName, db)
     if not result:
-        result: ClassificationResultSchema = get_ClassificationResultSchema_from_NCPMS_API(plantName, diseaseName)
+        result: ClassificationResultSchema = await get_ClassificationResultSchema_from_NCPMS_API(plantName, diseaseName)
         print('DB에서 조회 불가한 병명 검색 시도 NCPMS에서 확인...')
         if not result:
             raise HTTPException(status_code=404, detail="확인되지 않는 질병입니다")
@@ -247,7 +315,7 @@ def get_disease_handler(
 @router.get("/calendar_diagnosis_records", status_code=200)
 # query parameter 를 아래 함수에 인자 형태로 지정할 수 있음
 # None = None 조건을 추가하여 parameter 값이 필수로 들어가지 않게 조정 가능
-def get_diagnoses_records_by_date_handler(
+async def get_diagnoses_records_by_date_handler(
         month: int,
         year: int,
         access_token: str = Depends(get_access_token),
@@ -265,36 +333,12 @@ def get_diagnoses_records_by_date_handler(
 
     diagnosis_results: list[DiagnosisResult] = diagnosis_repo.get_diagnosis_results_by_month(start_date=requested_date,user_id=user_id)
 
-    processed_results = []
-    for result in diagnosis_results:
-        # disease1이 존재하는 경우에만 API를 호출
-        disease_info: ClassificationResultSchema
-        if result.disease_id1:
-            disease_info = get_disease_info_from_DB_by_id(result.disease_id1)
-        elif result.disease_code1:
-            disease_info = get_ClassificationResultSchema_from_NCPMS_API_by_code(result.disease_code1)
-        else:
-            print('get_diagnoses_records_handler 에러발생. 입력된 질병정보 없음', result.disease1)
-            raise HTTPException(status_code=404, detail="get_diagnoses_records_handler 에러발생. 입력된 질병정보 없음")
-
-        processed_result = DiagnosticRecordSchema(
-            img_url=result.img_url,
-            is_approved=result.is_approved,
-            percent1=result.percent1,
-            percent2=result.percent2,
-            created_time=result.created_time,
-            diseaseName=disease_info.diseaseName,
-            condition=disease_info.condition,
-            symptoms=disease_info.symptoms,
-            preventionMethod=disease_info.preventionMethod,
-            diseaseImg=disease_info.diseaseImg,
-            diagnosis_result_id=result.result_id,
-            plant_name=disease_info.plant_name
-        )
-
-        processed_results.append(processed_result)
+    # NCPMS 질병 정보는 기록마다 동시에 조회, 같은 질병 코드는 한 번만 조회
+    resolver = NcpmsResolver()
+    processed_results = await asyncio.gather(*[to_diagnostic_record(result, diagnosis_repo.session, resolver)
+                                               for result in diagnosis_results])
 
-    return DiagnosticRecordsListSchema(diagnosisResults=processed_results)
+    return DiagnosticRecordsListSchema(diagnosisResults=list(processed_results))
 
 
 # api 요청명 변경 => /delete 에서 /delete_diagnosis 로
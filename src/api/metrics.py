@@ -0,0 +1,107 @@
+from typing import List
+
+import config
+from fastapi import APIRouter
+from model.batching import BatchingStats
+from model.cascade import CascadeStats
+from model.classification0430 import model_registry, inference_batcher, inference_executor, shadow_executor, \
+    diagnosis_result_cache, cascade_monitor
+from model.executor import ExecutorStats
+from model.memory import ProcessMemory, get_process_memory
+from model.registry import ModelStats, ModelCacheStats
+from model.result_cache import ResultCacheStats
+from service.cache import SingleFlightStats
+from service.disease import ncpms_single_flight
+from service.disease_table import DiseaseTableStats, disease_table
+from service.healthy import HealthyFastPathStats, healthy_fast_path
+from service.ncpms_cache import NcpmsCacheStats, ncpms_cache
+from service.ncpms_client import NcpmsClientStats, ncpms_client
+from service.similar_cases import SimilarityIndexStats, similar_case_index
+
+# 워커 사이징/튜닝용 지표 조회 API
+# 워커 프로세스마다 값이 다르므로 응답은 요청을 받은 워커 기준
+router = APIRouter(prefix="/metrics")
+
+
+@router.get("/models", status_code=200)
+def get_model_stats_handler() -> List[ModelStats]:
+    # 작물별 모델 로드 시간과 상주 메모리
+    return model_registry.stats()
+
+
+@router.get("/model_cache", status_code=200)
+def get_model_cache_stats_handler() -> ModelCacheStats:
+    # 메모리 예산 대비 사용량과 hit / miss / eviction 횟수
+    return model_registry.cache_stats()
+
+
+@router.get("/batching", status_code=200)
+def get_batching_stats_handler() -> BatchingStats:
+    # 작물별 대기열 길이와 배치 크기 분포
+    return inference_batcher.stats()
+
+
+@router.get("/executor", status_code=200)
+def get_executor_stats_handler() -> ExecutorStats:
+    # 추론 스레드풀 설정과 현재 대기중인 작업 수
+    return inference_executor.stats()
+
+
+@router.get("/shadow_executor", status_code=200)
+def get_shadow_executor_stats_handler() -> ExecutorStats:
+    # shadow 평가 추론 전용 스레드풀
+    return shadow_executor.stats()
+
+
+@router.get("/memory", status_code=200)
+def get_memory_stats_handler() -> ProcessMemory:
+    # 요청을 받은 워커의 RSS / PSS (워커간 가중치 공유가 되는지 확인용)
+    return get_process_memory()
+
+
+@router.get("/result_cache", status_code=200)
+def get_result_cache_stats_handler() -> ResultCacheStats:
+    # 재업로드 사진 진단 결과 캐시 적중률
+    return diagnosis_result_cache.stats()
+
+
+@router.get("/cascade", status_code=200)
+def get_cascade_stats_handler() -> CascadeStats:
+    # 작물별 escalation 비율과 작은 모델로 절약한 추론 시간 (threshold 조정용)
+    return cascade_monitor.stats(config.CASCADE_ENABLED)
+
+
+@router.get("/healthy_fast_path", status_code=200)
+def get_healthy_fast_path_stats_handler() -> HealthyFastPathStats:
+    # 질병 조회 없이 정상 응답으로 처리된 진단 수
+    return healthy_fast_path.stats()
+
+
+@router.get("/disease_table", status_code=200)
+def get_disease_table_stats_handler() -> DiseaseTableStats:
+    # 매핑 테이블로 질병 조회를 처리한 진단 수와 테이블에 없는 클래스
+    return disease_table.stats()
+
+
+@router.get("/similarity_index", status_code=200)
+def get_similarity_index_stats_handler() -> List[SimilarityIndexStats]:
+    # 작물별 유사 사례 인덱스 크기와 클러스터 수
+    return similar_case_index.stats()
+
+
+@router.get("/ncpms_cache", status_code=200)
+def get_ncpms_cache_stats_handler() -> NcpmsCacheStats:
+    # NCPMS 응답 캐시 적중률과 원격 API 를 기다린 횟수
+    return ncpms_cache.stats()
+
+
+@router.get("/ncpms_client", status_code=200)
+def get_ncpms_client_stats_handler() -> NcpmsClientStats:
+    # 현재 NCPMS 동시 요청 수와 재시도/timeout 횟수
+    return ncpms_client.stats()
+
+
+@router.get("/ncpms_single_flight", status_code=200)
+def get_ncpms_single_flight_stats_handler() -> SingleFlightStats:
+    # 여러 요청의 같은 NCPMS 조회를 하나로 합친 횟수
+    return ncpms_single_flight.stats()
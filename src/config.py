@@ -0,0 +1,152 @@
+# 환경변수로 조정 가능한 서버 설정값 모음
+# 값이 없으면 아래 기본값을 사용
+import json
+import os
+
+
+def _get_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+# [작물 매니페스트]
+# 작물별 체크포인트 경로, 모델 구조, 입력 크기, 클래스 목록을 정의한 json 파일
+CROP_MANIFEST_PATH = os.environ.get('CROP_MANIFEST_PATH', './model/crops.json')
+
+# [추론 마이크로배치]
+# 같은 작물 요청을 모아서 한 번의 forward로 처리
+INFERENCE_BATCHING_ENABLED = _get_bool('INFERENCE_BATCHING_ENABLED', True)
+# 배치 최대 크기, 이 크기가 차면 바로 실행
+INFERENCE_MAX_BATCH_SIZE = int(os.environ.get('INFERENCE_MAX_BATCH_SIZE', '8'))
+# 첫 요청이 들어온 뒤 배치를 채우기 위해 기다리는 최대 시간(ms)
+INFERENCE_MAX_WAIT_MS = float(os.environ.get('INFERENCE_MAX_WAIT_MS', '10'))
+
+# [추론 실행기]
+# 디코딩/전처리/forward 같은 CPU 작업을 이벤트 루프 밖의 스레드풀에서 실행
+# 동시에 실행되는 추론 작업 수 (스레드 수)
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', '2'))
+# 실행 대기까지 포함해서 허용하는 최대 작업 수, 넘으면 503 응답
+INFERENCE_MAX_PENDING = int(os.environ.get('INFERENCE_MAX_PENDING', '64'))
+# torch intra-op 스레드 수, 0이면 (CPU 코어 수 / INFERENCE_WORKERS)
+TORCH_NUM_THREADS = int(os.environ.get('TORCH_NUM_THREADS', '0'))
+# shadow 평가 추론은 진단 요청과 다른 스레드풀에서 실행 (진단 요청의 대기열/503 에 영향 없도록)
+SHADOW_WORKERS = int(os.environ.get('SHADOW_WORKERS', '1'))
+# shadow 스레드풀이 이만큼 차 있으면 표본을 뽑지 않고 건너뜀
+SHADOW_MAX_PENDING = int(os.environ.get('SHADOW_MAX_PENDING', '4'))
+
+# [추론 백엔드]
+# 'torch' 또는 'onnx' (onnx는 python -m model.onnx_backend export 로 먼저 변환해야 함)
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch')
+# 변환된 onnx 모델 저장 위치
+ONNX_MODEL_DIR = os.environ.get('ONNX_MODEL_DIR', './model/onnx')
+
+# [추론 정밀도]
+# 작물별 정밀도 모드 JSON, 예) {"포도": "int8", "토마토": "bf16"}  (없는 작물은 fp32)
+# fp32 이외의 모드는 python -m model.precision validate 로 검증을 통과해야 적용됨
+INFERENCE_PRECISION = json.loads(os.environ.get('INFERENCE_PRECISION', '{}'))
+# 검증을 통과한 (작물, 모드) 기록 파일
+PRECISION_APPROVAL_PATH = os.environ.get('PRECISION_APPROVAL_PATH', './model/precision_approved.json')
+# 검증시 fp32 모델과의 top-1 일치율 최소값
+PRECISION_MIN_AGREEMENT = float(os.environ.get('PRECISION_MIN_AGREEMENT', '0.99'))
+
+# [모델 메모리 공유]
+# True 이면 main.py import 시점에 모델을 로드함
+# gunicorn --preload 로 실행하면 fork 전 마스터에서 로드되어 워커들이 가중치 페이지를 copy-on-write 로 공유
+PRELOAD_MODELS = _get_bool('PRELOAD_MODELS', False)
+
+# [모델 캐시]
+# 상주 모델 메모리 예산(MB), 넘으면 가장 오래 사용되지 않은 모델을 내림. 0이면 제한 없음
+MODEL_MEMORY_BUDGET_MB = int(os.environ.get('MODEL_MEMORY_BUDGET_MB', '0'))
+# 서버 시작시 미리 로드할 작물 (콤마 구분), 설정하지 않으면 전체 작물
+# 빈 값이면 미리 로드하지 않고 첫 요청시 로드
+MODEL_PRELOAD_CROPS = os.environ.get('MODEL_PRELOAD_CROPS')
+if MODEL_PRELOAD_CROPS is not None:
+    MODEL_PRELOAD_CROPS = [crop.strip() for crop in MODEL_PRELOAD_CROPS.split(',') if crop.strip()]
+
+# [모델 교체]
+# /admin API 호출시 X-Admin-Token 헤더로 확인하는 값, 비어있으면 /admin API 사용 불가
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+# 교체할 체크포인트가 있어야 하는 폴더 (이 폴더 밖의 파일은 로드하지 않음)
+MODEL_CHECKPOINT_DIR = os.environ.get('MODEL_CHECKPOINT_DIR', './model')
+# 교체 전 warm-up forward 횟수 (배치 크기별)
+MODEL_WARMUP_ITERATIONS = int(os.environ.get('MODEL_WARMUP_ITERATIONS', '3'))
+
+# [cascade 추론]
+# 작물 매니페스트에 cascade 가 설정된 작물은 작은 모델(또는 낮은 해상도)로 먼저 분류하고
+# top-1 확률이 threshold 미만일 때만 작물 모델까지 실행
+CASCADE_ENABLED = _get_bool('CASCADE_ENABLED', False)
+# 매니페스트의 cascade.threshold 가 없는 작물에 사용
+CASCADE_CONFIDENCE_THRESHOLD = float(os.environ.get('CASCADE_CONFIDENCE_THRESHOLD', '0.9'))
+
+# [정상 판정 fast path]
+# 보조 head(fc2) 출력 중 정상 클래스의 index (학습시 0: 정상, 1: 질병)
+AUX_HEALTHY_INDEX = int(os.environ.get('AUX_HEALTHY_INDEX', '0'))
+# 보조 head 의 정상 확률이 이 값 이상이고 top-1 도 정상이면 질병 조회 없이 미리 만들어둔 정상 응답을 사용
+HEALTHY_FAST_PATH_ENABLED = _get_bool('HEALTHY_FAST_PATH_ENABLED', True)
+HEALTHY_FAST_PATH_THRESHOLD = float(os.environ.get('HEALTHY_FAST_PATH_THRESHOLD', '0.95'))
+
+# [질병 매핑 테이블]
+# 서버 시작시 모든 (작물, 클래스명) 의 질병 정보를 DB/NCPMS 에서 미리 확인해두고 진단 요청은 테이블에서 조회
+DISEASE_TABLE_ENABLED = _get_bool('DISEASE_TABLE_ENABLED', True)
+# 테이블을 다시 만드는 주기 (NCPMS 동기화/DB 변경 반영)
+DISEASE_TABLE_REFRESH_SECONDS = float(os.environ.get('DISEASE_TABLE_REFRESH_SECONDS', str(60 * 60)))
+
+# [유사 사례 검색]
+# 진단할 때 작물 모델의 중간 출력(ResNet mid3 256차원, ViT pre-logits)을 DiagnosisEmbedding 에 저장하고
+# /disease/similar_cases 에서 작물별 IVF 인덱스로 비슷한 과거 진단을 검색
+SIMILAR_CASES_ENABLED = _get_bool('SIMILAR_CASES_ENABLED', True)
+# 인덱스 스냅샷 폴더 (재시작시 DB 전체를 다시 읽지 않고 스냅샷 이후 추가분만 읽음)
+SIMILARITY_INDEX_DIR = os.environ.get('SIMILARITY_INDEX_DIR', './similarity_index')
+# 검색할 때 비교할 클러스터 수 (클수록 정확하고 느림)
+SIMILARITY_NPROBE = int(os.environ.get('SIMILARITY_NPROBE', '8'))
+# 임베딩이 이 개수 이상 모이면 클러스터 학습 (그 전에는 전체 비교)
+SIMILARITY_TRAIN_MIN = int(os.environ.get('SIMILARITY_TRAIN_MIN', '1000'))
+# 검색 전에 DB에서 새 임베딩을 가져오는 최소 간격 (다른 워커가 저장한 진단도 반영)
+SIMILARITY_REFRESH_SECONDS = float(os.environ.get('SIMILARITY_REFRESH_SECONDS', '30'))
+# 새 임베딩이 이 개수만큼 추가될 때마다 스냅샷 저장
+SIMILARITY_SNAPSHOT_EVERY = int(os.environ.get('SIMILARITY_SNAPSHOT_EVERY', '1000'))
+SIMILAR_CASES_MAX_K = int(os.environ.get('SIMILAR_CASES_MAX_K', '50'))
+# 인덱스는 모든 사용자의 진단을 담고 있으므로 k 의 몇 배를 검색해서 요청한 사용자의 진단기록만 반환
+SIMILAR_CASES_CANDIDATE_FACTOR = int(os.environ.get('SIMILAR_CASES_CANDIDATE_FACTOR', '10'))
+
+# [NCPMS 응답 캐시]
+# NCPMS API 응답을 메모리(LRU)와 SQLite 파일에 저장해서 같은 조회는 원격 API 를 기다리지 않음
+NCPMS_CACHE_ENABLED = _get_bool('NCPMS_CACHE_ENABLED', True)
+NCPMS_CACHE_PATH = os.environ.get('NCPMS_CACHE_PATH', './ncpms_cache.sqlite3')
+NCPMS_CACHE_MEMORY_SIZE = int(os.environ.get('NCPMS_CACHE_MEMORY_SIZE', '2048'))
+# 이 시간이 지난 응답은 반환 후 백그라운드에서 다시 조회
+NCPMS_CACHE_TTL_SECONDS = float(os.environ.get('NCPMS_CACHE_TTL_SECONDS', str(24 * 60 * 60)))
+# ttl 이후로도 이 시간까지는 오래된 응답을 바로 반환, 0 이하면 제한 없음
+NCPMS_CACHE_MAX_STALE_SECONDS = float(os.environ.get('NCPMS_CACHE_MAX_STALE_SECONDS', '0'))
+
+# [NCPMS 클라이언트]
+NCPMS_SERVICE_URL = os.environ.get('NCPMS_SERVICE_URL', 'http://ncpms.rda.go.kr/npmsAPI/service')
+NCPMS_API_KEY = os.environ.get('NCPMS_API_KEY', '2023e65d3f3a1856c7ebec0195585bdcd581')
+# 요청 한 번의 timeout (재시도는 따로)
+NCPMS_REQUEST_TIMEOUT_SECONDS = float(os.environ.get('NCPMS_REQUEST_TIMEOUT_SECONDS', '5'))
+# 워커 하나에서 동시에 보내는 NCPMS 요청 수 (연결 풀 크기도 같음)
+NCPMS_MAX_IN_FLIGHT = int(os.environ.get('NCPMS_MAX_IN_FLIGHT', '8'))
+# 연결 실패/timeout/5xx 재시도 횟수와 첫 재시도 최대 대기시간 (재시도마다 2배, 0 ~ 최대값 사이 임의 대기)
+NCPMS_MAX_RETRIES = int(os.environ.get('NCPMS_MAX_RETRIES', '2'))
+NCPMS_RETRY_BACKOFF_SECONDS = float(os.environ.get('NCPMS_RETRY_BACKOFF_SECONDS', '0.2'))
+
+# [NCPMS 질병 목록 동기화]
+# python -m service.ncpms_sync 로 NCPMS 질병 정보를 Disease 테이블에 미리 저장 (요청 처리시 DB에서 조회)
+# 증분 실행시 마지막 동기화 후 이 시간이 지난 작물만 다시 동기화
+NCPMS_SYNC_INTERVAL_SECONDS = float(os.environ.get('NCPMS_SYNC_INTERVAL_SECONDS', str(24 * 60 * 60)))
+# 질병 목록(SVC01) 한 페이지 크기
+NCPMS_SYNC_PAGE_SIZE = int(os.environ.get('NCPMS_SYNC_PAGE_SIZE', '50'))
+
+# [진단 결과 캐시]
+# 같은 사진을 다시 올리면 추론 없이 이전 결과를 반환
+RESULT_CACHE_ENABLED = _get_bool('RESULT_CACHE_ENABLED', True)
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', '1024'))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get('RESULT_CACHE_TTL_SECONDS', '600'))
+# 0 이상이면 dHash 해밍 거리가 이 값 이하인 비슷한 사진(재촬영 등)도 캐시 적중으로 처리, -1 이면 사용 안함
+RESULT_CACHE_PHASH_MAX_DISTANCE = int(os.environ.get('RESULT_CACHE_PHASH_MAX_DISTANCE', '-1'))
+
+# [여러장 진단]
+# /disease/diagnose_multi 한 번에 받을 수 있는 최대 사진 수
+DIAGNOSE_MAX_IMAGES = int(os.environ.get('DIAGNOSE_MAX_IMAGES', '10'))
@@ -1,8 +1,9 @@
 import uuid
-from typing import Optional
+from array import array
+from typing import Optional, List
 
 from schema.request import CreateUserRequest, CreateFarmRequest, CreateDiagnosisResultRequest
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, TIMESTAMP
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, TIMESTAMP, LargeBinary, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
@@ -108,8 +109,43 @@ class DiagnosisResult(Base):
         )
 
 
+# 진단할 때 모델 중간 출력으로 얻은 이미지 임베딩 (유사 사례 검색용)
+# 모델 버전이 바뀌면 임베딩끼리 비교할 수 없으므로 버전을 같이 저장
+class DiagnosisEmbedding(Base):
+    __tablename__ = 'DiagnosisEmbedding'
+    __table_args__ = (
+        # 작물/모델 버전별로 마지막으로 읽은 id 이후만 가져오는 증분 조회용
+        Index('ix_diagnosis_embedding_crop_version_id', 'crop', 'model_version', 'embedding_id'),
+    )
+
+    embedding_id = Column(Integer, primary_key=True, autoincrement=True)
+    result_id = Column(Integer, ForeignKey('DiagnosisResult.result_id', ondelete='CASCADE'), nullable=False,
+                       unique=True)
+    crop = Column(String(50), nullable=False)
+    model_version = Column(String(50), nullable=True)
+    dim = Column(Integer, nullable=False)
+    # float32 배열을 그대로 저장
+    vector = Column(LargeBinary, nullable=False)
+    created_time = Column(TIMESTAMP, server_default=func.now())
+
+    @classmethod
+    def create(cls, result_id: int, crop: str, model_version: Optional[str],
+               embedding: List[float]) -> "DiagnosisEmbedding":
+        return cls(
+            result_id=result_id,
+            crop=crop,
+            model_version=model_version,
+            dim=len(embedding),
+            vector=array('f', embedding).tobytes()
+        )
+
+
 class Disease(Base):
     __tablename__ = 'Disease'
+    __table_args__ = (
+        # 진단할 때 작물/질병명으로 조회 (get_disease_by_plant_and_disease_name)
+        Index('ix_disease_plant_kor_name', 'plant', 'kor_name'),
+    )
 
     disease_id = Column(String(50), primary_key=True)
     kor_name = Column(String(255))
@@ -142,6 +178,18 @@ class Disease(Base):
 
 
 
+
+# NCPMS 질병 목록을 Disease 테이블로 동기화한 작물별 기록 (service/ncpms_sync.py)
+class NcpmsSyncState(Base):
+    __tablename__ = 'NcpmsSyncState'
+
+    crop = Column(String(50), primary_key=True)
+    # 마지막으로 오류 없이 동기화를 마친 시각, 증분 실행은 이 시각 기준으로 작물을 건너뜀
+    synced_time = Column(DateTime, nullable=False)
+    # 마지막 동기화 때 NCPMS 목록의 질병 수
+    disease_count = Column(Integer, nullable=False, default=0)
+
+
 class Post(Base):
     __tablename__ = 'Post'
     post_id = Column(Integer, primary_key=True, autoincrement=True)
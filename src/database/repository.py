@@ -7,7 +7,8 @@ from service.firebase import delete_image_from_firebase_storage
 from sqlalchemy import select, delete, update, asc, desc
 from sqlalchemy.orm import Session
 from database.connection import get_db
-from database.orm import User, Disease, Farm, DiagnosisResult, Post, PostImage, Comment
+from database.orm import User, Disease, Farm, DiagnosisResult, DiagnosisEmbedding, NcpmsSyncState, Post, PostImage, \
+    Comment
 from datetime import datetime, timedelta
 
 
@@ -48,6 +49,11 @@ class DiagnosisResultRepository:
     def get_diagnosis_result_by_id(self, result_id: str) -> DiagnosisResult | None:
         return self.session.scalar(select(DiagnosisResult).where(DiagnosisResult.result_id == result_id))
 
+    def get_diagnosis_results_by_ids(self, result_ids: List[int], user_id: str) -> List[DiagnosisResult]:
+        # ٸ  ܱ ȯ 
+        return list(self.session.scalars(select(DiagnosisResult).where(DiagnosisResult.result_id.in_(result_ids),
+                                                                       DiagnosisResult.user_id == user_id)))
+
     def get_diagnosis_results_by_user_id(self, user_id: str) -> List[DiagnosisResult]:
         return list(self.session.scalars(select(DiagnosisResult).where(DiagnosisResult.user_id == user_id)))
 
@@ -78,6 +84,14 @@ class DiagnosisResultRepository:
         self.session.refresh(diagnosis_result)
         return diagnosis_result
 
+    def save_diagnosis_results(self, diagnosis_results: List[DiagnosisResult]) -> List[DiagnosisResult]:
+        #   ϳ Ʈ 
+        self.session.add_all(diagnosis_results)
+        self.session.commit()
+        for diagnosis_result in diagnosis_results:
+            self.session.refresh(diagnosis_result)
+        return diagnosis_results
+
     def update_diagnosis_result(self, diagnosis_result: DiagnosisResult) -> DiagnosisResult:
         self.session.add(instance=diagnosis_result)
         self.session.commit()
@@ -93,6 +107,25 @@ class DiagnosisResultRepository:
 
 
 
+class DiagnosisEmbeddingRepository:
+    def __init__(self, session: Session = Depends(get_db)):
+        self.session = session
+
+    def save_embedding(self, embedding: DiagnosisEmbedding) -> DiagnosisEmbedding:
+        self.session.add(instance=embedding)
+        self.session.commit()
+        return embedding
+
+    def get_embeddings_after(self, crop: str, model_version: str | None, after_id: int,
+                             limit: int) -> List[DiagnosisEmbedding]:
+        #   ε  ſ, embedding_id  after_id  limit 
+        return list(self.session.scalars(select(DiagnosisEmbedding).where(
+            DiagnosisEmbedding.crop == crop,
+            DiagnosisEmbedding.model_version == model_version,
+            DiagnosisEmbedding.embedding_id > after_id
+        ).order_by(asc(DiagnosisEmbedding.embedding_id)).limit(limit)))
+
+
 class FarmRepository:
     def __init__(self, session: Session = Depends(get_db)):
         self.session = session
@@ -140,6 +173,19 @@ class DiseaseRepository:
             Disease.kor_name == disease_name
         ))
 
+    def get_diseases_by_plant(self, plantName: str) -> List[Disease]:
+        return list(self.session.scalars(select(Disease).where(Disease.plant == plantName)))
+
+    def get_diseases_by_ids(self, disease_ids: List[str]) -> List[Disease]:
+        if not disease_ids:
+            return []
+        return list(self.session.scalars(select(Disease).where(Disease.disease_id.in_(disease_ids))))
+
+    def save_diseases(self, diseases: List[Disease]) -> None:
+        #     commit   ( ü ߰, ȸ ü   ݿ)
+        self.session.add_all(diseases)
+        self.session.commit()
+
     def create_disease(self, disease: Disease) -> Disease:
         self.session.add(instance=disease)
         self.session.commit()
@@ -157,6 +203,24 @@ class DiseaseRepository:
         self.session.commit()
 
 
+class NcpmsSyncStateRepository:
+    def __init__(self, session: Session = Depends(get_db)):
+        self.session = session
+
+    def get_state(self, crop: str) -> NcpmsSyncState | None:
+        return self.session.scalar(select(NcpmsSyncState).where(NcpmsSyncState.crop == crop))
+
+    def save_state(self, crop: str, synced_time: datetime, disease_count: int) -> NcpmsSyncState:
+        state = self.get_state(crop)
+        if state is None:
+            state = NcpmsSyncState(crop=crop)
+        state.synced_time = synced_time
+        state.disease_count = disease_count
+        self.session.add(instance=state)
+        self.session.commit()
+        return state
+
+
 class PostRepository:
     def __init__(self, session: Session = Depends(get_db)):
         self.session = session
@@ -1,14 +1,66 @@
-from api import user, disease, post
+from contextlib import asynccontextmanager
+
+from api import user, disease, post, metrics, admin
 from fastapi import FastAPI, Request
+from model.classification0430 import model_registry, fast_model_registry, inference_executor, shadow_executor, \
+    validate_crop_checkpoints, crop_registry
+from service.disease_table import disease_table
+from service.healthy import healthy_fast_path
+from service.ncpms_cache import ncpms_cache
+from service.ncpms_client import ncpms_client
+from service.similar_cases import similar_case_index
+import config
 import datetime
 
 
-app = FastAPI()
+# gunicorn --preload 실행시 fork 전에 마스터 프로세스에서 모델을 미리 로드
+# (워커들은 fork 된 가중치 페이지를 공유하고, lifespan의 load_all은 이미 로드된 모델을 건너뜀)
+if config.PRELOAD_MODELS:
+    validate_crop_checkpoints()
+    model_registry.load_all(config.MODEL_PRELOAD_CROPS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 서버 시작시 작물별 모델을 한 번만 로드해서 상주시킴
+    # (요청마다 체크포인트를 다시 읽지 않도록)
+    # MODEL_PRELOAD_CROPS 에 없는 작물은 첫 요청시 로드
+    # 작물 매니페스트와 체크포인트가 맞지 않으면 서버를 시작하지 않음
+    validate_crop_checkpoints()
+    model_registry.load_all(config.MODEL_PRELOAD_CROPS)
+    if config.CASCADE_ENABLED:
+        # 별도 체크포인트가 있는 cascade 작은 모델만 (해상도만 줄이는 작물은 작물 모델을 같이 사용)
+        fast_model_registry.load_all([crop for crop in fast_model_registry.crops
+                                      if config.MODEL_PRELOAD_CROPS is None or crop in config.MODEL_PRELOAD_CROPS])
+    if disease_table.enabled or healthy_fast_path.enabled:
+        # (작물, 클래스명) 별 질병 정보 미리 확인, 실패하면 요청마다 기존 조회 경로 사용
+        # 정상 판정 fast path 도 진단기록의 질병 id/code 를 이 테이블에서 채움
+        try:
+            await disease_table.load({spec.name: spec.class_names for spec in crop_registry})
+        except Exception as ex:
+            print('질병 매핑 테이블 생성 실패', ex)
+    if config.SIMILAR_CASES_ENABLED:
+        # 유사 사례 인덱스는 스냅샷을 읽어두고 스냅샷 이후 추가분은 백그라운드에서 DB에서 가져옴
+        similar_case_index.load_snapshots(crop_registry.names)
+        similar_case_index.backfill({crop: model_registry.get_version(crop) for crop in crop_registry.names})
+    yield
+    if config.SIMILAR_CASES_ENABLED:
+        similar_case_index.snapshot_all()
+    disease_table.shutdown()
+    ncpms_cache.shutdown()
+    await ncpms_client.aclose()
+    shadow_executor.shutdown()
+    inference_executor.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 # app.include_router(todo2.router)
 # app.include_router(user2.router)
 app.include_router(user.router)
 app.include_router(disease.router)
 app.include_router(post.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
 
 # 미들웨어를 추가하여 각 요청이 들어올 때마다 현재 시간을 출력
 @app.middleware("http")
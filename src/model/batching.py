@@ -0,0 +1,114 @@
+# 같은 작물에 대한 진단 요청을 모아서 한 번의 forward로 처리하는 마이크로배치 스케줄러
+# 배치가 max_batch_size 만큼 차거나 첫 요청 이후 max_wait_ms 가 지나면 실행함
+import asyncio
+from typing import Any, Callable, Dict, List, Tuple
+
+import torch
+from pydantic import BaseModel
+
+from model.executor import InferenceExecutor
+
+
+class BatchingStats(BaseModel):
+    # 작물별 현재 대기중인 요청 수
+    queue_depth: Dict[str, int]
+    batch_count: int
+    item_count: int
+    mean_batch_size: float
+    max_batch_size: int
+    # 배치 크기별 실행 횟수
+    batch_size_histogram: Dict[int, int]
+
+
+class InferenceBatcher:
+    def __init__(self,
+                 run_batch: Callable[[str, torch.Tensor], List[Any]],
+                 max_batch_size: int,
+                 max_wait_ms: float,
+                 executor: InferenceExecutor | None = None):
+        # run_batch(crop, [N, C, H, W] 텐서) -> 입력 순서대로 N개의 결과
+        # executor가 있으면 forward를 이벤트 루프 밖에서 실행
+        self.run_batch = run_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._batch_count = 0
+        self._item_count = 0
+        self._histogram: Dict[int, int] = {}
+
+    async def submit(self, crop: str, input_data: torch.Tensor) -> Any:
+        # input_data: [1, C, H, W] 전처리된 이미지 한 장
+        # 배치가 실행되면 이 요청에 해당하는 결과만 돌려받음
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._get_queue(crop).put_nowait((input_data, future))
+        return await future
+
+    def _get_queue(self, crop: str) -> asyncio.Queue:
+        queue = self._queues.get(crop)
+        if queue is None:
+            queue = asyncio.Queue()
+            self._queues[crop] = queue
+        worker = self._workers.get(crop)
+        if worker is None or worker.done():
+            self._workers[crop] = asyncio.get_running_loop().create_task(self._worker(crop, queue))
+        return queue
+
+    async def _collect(self, queue: asyncio.Queue) -> List[Tuple[torch.Tensor, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # 이미 쌓여있는 요청은 기다리지 않고 가져감
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self, crop: str, queue: asyncio.Queue) -> None:
+        while True:
+            batch = await self._collect(queue)
+            # 요청이 취소된 경우(클라이언트 연결 끊김 등)는 배치에서 제외
+            batch = [(tensor, future) for tensor, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+            self._record(len(batch))
+            try:
+                results = await self._run(crop, torch.cat([tensor for tensor, _ in batch]))
+            except Exception as ex:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(ex)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def _run(self, crop: str, batch_tensor: torch.Tensor) -> List[Any]:
+        if self.executor is None:
+            return self.run_batch(crop, batch_tensor)
+        return await self.executor.run(self.run_batch, crop, batch_tensor)
+
+    def _record(self, size: int) -> None:
+        self._batch_count += 1
+        self._item_count += size
+        self._histogram[size] = self._histogram.get(size, 0) + 1
+
+    def stats(self) -> BatchingStats:
+        return BatchingStats(
+            queue_depth={crop: queue.qsize() for crop, queue in self._queues.items()},
+            batch_count=self._batch_count,
+            item_count=self._item_count,
+            mean_batch_size=self._item_count / self._batch_count if self._batch_count else 0.0,
+            max_batch_size=self.max_batch_size,
+            batch_size_histogram=dict(self._histogram)
+        )
@@ -0,0 +1,189 @@
+# 작물 모델별 추론 속도 벤치마크
+# 실제 체크포인트 없이 랜덤 초기화 가중치와 합성 이미지로 측정하므로 어디서나 실행 가능
+# 작물 x 백엔드 x 스레드 수 x 배치 크기 조합마다 p50/p95/p99 지연시간과 초당 처리 이미지 수를 기록
+#
+# 실행:  python -m model.benchmark --crops 토마토,포도 --batch-sizes 1,4,8 --threads 1,4 --output bench.json
+# 비교:  python -m model.benchmark --baseline bench_prev.json --max-regression 0.2
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+import torch
+from pydantic import BaseModel
+
+from model.classification0430 import crop_list, build_model, preprocess_image_bytes, predict_batch_with_model
+
+# 폰 사진 정도 크기의 합성 이미지
+SYNTHETIC_IMAGE_SIZE = (1440, 1920)
+
+
+class BenchmarkResult(BaseModel):
+    crop: str
+    backend: str
+    batch_size: int
+    threads: int
+    iterations: int
+    # 배치 하나의 전처리 + forward 지연시간
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    mean_ms: float
+    # forward 만의 지연시간 중앙값
+    forward_p50_ms: float
+    images_per_sec: float
+
+
+def make_synthetic_images(count: int, seed: int = 0) -> List[bytes]:
+    # 랜덤 노이즈는 JPEG 압축이 거의 안되어 실제 사진보다 디코딩이 느리므로 부드러운 그라데이션 + 노이즈 사용
+    rng = np.random.default_rng(seed)
+    height, width = SYNTHETIC_IMAGE_SIZE
+    images = []
+    for _ in range(count):
+        base = np.linspace(0, 255, width, dtype=np.float32)[None, :, None] * rng.uniform(0.3, 1.0, size=(1, 1, 3))
+        noise = rng.normal(0, 12, size=(height, width, 3))
+        image = np.clip(base + noise, 0, 255).astype(np.uint8)
+        ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        images.append(encoded.tobytes())
+    return images
+
+
+def load_benchmark_model(crop: str, backend: str, threads: int, work_dir: str):
+    # 랜덤 가중치 모델 생성, onnx 백엔드면 임시 폴더에 변환 후 세션 생성
+    model, input_size = build_model(crop)
+    model.eval()
+    if backend == 'torch':
+        return model, input_size
+
+    from model.onnx_backend import OnnxModel, export_model_to_onnx
+    onnx_path = os.path.join(work_dir, f'{crop_list.index(crop)}_random.onnx')
+    if not os.path.exists(onnx_path):
+        export_model_to_onnx(model, input_size, onnx_path)
+    return OnnxModel(onnx_path, intra_op_num_threads=threads), input_size
+
+
+def run_case(crop: str, backend: str, batch_size: int, threads: int,
+             images: List[bytes], iterations: int, warmup: int, work_dir: str) -> BenchmarkResult:
+    torch.set_num_threads(threads)
+    model, input_size = load_benchmark_model(crop, backend, threads, work_dir)
+    width, height = input_size
+    buffer = np.empty((batch_size, 3, height, width), dtype=np.float32)
+
+    latencies = []
+    forward_latencies = []
+    for iteration in range(warmup + iterations):
+        batch_images = [images[(iteration * batch_size + i) % len(images)] for i in range(batch_size)]
+        start = time.perf_counter()
+        for i, image_bytes in enumerate(batch_images):
+            preprocess_image_bytes(image_bytes, input_size, out=buffer[i:i + 1])
+        forward_start = time.perf_counter()
+        predict_batch_with_model(model, crop, torch.from_numpy(buffer))
+        end = time.perf_counter()
+        if iteration >= warmup:
+            latencies.append((end - start) * 1000)
+            forward_latencies.append((end - forward_start) * 1000)
+
+    mean_ms = float(np.mean(latencies))
+    return BenchmarkResult(
+        crop=crop,
+        backend=backend,
+        batch_size=batch_size,
+        threads=threads,
+        iterations=iterations,
+        p50_ms=float(np.percentile(latencies, 50)),
+        p95_ms=float(np.percentile(latencies, 95)),
+        p99_ms=float(np.percentile(latencies, 99)),
+        mean_ms=mean_ms,
+        forward_p50_ms=float(np.percentile(forward_latencies, 50)),
+        images_per_sec=batch_size / (mean_ms / 1000)
+    )
+
+
+def _result_key(result: dict) -> tuple:
+    return result['crop'], result['backend'], result['batch_size'], result['threads']
+
+
+def find_regressions(results: List[BenchmarkResult], baseline_path: str, max_regression: float) -> List[str]:
+    # 기준 결과 대비 p50 이 max_regression 비율 이상 느려진 조합 목록
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {_result_key(result): result for result in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(_result_key(result.model_dump()))
+        if previous is None:
+            continue
+        ratio = result.p50_ms / previous['p50_ms'] - 1
+        if ratio > max_regression:
+            regressions.append(f'{result.crop}/{result.backend} batch={result.batch_size} threads={result.threads}: '
+                               f'p50 {previous["p50_ms"]:.1f}ms -> {result.p50_ms:.1f}ms (+{ratio:.0%})')
+    return regressions
+
+
+def _parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='작물 모델 추론 벤치마크 (랜덤 가중치 + 합성 이미지)')
+    parser.add_argument('--crops', default=','.join(crop_list), help='콤마 구분 작물 목록')
+    parser.add_argument('--backends', default='torch', help='torch,onnx')
+    parser.add_argument('--batch-sizes', default='1,4,8', type=_parse_int_list)
+    parser.add_argument('--threads', default=str(os.cpu_count() or 1), type=_parse_int_list)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--images', type=int, default=16, help='합성 이미지 수')
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--baseline', help='비교할 이전 결과 json')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='허용하는 p50 증가 비율')
+    args = parser.parse_args(argv)
+
+    crops = [crop.strip() for crop in args.crops.split(',') if crop.strip()]
+    backends = [backend.strip() for backend in args.backends.split(',') if backend.strip()]
+    images = make_synthetic_images(args.images)
+
+    results: List[BenchmarkResult] = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for crop in crops:
+            for backend in backends:
+                for threads in args.threads:
+                    for batch_size in args.batch_sizes:
+                        result = run_case(crop, backend, batch_size, threads, images,
+                                          args.iterations, args.warmup, work_dir)
+                        results.append(result)
+                        print(f'{crop:<6}{backend:<7}batch={batch_size:<3}threads={threads:<3}'
+                              f'p50={result.p50_ms:8.1f}ms p95={result.p95_ms:8.1f}ms p99={result.p99_ms:8.1f}ms '
+                              f'{result.images_per_sec:7.1f} img/s')
+
+    report: Dict = {
+        'created_time': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'cpu_count': os.cpu_count(),
+            'machine': platform.machine()
+        },
+        'image_size': list(SYNTHETIC_IMAGE_SIZE),
+        'results': [result.model_dump() for result in results]
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'결과 저장: {args.output}')
+
+    if args.baseline:
+        regressions = find_regressions(results, args.baseline, args.max_regression)
+        if regressions:
+            print('성능 저하 발견:')
+            for regression in regressions:
+                print(f'  {regression}')
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# 가벼운 모델로 먼저 분류하고 확신이 낮을 때만 작물 모델을 실행하는 cascade 의 지표
+# threshold 를 정확도와 비교해서 조정할 수 있도록 작물별 escalation 비율과 절약된 시간을 집계
+import threading
+from typing import Dict, Optional
+
+from pydantic import BaseModel
+
+
+class CascadeCropStats(BaseModel):
+    request_count: int
+    # 작물 모델까지 실행한 요청 수
+    escalation_count: int
+    escalation_rate: float
+    mean_fast_ms: float
+    # escalation 된 요청에서 측정한 작물 모델 단계 시간
+    mean_full_ms: Optional[float]
+    # 작은 모델에서 끝난 요청들이 작물 모델을 실행했다면 걸렸을 시간 - 실제 걸린 시간 (추정)
+    # escalation 된 요청은 작은 모델 시간만큼 손해이므로 빼서 계산
+    estimated_saved_ms: Optional[float]
+
+
+class CascadeStats(BaseModel):
+    enabled: bool
+    crops: Dict[str, CascadeCropStats]
+
+
+class _CropCounters:
+    def __init__(self):
+        self.request_count = 0
+        self.escalation_count = 0
+        self.fast_seconds = 0.0
+        self.full_seconds = 0.0
+
+
+class CascadeMonitor:
+    def __init__(self):
+        self._counters: Dict[str, _CropCounters] = {}
+        self._lock = threading.Lock()
+
+    def record(self, crop: str, fast_seconds: float, full_seconds: Optional[float] = None) -> None:
+        # full_seconds 가 있으면 escalation 된 요청
+        with self._lock:
+            counters = self._counters.setdefault(crop, _CropCounters())
+            counters.request_count += 1
+            counters.fast_seconds += fast_seconds
+            if full_seconds is not None:
+                counters.escalation_count += 1
+                counters.full_seconds += full_seconds
+
+    def stats(self, enabled: bool) -> CascadeStats:
+        crops = {}
+        with self._lock:
+            for crop, counters in self._counters.items():
+                mean_fast = counters.fast_seconds / counters.request_count
+                mean_full = counters.full_seconds / counters.escalation_count if counters.escalation_count else None
+                saved = None
+                if mean_full is not None:
+                    accepted_count = counters.request_count - counters.escalation_count
+                    saved = accepted_count * (mean_full - mean_fast) - counters.escalation_count * mean_fast
+                crops[crop] = CascadeCropStats(
+                    request_count=counters.request_count,
+                    escalation_count=counters.escalation_count,
+                    escalation_rate=counters.escalation_count / counters.request_count,
+                    mean_fast_ms=mean_fast * 1000,
+                    mean_full_ms=mean_full * 1000 if mean_full is not None else None,
+                    estimated_saved_ms=saved * 1000 if saved is not None else None
+                )
+        return CascadeStats(enabled=enabled, crops=crops)
@@ -0,0 +1,143 @@
+# 워커 프로세스끼리 가중치 메모리를 공유하기 위한 mmap 체크포인트
+# .pt 체크포인트를 safetensors 형식(헤더 + 연속된 raw 텐서 데이터)으로 변환해두면
+# 로드시 파일을 mmap 으로 열어 텐서가 페이지 캐시를 그대로 가리키게 됨
+# -> 같은 노드의 워커들이 가중치 페이지를 공유 (워커 수만큼 RAM 이 늘어나지 않음)
+#
+# 변환:  python -m model.checkpoints convert [--crop 포도]
+import argparse
+import json
+import os
+import struct
+import warnings
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from model.classification0430 import crop_list, crop_registry
+
+# safetensors dtype 표기 <-> numpy dtype
+_DTYPES = {
+    'F64': np.float64,
+    'F32': np.float32,
+    'F16': np.float16,
+    'I64': np.int64,
+    'I32': np.int32,
+    'I16': np.int16,
+    'I8': np.int8,
+    'U8': np.uint8,
+    'BOOL': np.bool_,
+}
+_DTYPE_NAMES = {np.dtype(dtype): name for name, dtype in _DTYPES.items()}
+# 텐서 데이터 시작 위치 정렬 단위
+_ALIGNMENT = 64
+
+
+def get_mmap_checkpoint_path(crop_name: str, checkpoint_path: Optional[str] = None) -> str:
+    # ./model/2_best_max_acc_v2.pt -> ./model/2_best_max_acc_v2.safetensors
+    return os.path.splitext(checkpoint_path or crop_registry.get(crop_name).checkpoint)[0] + '.safetensors'
+
+
+def save_mmap_checkpoint(state_dict: Dict[str, torch.Tensor], path: str) -> None:
+    header = {}
+    arrays = []
+    offset = 0
+    for name, tensor in state_dict.items():
+        array = tensor.detach().cpu().contiguous().numpy()
+        if array.dtype not in _DTYPE_NAMES:
+            raise ValueError(f'mmap 체크포인트에서 지원하지 않는 dtype 입니다: {name} {array.dtype}')
+        # 텐서마다 정렬된 위치에서 시작하도록 패딩
+        offset += -offset % _ALIGNMENT
+        header[name] = {
+            'dtype': _DTYPE_NAMES[array.dtype],
+            'shape': list(array.shape),
+            'data_offsets': [offset, offset + array.nbytes]
+        }
+        arrays.append((offset, array))
+        offset += array.nbytes
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    # 데이터 영역 시작도 정렬되도록 헤더 뒤를 공백으로 채움
+    header_bytes += b' ' * (-(8 + len(header_bytes)) % _ALIGNMENT)
+
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        data_start = f.tell()
+        for array_offset, array in arrays:
+            f.seek(data_start + array_offset)
+            f.write(array.tobytes())
+
+
+def _read_header(path: str) -> Tuple[dict, int]:
+    # (헤더, 데이터 영역 시작 위치)
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    return header, 8 + header_size
+
+
+def read_mmap_checkpoint_shapes(path: str) -> Dict[str, List[int]]:
+    # 텐서 데이터는 읽지 않고 헤더에서 파라미터별 shape 만 반환
+    header, _ = _read_header(path)
+    return {name: info['shape'] for name, info in header.items() if name != '__metadata__'}
+
+
+def load_mmap_checkpoint(path: str) -> Dict[str, torch.Tensor]:
+    # 파일을 복사하지 않고 읽기전용 mmap 위의 텐서로 반환
+    header, data_start = _read_header(path)
+
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    state_dict = {}
+    # 읽기전용 배열을 torch 텐서로 감쌀 때 나오는 경고 무시 (추론에서는 가중치를 쓰지 않음)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        for name, info in header.items():
+            if name == '__metadata__':
+                continue
+            start, end = info['data_offsets']
+            array = buffer[data_start + start:data_start + end].view(_DTYPES[info['dtype']]).reshape(info['shape'])
+            state_dict[name] = torch.from_numpy(array)
+    return state_dict
+
+
+def assign_state_dict(model: nn.Module, state_dict: Dict[str, torch.Tensor]) -> None:
+    # load_state_dict 는 기존 파라미터에 값을 복사하므로(프로세스 전용 메모리 사용)
+    # 대신 파라미터/버퍼 자체를 mmap 텐서로 교체
+    expected = set(model.state_dict().keys())
+    missing = expected - set(state_dict.keys())
+    unexpected = set(state_dict.keys()) - expected
+    if missing or unexpected:
+        raise RuntimeError(f'체크포인트와 모델 구조가 일치하지 않습니다. missing={sorted(missing)} unexpected={sorted(unexpected)}')
+
+    for name, tensor in state_dict.items():
+        module_name, _, attr = name.rpartition('.')
+        module = model.get_submodule(module_name) if module_name else model
+        if attr in module._parameters:
+            if module._parameters[attr].shape != tensor.shape:
+                raise RuntimeError(f'파라미터 크기가 일치하지 않습니다: {name} {tuple(tensor.shape)}')
+            module._parameters[attr] = nn.Parameter(tensor, requires_grad=False)
+        else:
+            module._buffers[attr] = tensor
+
+
+def convert(crop_name: str) -> str:
+    checkpoint = torch.load(crop_registry.get(crop_name).checkpoint, map_location='cpu')
+    path = get_mmap_checkpoint_path(crop_name)
+    save_mmap_checkpoint(checkpoint['model_state_dict'], path)
+    return path
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='.pt 체크포인트를 mmap 가능한 형식으로 변환')
+    parser.add_argument('command', choices=['convert'])
+    parser.add_argument('--crop', choices=crop_list, help='지정하지 않으면 전체 작물')
+    args = parser.parse_args(argv)
+
+    for crop in [args.crop] if args.crop else crop_list:
+        print(f'[{crop}] 변환 완료: {convert(crop)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,32 @@
+import asyncio
 import io
+import os
+import time
 
 import cv2
 import numpy as np
 from cv2.dnn import Model
 from fastapi import FastAPI, UploadFile
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Optional
 import torch
 from torch.nn import functional as F
 from torchvision.models import resnet50
 import torch.nn as nn
-import albumentations as A
 from PIL import Image
-from albumentations.pytorch import ToTensorV2
 from timm import create_model
 from timm.data.constants import IMAGENET_DEFAULT_MEAN, IMAGENET_DEFAULT_STD
 
+import config
+from model.batching import InferenceBatcher
+from model.cascade import CascadeMonitor
+from model.crops import CascadeSpec, CropSpec, load_crop_registry, find_inconsistencies, CheckpointMismatchError
+from model.embedding import EmbeddingCapture
+from model.executor import InferenceExecutor
+from model.registry import ModelRegistry
+from model.result_cache import DiagnosisResultCache, get_content_hash, get_dhash
+from model.shadow import ShadowEvaluator
+
 
 # Request body에 대한 데이터 모델 정의
 class Item(BaseModel):
@@ -23,34 +34,8 @@ class Item(BaseModel):
     crop: str
 
 
-# 작물별 설정값을 담은 클래스
-class cfg:
-    input_size1 = (224, 224)
-    input_size2 = (256, 256)
-
-    ddalki_num_classes = 7
-    ddalki_class_list = ['00', 'a1', 'a2', 'b1', 'b6', 'b7', 'b8']
-    ddalki_class_list_name = ['정상', '잿빛곰팡이병', '흰가루병', '냉해피해', '다량원소결핍(N)', '다량원소결핍(P)', '다량원소결핍(K)']
-
-    tomato_num_classes = 8
-    tomato_class_list = ['00', 'a5', 'a6', 'b2', 'b3', 'b6', 'b7', 'b8']
-    tomato_class_list_name = ['정상', '흰가루병', '잿빛곰팡이병', '열과', '칼슘결핍', '다량원소결핍(N)', '다량원소결핍(P)', '다량원소결핍(K)']
-
-    paprica_num_classes = 7
-    paprica_class_list = ['00', 'a9', 'a10', 'b3', 'b6', 'b7', 'b8']
-    paprica_class_list_name = ['정상', '흰가루병', '잘록병', '칼슘결핍', '다량원소결핍(N)', '다량원소결핍(P)', '다량원소결핍(K)']
-
-    oe_num_classes = 7
-    oe_class_list = ['00', 'a3', 'a4', 'b1', 'b6', 'b7', 'b8']
-    oe_class_list_name = ['정상', '노균병', '흰가루병', '냉해피해', '다량원소결핍(N)', '다량원소결핍(P)', '다량원소결핍(K)']
-
-    gochu_num_classes = 7
-    gochu_class_list = ['00', 'a7', 'a8', 'b3', 'b6', 'b7', 'b8']
-    gochu_class_list_name = ['정상', '탄저병', '흰가루병', '칼슙결핍', '다량원소결핍(N)', '다량원소결핍(P)', '다량원소결핍(K)']
-
-    podo_num_classes = 5
-    podo_class_list = ['00', 'a11', 'a12', 'b4', 'b5']
-    podo_class_list_name = ['정상', '탄저병', '노균병', '일소피해', '축과병']
+# 작물별 설정값 (체크포인트, 모델 구조, 입력 크기, 클래스 목록)은 model/crops.json 매니페스트에서 관리
+crop_registry = load_crop_registry(config.CROP_MANIFEST_PATH)
 
 
 app = FastAPI()
@@ -87,139 +72,579 @@ class ResNet50(nn.Module):
         return out1, out2
 
 
-def load_model(crop_name):
-    # crop_name에 따라 모델 로드
-    # cfg_crop 내의 각 작물별 클래스 수는 적절히 정의되어 있어야 함
-    # 모델의 저장 경로는 실제 파일 경로로 변경해야 함 /model/6_best_max_acc_v2.pt
+def build_resnet50(spec: CropSpec) -> nn.Module:
+    return ResNet50(pretrained=False, num_classes=spec.num_classes)
 
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-    if crop_name == '딸기':
-        model = ResNet50(pretrained=False, num_classes=cfg.tomato_num_classes)
-        model.load_state_dict(torch.load('./model/1_best_max_acc_v2.pt', map_location=device)['model_state_dict'])
-        num = 0
-    elif crop_name == '토마토':
-        model = ResNet50(pretrained=False, num_classes=cfg.tomato_num_classes)
-        model.load_state_dict(torch.load('./model/2_best_max_acc_v2.pt', map_location=device)['model_state_dict'])
-        num = 0
-    elif crop_name == '파프리카':
-        model = ResNet50(pretrained=False, num_classes=cfg.paprica_num_classes)
-        model.load_state_dict(torch.load('./model/3_best_max_acc_v2.pt', map_location=device)['model_state_dict'])
-        num = 0
-    elif crop_name == '오이':
-        model = ResNet50(pretrained=False, num_classes=cfg.oe_num_classes)
-        model.load_state_dict(torch.load('./model/4_best_max_acc_v2.pt', map_location=device)['model_state_dict'])
-        num = 0
-    elif crop_name == '고추':
-        model = ResNet50(pretrained=False, num_classes=cfg.gochu_num_classes)
-        model.load_state_dict(torch.load('./model/5_best_max_acc_v2.pt', map_location=device)['model_state_dict'])
-        num = 0
-    elif crop_name == '포도':
-        model = ViT_MAE(num_classes=cfg.podo_num_classes, model_name='vit_base_patch16_224.mae', pretrained=False)
-        model.load_state_dict(torch.load('./model/6_best_max_acc_v2.pt', map_location=device)['model_state_dict'])
-        num = 1
-    return model, num
-
-
-def transform(img, num):
-    # 이미지 전처리 메서드
-    if num == 1:
-        input_size = (224, 224)
+def build_vit_mae(spec: CropSpec) -> nn.Module:
+    return ViT_MAE(num_classes=spec.num_classes, model_name=spec.backbone or 'vit_base_patch16_224.mae',
+                   pretrained=False)
+
+
+# 매니페스트의 arch 이름 -> 모델 생성 함수
+model_builders = {
+    'resnet50': build_resnet50,
+    'vit_mae': build_vit_mae,
+}
+# arch 별 분류 레이어 weight 이름 (체크포인트의 클래스 수 확인용)
+classifier_weight_keys = {
+    'resnet50': 'fc1.weight',
+    'vit_mae': 'model.head.weight',
+}
+crop_registry.check_architectures(model_builders.keys())
+
+
+def build_model(crop_name):
+    # crop_name에 해당하는 모델 구조만 생성 (가중치는 랜덤 초기화 상태)
+    # 반환값의 input_size 는 전처리에 사용할 (width, height)
+    return build_model_from_spec(crop_registry.get(crop_name))
+
+
+def build_model_from_spec(spec: CropSpec):
+    return model_builders[spec.arch](spec), spec.input_size
+
+
+def check_classifier_shape(spec: CropSpec, state_dict) -> None:
+    # 체크포인트의 클래스 수가 매니페스트와 다르면 잘못된 클래스명이 붙지 않도록 로드 중단
+    shapes = {name: list(tensor.shape) for name, tensor in state_dict.items()}
+    problems = find_inconsistencies([spec], {spec.name: shapes}, classifier_weight_keys)
+    if problems:
+        raise CheckpointMismatchError(problems[0])
+
+
+def load_model(crop_name, checkpoint_path=None):
+    # crop_name에 따라 모델 구조 생성 후 체크포인트 가중치 로드
+    # checkpoint_path 가 없으면 매니페스트의 체크포인트 사용 (모델 교체시 새 버전 경로를 넘김)
+    return load_model_from_spec(crop_registry.get(crop_name), checkpoint_path)
+
+
+def load_model_from_spec(spec: CropSpec, checkpoint_path=None):
+    # 변환된 mmap 체크포인트(python -m model.checkpoints convert)가 있으면 그쪽을 우선 사용
+    from model.checkpoints import get_mmap_checkpoint_path, load_mmap_checkpoint, assign_state_dict
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    checkpoint_path = checkpoint_path or spec.checkpoint
+
+    model, input_size = build_model_from_spec(spec)
+    mmap_path = get_mmap_checkpoint_path(spec.name, checkpoint_path)
+    if device.type == 'cpu' and os.path.exists(mmap_path):
+        # 가중치를 복사하지 않고 파일 페이지를 그대로 사용 -> 워커끼리 공유됨
+        state_dict = load_mmap_checkpoint(mmap_path)
+        check_classifier_shape(spec, state_dict)
+        assign_state_dict(model, state_dict)
     else:
-        input_size = (256, 256)
+        state_dict = torch.load(checkpoint_path, map_location=device)['model_state_dict']
+        check_classifier_shape(spec, state_dict)
+        model.load_state_dict(state_dict)
+    return model, input_size
+
+
+# 검증을 마친 프로세스 (gunicorn --preload 로 마스터에서 검증하면 fork 된 워커의 lifespan 에서는 건너뜀)
+_checkpoints_validated = False
+
+
+def _is_checked_on_preload(spec: CropSpec) -> bool:
+    # 시작시 미리 로드되는 모델은 load_model_from_spec 의 check_classifier_shape 에서 클래스 수를 확인함
+    # (onnx 백엔드의 작물 모델은 state_dict 를 읽지 않으므로 해당 없음)
+    crop = spec.name[:-len('(cascade)')] if spec.name.endswith('(cascade)') else spec.name
+    if config.MODEL_PRELOAD_CROPS is not None and crop not in config.MODEL_PRELOAD_CROPS:
+        return False
+    if spec.name != crop:
+        return config.CASCADE_ENABLED
+    return config.INFERENCE_BACKEND != 'onnx'
+
+
+def validate_crop_checkpoints() -> None:
+    # 서버 시작시 매니페스트와 체크포인트가 맞는지 확인, 맞지 않으면 예외를 발생시켜 시작을 중단
+    # mmap 체크포인트는 헤더만 읽어서 클래스 수까지 확인
+    # .pt 만 있는 작물은 미리 로드되지 않는 작물만 state_dict 를 CPU 로 읽어서 확인
+    # (미리 로드되는 작물은 load_all 에서 확인하고 CheckpointMismatchError 로 시작을 중단)
+    from model.checkpoints import get_mmap_checkpoint_path, read_mmap_checkpoint_shapes
+
+    global _checkpoints_validated
+    if _checkpoints_validated:
+        return
+    # cascade 용 별도 모델도 같은 방식으로 확인
+    specs = list(crop_registry) + [spec.get_cascade_spec() for spec in crop_registry if spec.get_cascade_spec()]
+    checkpoint_shapes = {}
+    for spec in specs:
+        mmap_path = get_mmap_checkpoint_path(spec.name, spec.checkpoint)
+        if os.path.exists(mmap_path):
+            checkpoint_shapes[spec.name] = read_mmap_checkpoint_shapes(mmap_path)
+        elif not os.path.exists(spec.checkpoint):
+            checkpoint_shapes[spec.name] = None
+        elif _is_checked_on_preload(spec):
+            checkpoint_shapes[spec.name] = {}
+        else:
+            state_dict = torch.load(spec.checkpoint, map_location='cpu')['model_state_dict']
+            checkpoint_shapes[spec.name] = {name: list(tensor.shape) for name, tensor in state_dict.items()}
+            del state_dict
+    problems = find_inconsistencies(specs, checkpoint_shapes, classifier_weight_keys)
+    if problems:
+        raise CheckpointMismatchError('작물 매니페스트와 체크포인트가 일치하지 않습니다.\n' + '\n'.join(problems))
+    _checkpoints_validated = True
+
+
+def load_inference_model(crop_name, checkpoint_path=None):
+    # config.INFERENCE_BACKEND 에 따라 torch 모델 또는 onnxruntime 세션을 로드
+    if config.INFERENCE_BACKEND == 'onnx':
+        # onnxruntime은 onnx 백엔드를 쓸 때만 필요하므로 여기서 import
+        from model.onnx_backend import load_onnx_model
+        return load_onnx_model(crop_name, checkpoint_path)
+
+    # 작물별 정밀도 모드(fp32/int8/bf16) 적용, 검증되지 않은 모드는 fp32 로 대체됨
+    from model.precision import apply_precision, resolve_precision
+    model, input_size = load_model(crop_name, checkpoint_path)
+    model.eval()
+    return apply_precision(model, resolve_precision(crop_name, checkpoint_path)), input_size
+
+
+# 진단 가능한 작물 목록 (매니페스트 순서)
+crop_list = crop_registry.names
+
+# 프로세스에 상주하는 작물별 모델, main.py의 lifespan에서 load_all() 호출
+# MODEL_MEMORY_BUDGET_MB 가 있으면 예산 안에서 LRU 로 작물 모델을 교체
+model_registry = ModelRegistry(
+    loader=load_inference_model,
+    crops=crop_list,
+    memory_budget_bytes=config.MODEL_MEMORY_BUDGET_MB * 1024 * 1024,
+    versions={spec.name: spec.version for spec in crop_registry}
+)
+
+
+def load_fast_model(crop_name, checkpoint_path=None):
+    # cascade 에 별도 체크포인트로 지정된 작은 모델 로더
+    return load_model_from_spec(crop_registry.get(crop_name).get_cascade_spec(), checkpoint_path)
+
+
+# cascade 용 작은 모델 (별도 체크포인트가 있는 작물만, 해상도만 줄이는 작물은 model_registry 의 모델을 같이 사용)
+fast_model_registry = ModelRegistry(
+    loader=load_fast_model,
+    crops=[spec.name for spec in crop_registry if spec.get_cascade_spec()]
+)
+
+# 전처리/forward를 실행하는 스레드풀 (이벤트 루프를 막지 않도록)
+inference_executor = InferenceExecutor(
+    max_workers=config.INFERENCE_WORKERS,
+    max_pending=config.INFERENCE_MAX_PENDING,
+    torch_num_threads=config.TORCH_NUM_THREADS
+)
+
+
+# ImageNet 정규화 상수 (BGR 이미지의 채널 순서 그대로 적용, 기존 A.Normalize 와 같은 계산)
+# (x - mean * 255) / (std * 255) = x * scale - offset
+_NORMALIZE_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float64)
+_NORMALIZE_STD = np.array([0.229, 0.224, 0.225], dtype=np.float64)
+_NORMALIZE_SCALE = (1.0 / (_NORMALIZE_STD * 255.0)).astype(np.float32)
+_NORMALIZE_OFFSET = (_NORMALIZE_MEAN / _NORMALIZE_STD).astype(np.float32)
+
+# 큰 JPEG는 디코딩 단계에서 1/2, 1/4, 1/8 로 줄여서 읽음 (256x256만 필요하므로)
+_REDUCED_DECODE_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+
+def decode_image(image_bytes: bytes, input_size) -> np.ndarray:
+    # 업로드된 이미지를 한 번만 디코딩해서 BGR 배열로 반환
+    flag = cv2.IMREAD_COLOR
+    if image_bytes[:2] == b'\xff\xd8':
+        # 헤더만 읽어서 원본 크기 확인 (픽셀 디코딩은 하지 않음)
+        width, height = Image.open(io.BytesIO(image_bytes)).size
+        for scale, reduced_flag in _REDUCED_DECODE_FLAGS:
+            # 줄인 크기가 입력 크기보다 작아지지 않는 가장 큰 배율 사용
+            if width // scale >= input_size[0] and height // scale >= input_size[1]:
+                flag = reduced_flag
+                break
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flag)
+    if image is None:
+        raise ValueError('이미지를 디코딩할 수 없습니다.')
+    return image
+
+
+def normalize_into(img: np.ndarray, out: np.ndarray) -> np.ndarray:
+    # HxWx3 uint8 이미지를 정규화해서 3xHxW float32 버퍼(out)에 바로 기록 (중간 배열 없음)
+    for channel in range(3):
+        np.multiply(img[:, :, channel], _NORMALIZE_SCALE[channel], out=out[channel])
+        np.subtract(out[channel], _NORMALIZE_OFFSET[channel], out=out[channel])
+    return out
+
+
+def transform(img, input_size, out: np.ndarray | None = None):
+    # 이미지 전처리 메서드
+    # (width, height) 로 리사이즈 후 정규화 결과를 [3, H, W] 텐서로 반환 (out 이 있으면 해당 버퍼에 기록)
     img = cv2.resize(img, dsize=input_size)
+    if out is None:
+        out = np.empty((3, input_size[1], input_size[0]), dtype=np.float32)
+    return torch.from_numpy(normalize_into(img, out))
 
-    base_augs = [
-        A.Normalize(mean=[0.485, 0.456, 0.406],
-                    std=[0.229, 0.224, 0.225],
-                    max_pixel_value=255.0,
-                    p=1.0),
-        ToTensorV2()
-    ]
-    transformed = A.Compose(base_augs)
-    img = transformed(image=img)['image']
-    return img
 
+image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+
+def preprocess_image_new(image_path, input_size):
+    with open(image_path, 'rb') as f:
+        return preprocess_image_bytes(f.read(), input_size)
+
+
+def list_image_files(root: str) -> List[str]:
+    # root 폴더 하위의 이미지 파일 경로 목록 (정렬된 순서)
+    image_paths = []
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            if file_name.lower().endswith(image_extensions):
+                image_paths.append(os.path.join(dir_path, file_name))
+    return sorted(image_paths)
 
-def preprocess_image_new(image_path, num):
-    if num == 1:
-        input_size = (224, 224)
-    else:
-        input_size = (256, 256)
-    image = cv2.imread(image_path)
-    image_copy = Image.open(image_path)
-    input_data = transform(image, num)
-    input_data = input_data.unsqueeze(0)
-    return input_data, image_copy
 
+def preprocess_image_bytes(image_bytes: bytes, input_size, out: np.ndarray | None = None):
+    # 디코딩 1회 + 리사이즈 + 정규화 -> [1, 3, H, W] 텐서
+    # out 으로 미리 할당한 [1, 3, H, W] float32 버퍼를 넘기면 그 버퍼에 기록함
+    input_data, _ = preprocess_image_bytes_with_dhash(image_bytes, input_size, with_dhash=False, out=out)
+    return input_data
 
-async def preprocess_image_file_new(file: UploadFile, num):
+
+def preprocess_image_bytes_with_dhash(image_bytes: bytes, input_size, with_dhash: bool,
+                                     out: np.ndarray | None = None):
+    # 전처리와 함께 결과 캐시 조회용 perceptual hash 도 계산 (디코딩은 한 번만)
+    if out is None:
+        out = np.empty((1, 3, input_size[1], input_size[0]), dtype=np.float32)
+    image = decode_image(image_bytes, input_size)
+    dhash = get_dhash(image) if with_dhash else None
+    transform(image, input_size, out=out[0])
+    return torch.from_numpy(out), dhash
+
+
+async def preprocess_image_file_new(file: UploadFile, input_size):
     # 이미지 파일을 바이트 데이터로 읽어들입니다.
     image_stream = await file.read()
-    # 바이트 데이터를 numpy 배열로 변환합니다.
-    image_copy = Image.open(io.BytesIO(image_stream))
-    image_stream = np.frombuffer(image_stream, np.uint8)
-    if num == 1:
-        input_size = (224, 224)
-    else:
-        input_size = (256, 256)
-
-    image = cv2.imdecode(image_stream, cv2.IMREAD_COLOR)
-    input_data = transform(image, num)
-    input_data = input_data.unsqueeze(0)
-    return input_data, image_copy
+    # 디코딩/전처리는 CPU 작업이라 이벤트 루프 밖에서 실행
+    return await inference_executor.run(preprocess_image_bytes, image_stream, input_size)
 
 
 def select_class_list(crop_name):
-    if crop_name == '딸기':
-        class_list_name = cfg.ddalki_class_list_name
-    elif crop_name == '토마토':
-        class_list_name = cfg.tomato_class_list_name
-    elif crop_name == '파프리카':
-        class_list_name = cfg.paprica_class_list_name
-    elif crop_name == '오이':
-        class_list_name = cfg.oe_class_list_name
-    elif crop_name == '고추':
-        class_list_name = cfg.gochu_class_list_name
-    elif crop_name == '포도':
-        class_list_name = cfg.podo_class_list_name
-    return class_list_name
-
-
-def predict_by_img_url(path, crop):
-    # 모델 로드 및 예측 수행
-    # preprocess_image_new와 cfg.podo_class_list_name는 적절히 정의되어 있어야 함
-    model, num = load_model(crop)
-    model.eval()
+    return crop_registry.get(crop_name).class_names
+
+
+def select_input_size(crop_name):
+    # 전처리 입력 크기 (width, height)
+    return crop_registry.get(crop_name).input_size
+
+
+class PredictionResult(BaseModel):
+    # 확률 상위 2개 질병과 각각의 확률(0~1)
+    prob1: float
+    prob2: float
+    disease_name1: str
+    disease_name2: str
+    # 보조 head(fc2, 정상/질병 2-way)의 정상 확률, 보조 head 가 없는 모델(ViT)은 None
+    healthy_prob: Optional[float] = None
+    # 유사 사례 검색용 이미지 임베딩 (작물 모델 forward 에서만 채워짐, 응답에는 포함하지 않음)
+    embedding: Optional[List[float]] = Field(default=None, exclude=True)
+    # cascade 작은 모델 결과를 그대로 사용함 (작물 모델을 실행하지 않아 임베딩이 없음)
+    from_cascade: bool = Field(default=False, exclude=True)
+
+
+embedding_capture = EmbeddingCapture()
+
+
+def run_batch(crop: str, input_data: torch.Tensor) -> List[PredictionResult]:
+    # [N, C, H, W] 입력을 한 번의 forward로 처리하고 이미지별 top-2 결과를 입력 순서대로 반환
+    if config.SIMILAR_CASES_ENABLED:
+        return run_batch_with_embedding(crop, input_data)
+    model, _ = model_registry.get(crop)
+    return predict_batch_with_model(model, crop, input_data)
 
-    input_data, input_copy = preprocess_image_new(path, num)
 
+def run_batch_with_embedding(crop: str, input_data: torch.Tensor) -> List[PredictionResult]:
+    # 같은 forward 에서 임베딩도 같이 받아서 결과에 붙임 (임베딩을 지원하지 않는 모델이면 None 으로 남음)
+    model, _ = model_registry.get(crop)
+    with embedding_capture.capture(model) as captured:
+        results = predict_batch_with_model(model, crop, input_data)
+    if captured.value is not None:
+        for result, embedding in zip(results, captured.value.tolist()):
+            result.embedding = embedding
+    return results
+
+
+def predict_batch_with_model(model, crop: str, input_data: torch.Tensor) -> List[PredictionResult]:
+    # 주어진 모델로 forward 후 top-2 결과 생성 (레지스트리 밖의 모델 - 벤치마크, 검증 등 - 에서도 사용)
+    probs, healthy_probs = forward_probs_with_aux(model, input_data)
+    return top2_from_probs(probs, select_class_list(crop), healthy_probs)
+
+
+def forward_probs(model, input_data: torch.Tensor) -> torch.Tensor:
+    # [N, C, H, W] -> 클래스별 확률 [N, num_classes]
+    probs, _ = forward_probs_with_aux(model, input_data)
+    return probs
+
+
+def forward_probs_with_aux(model, input_data: torch.Tensor):
+    # [N, C, H, W] -> (클래스별 확률 [N, num_classes], 보조 head 의 정상 확률 [N] 또는 None)
     with torch.no_grad():
-        output, _ = model(input_data)
+        output, aux_output = model(input_data)
         probs = F.softmax(output, dim=1)
+        if aux_output is None:
+            return probs, None
+        return probs, F.softmax(aux_output, dim=1)[:, config.AUX_HEALTHY_INDEX]
+
+
+def top2_from_probs(probs: torch.Tensor, class_list_name: List[str],
+                    healthy_probs: Optional[torch.Tensor] = None) -> List[PredictionResult]:
+    top_probs, top_indices = probs.topk(2, dim=1)
+    healthy_list = healthy_probs.tolist() if healthy_probs is not None else [None] * len(probs)
+
+    results = []
+    for row_probs, row_indices, healthy_prob in zip(top_probs.tolist(), top_indices.tolist(), healthy_list):
+        results.append(PredictionResult(
+            prob1=row_probs[0],
+            prob2=row_probs[1],
+            disease_name1=class_list_name[row_indices[0]],
+            disease_name2=class_list_name[row_indices[1]],
+            healthy_prob=healthy_prob
+        ))
+    return results
+
+
+class MultiPredictionResult(BaseModel):
+    # 여러 장의 확률 평균으로 정한 종합 결과
+    aggregated: PredictionResult
+    # 이미지별 결과, 질병명은 종합 결과와 같고 확률만 각 이미지의 값
+    per_image: List[PredictionResult]
+
+
+def run_batch_aggregated(crop: str, input_data: torch.Tensor) -> MultiPredictionResult:
+    # 같은 식물의 여러 사진을 한 번의 forward로 처리하고 확률을 평균내서 종합 판정
+    model, _ = model_registry.get(crop)
+    class_list_name = select_class_list(crop)
+    probs, healthy_probs = forward_probs_with_aux(model, input_data)
+
+    aggregated = top2_from_probs(
+        probs.mean(dim=0, keepdim=True), class_list_name,
+        healthy_probs.mean(dim=0, keepdim=True) if healthy_probs is not None else None
+    )[0]
+    index1 = class_list_name.index(aggregated.disease_name1)
+    index2 = class_list_name.index(aggregated.disease_name2)
+    healthy_list = healthy_probs.tolist() if healthy_probs is not None else [None] * len(probs)
+    per_image = [
+        PredictionResult(
+            prob1=row[index1],
+            prob2=row[index2],
+            disease_name1=aggregated.disease_name1,
+            disease_name2=aggregated.disease_name2,
+            healthy_prob=healthy_prob
+        )
+        for row, healthy_prob in zip(probs.tolist(), healthy_list)
+    ]
+    return MultiPredictionResult(aggregated=aggregated, per_image=per_image)
+
+
+def preprocess_image_bytes_list(image_bytes_list: List[bytes], input_size) -> torch.Tensor:
+    # 여러 장을 미리 할당한 하나의 [N, 3, H, W] 버퍼에 바로 전처리
+    width, height = input_size
+    out = np.empty((len(image_bytes_list), 3, height, width), dtype=np.float32)
+    for i, image_bytes in enumerate(image_bytes_list):
+        preprocess_image_bytes(image_bytes, input_size, out=out[i:i + 1])
+    return torch.from_numpy(out)
+
+
+# 동시에 들어온 같은 작물 요청을 모아서 한 번에 추론
+inference_batcher = InferenceBatcher(
+    run_batch=run_batch,
+    max_batch_size=config.INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=config.INFERENCE_MAX_WAIT_MS,
+    executor=inference_executor
+)
+
+
+def get_cascade(crop: str) -> Optional[CascadeSpec]:
+    # cascade 를 사용할 작물이면 작은 모델 설정 반환
+    if not config.CASCADE_ENABLED:
+        return None
+    cascade = crop_registry.get(crop).cascade
+    # onnx 세션은 입력 해상도가 고정이라 같은 모델을 줄인 해상도로 실행할 수 없음
+    if cascade is not None and cascade.checkpoint is None and config.INFERENCE_BACKEND == 'onnx':
+        return None
+    return cascade
+
+
+def get_fast_model(crop: str):
+    if crop_registry.get(crop).cascade.checkpoint is None:
+        return model_registry.get(crop)[0]
+    return fast_model_registry.get(crop)[0]
+
+
+def run_fast_batch(crop: str, input_data: torch.Tensor) -> List[PredictionResult]:
+    return predict_batch_with_model(get_fast_model(crop), crop, input_data)
+
+
+def preprocess_image_bytes_cascade(image_bytes: bytes, fast_input_size, input_size, with_dhash: bool):
+    # 작은 모델 입력과 작물 모델 입력을 디코딩 한 번으로 같이 생성
+    decode_size = (max(fast_input_size[0], input_size[0]), max(fast_input_size[1], input_size[1]))
+    image = decode_image(image_bytes, decode_size)
+    dhash = get_dhash(image) if with_dhash else None
+    fast_input = np.empty((1, 3, fast_input_size[1], fast_input_size[0]), dtype=np.float32)
+    transform(image, fast_input_size, out=fast_input[0])
+    input_data = np.empty((1, 3, input_size[1], input_size[0]), dtype=np.float32)
+    transform(image, input_size, out=input_data[0])
+    return torch.from_numpy(fast_input), torch.from_numpy(input_data), dhash
+
+
+# cascade 작은 모델도 같은 작물 요청끼리 모아서 추론
+fast_inference_batcher = InferenceBatcher(
+    run_batch=run_fast_batch,
+    max_batch_size=config.INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=config.INFERENCE_MAX_WAIT_MS,
+    executor=inference_executor
+)
+
+cascade_monitor = CascadeMonitor()
+
+
+# 재업로드된 사진의 진단 결과 캐시
+diagnosis_result_cache = DiagnosisResultCache(
+    max_size=config.RESULT_CACHE_SIZE,
+    ttl_seconds=config.RESULT_CACHE_TTL_SECONDS,
+    phash_max_distance=config.RESULT_CACHE_PHASH_MAX_DISTANCE
+)
+
+
+# 새 버전 후보 모델의 shadow 평가 (/admin 에서 시작)
+shadow_evaluator = ShadowEvaluator()
+# shadow 추론 전용 스레드풀 (진단 요청용 inference_executor 의 자리와 대기열을 쓰지 않음)
+shadow_executor = InferenceExecutor(
+    max_workers=config.SHADOW_WORKERS,
+    max_pending=config.SHADOW_MAX_PENDING,
+    torch_num_threads=inference_executor.torch_num_threads
+)
+# 실행중인 shadow 작업 참조 (완료 전에 GC 되지 않도록)
+_shadow_tasks = set()
+
+
+async def run_shadow(crop: str, entry, input_data: torch.Tensor, serving_result: PredictionResult) -> None:
+    # 후보 모델로 같은 입력을 추론해서 일치 여부만 기록 (응답에는 영향 없음)
+    # 추론 실패는 error_count 로만 집계
+    try:
+        shadow_result = (await shadow_executor.run(predict_batch_with_model, entry[0], crop, input_data))[0]
+    except Exception as ex:
+        print(f'shadow 추론 실패: {crop}', ex)
+        shadow_evaluator.record_error(crop)
+        return
+    shadow_evaluator.record(crop, entry, serving_result, shadow_result)
+
+
+def schedule_shadow(crop: str, input_data: torch.Tensor, serving_result: PredictionResult) -> None:
+    # shadow 스레드풀이 밀려 있으면 표본을 뽑지 않음 (대기열이 쌓이거나 거절되어 error 로 집계되지 않도록)
+    if shadow_executor.is_saturated:
+        return
+    entry = shadow_evaluator.sample(crop)
+    if entry is None:
+        return
+    task = asyncio.create_task(run_shadow(crop, entry, input_data, serving_result))
+    _shadow_tasks.add(task)
+    task.add_done_callback(_shadow_tasks.discard)
+
+
+def predict_by_img_url(path, crop) -> PredictionResult:
+    # 모델 로드 및 예측 수행
+    input_size = select_input_size(crop)
 
-    prob_and_disease = [(prob, disease) for prob, disease in zip(probs[0], select_class_list(crop))]
-    prob_and_disease.sort(key=lambda x: x[0], reverse=True)
+    input_data = preprocess_image_new(path, input_size)
 
-    return prob_and_disease[0][0].item(), prob_and_disease[1][0].item(), prob_and_disease[0][1], prob_and_disease[1][1]
+    return run_batch(crop, input_data)[0]
 
 
-async def predict(img: UploadFile, crop: str):
+async def predict(img: UploadFile, crop: str) -> PredictionResult:
     # 모델 로드 및 예측 수행
-    # preprocess_image_new와 cfg.podo_class_list_name는 적절히 정의되어 있어야 함
-    model, num = load_model(crop)
-    model.eval()
+    image_bytes = await img.read()
+    return await predict_bytes(image_bytes, crop)
+
+
+async def predict_bytes(image_bytes: bytes, crop: str) -> PredictionResult:
+    # 이미 읽어둔 이미지 바이트로 예측 (업로드 등 다른 단계와 같은 바이트를 공유)
+    # 배치가 켜져 있으면 같은 작물의 동시 요청과 묶여서 한 번에 추론됨
+    # 모델은 run_batch 에서 레지스트리로 가져옴 (첫 사용이면 이벤트 루프 밖에서 로드됨)
+    input_size = select_input_size(crop)
+
+    # 같은 사진을 다시 올린 경우 캐시된 결과를 바로 반환
+    # 서비스중인 모델 버전도 키에 포함 (추론 도중 모델이 교체되면 이 결과는 이전 버전 키로 저장됨)
+    content_hash = None
+    model_version = model_registry.get_version(crop)
+    if config.RESULT_CACHE_ENABLED:
+        content_hash = get_content_hash(image_bytes)
+        cached = diagnosis_result_cache.get(crop, model_version, content_hash)
+        if cached is not None:
+            return cached
+
+    with_dhash = config.RESULT_CACHE_ENABLED and diagnosis_result_cache.phash_enabled
+    cascade = get_cascade(crop)
+    if cascade is None:
+        input_data, dhash = await inference_executor.run(preprocess_image_bytes_with_dhash, image_bytes, input_size,
+                                                         with_dhash)
+    else:
+        fast_input, input_data, dhash = await inference_executor.run(
+            preprocess_image_bytes_cascade, image_bytes, cascade.input_size, input_size, with_dhash
+        )
+    if with_dhash:
+        cached = diagnosis_result_cache.get_similar(crop, model_version, dhash)
+        if cached is not None:
+            return cached
+
+    if cascade is None:
+        result = await run_inference(crop, input_data)
+        # shadow 평가중인 작물이면 일부 요청을 후보 모델로도 추론 (응답을 기다리게 하지 않음)
+        schedule_shadow(crop, input_data, result)
+    else:
+        result = await run_cascade(crop, cascade, fast_input, input_data)
 
-    input_data, input_copy = await preprocess_image_file_new(img, num)
+    if config.RESULT_CACHE_ENABLED:
+        diagnosis_result_cache.put(crop, model_version, content_hash, dhash, result)
+    return result
 
-    with torch.no_grad():
-        output, _ = model(input_data)
-        probs = F.softmax(output, dim=1)
 
-    prob_and_disease = [(prob, disease) for prob, disease in zip(probs[0], select_class_list(crop))]
-    prob_and_disease.sort(key=lambda x: x[0], reverse=True)
+async def run_inference(crop: str, input_data: torch.Tensor) -> PredictionResult:
+    # 작물 모델로 추론, 배치가 켜져 있으면 같은 작물의 동시 요청과 묶여서 한 번에 실행
+    if config.INFERENCE_BATCHING_ENABLED:
+        return await inference_batcher.submit(crop, input_data)
+    return (await inference_executor.run(run_batch, crop, input_data))[0]
+
 
-    return prob_and_disease[0][0].item(), prob_and_disease[1][0].item(), prob_and_disease[0][1], prob_and_disease[1][1]
+async def run_cascade(crop: str, cascade: CascadeSpec, fast_input: torch.Tensor,
+                      input_data: torch.Tensor) -> PredictionResult:
+    # 작은 모델의 top-1 확률이 threshold 이상이면 그 결과를 사용, 아니면 작물 모델까지 실행
+    threshold = cascade.threshold or config.CASCADE_CONFIDENCE_THRESHOLD
+    start = time.perf_counter()
+    if config.INFERENCE_BATCHING_ENABLED:
+        fast_result = await fast_inference_batcher.submit(crop, fast_input)
+    else:
+        fast_result = (await inference_executor.run(run_fast_batch, crop, fast_input))[0]
+    fast_seconds = time.perf_counter() - start
+    if fast_result.prob1 >= threshold:
+        cascade_monitor.record(crop, fast_seconds)
+        fast_result.from_cascade = True
+        # shadow 평가는 작물 모델 입력으로 (확신하는 입력도 표본에 포함되도록 escalation 여부와 관계없이 실행)
+        schedule_shadow(crop, input_data, fast_result)
+        return fast_result
+
+    start = time.perf_counter()
+    result = await run_inference(crop, input_data)
+    cascade_monitor.record(crop, fast_seconds, time.perf_counter() - start)
+    schedule_shadow(crop, input_data, result)
+    return result
+
+
+async def embed_bytes(image_bytes: bytes, crop: str) -> PredictionResult:
+    # 유사 사례 검색용, 결과 캐시/cascade 를 거치지 않고 작물 모델로 바로 추론해서 임베딩까지 반환
+    input_data = await inference_executor.run(preprocess_image_bytes, image_bytes, select_input_size(crop))
+    return (await inference_executor.run(run_batch_with_embedding, crop, input_data))[0]
+
+
+async def predict_many(image_bytes_list: List[bytes], crop: str) -> MultiPredictionResult:
+    # 한 식물의 여러 사진을 배치 한 번으로 진단
+    input_size = select_input_size(crop)
+    input_data = await inference_executor.run(preprocess_image_bytes_list, image_bytes_list, input_size)
+    return await inference_executor.run(run_batch_aggregated, crop, input_data)
 
 # @app.post("/predict")
 # async def predict_disease(item: Item):
@@ -0,0 +1,144 @@
+# 진단 가능한 작물과 작물별 모델 정보(체크포인트, 구조, 입력 크기, 클래스)를 담은 매니페스트
+# 작물이나 모델 버전을 추가할 때는 코드 대신 model/crops.json 만 수정
+import json
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, model_validator
+
+
+class CascadeSpec(BaseModel):
+    # 먼저 실행할 가벼운 모델 (config.CASCADE_ENABLED 일 때만 사용)
+    # checkpoint 가 없으면 작물 모델을 그대로 줄인 해상도(input_size)로 실행 (resnet50 만 가능)
+    # checkpoint 가 있으면 별도의 작은 모델(증류 모델 등)을 arch 구조로 로드, 클래스 목록은 작물 모델과 같아야 함
+    input_size: Tuple[int, int]
+    arch: Optional[str] = None
+    backbone: Optional[str] = None
+    checkpoint: Optional[str] = None
+    # top-1 확률이 이 값 이상이면 작은 모델 결과를 그대로 사용 (없으면 config.CASCADE_CONFIDENCE_THRESHOLD)
+    threshold: Optional[float] = None
+
+    @model_validator(mode='after')
+    def check_model(self) -> "CascadeSpec":
+        if (self.arch is None) != (self.checkpoint is None):
+            raise ValueError('cascade 의 arch 와 checkpoint 는 함께 지정해야 합니다.')
+        if min(self.input_size) <= 0:
+            raise ValueError(f'cascade 의 입력 크기가 잘못되었습니다: {self.input_size}')
+        if self.threshold is not None and not 0 < self.threshold <= 1:
+            raise ValueError(f'cascade threshold 는 0 초과 1 이하여야 합니다: {self.threshold}')
+        return self
+
+
+class CropSpec(BaseModel):
+    name: str
+    # 체크포인트 버전 (모델 교체 이력 구분용)
+    version: str
+    # classification0430.model_builders 에 등록된 모델 구조 이름
+    arch: str
+    # timm 모델 이름 등 구조별 추가 설정 (vit_mae 에서 사용)
+    backbone: Optional[str] = None
+    checkpoint: str
+    # (width, height)
+    input_size: Tuple[int, int]
+    class_codes: List[str]
+    class_names: List[str]
+    cascade: Optional[CascadeSpec] = None
+
+    @model_validator(mode='after')
+    def check_classes(self) -> "CropSpec":
+        if len(self.class_codes) != len(self.class_names):
+            raise ValueError(f'[{self.name}] class_codes({len(self.class_codes)})와 '
+                             f'class_names({len(self.class_names)})의 개수가 다릅니다.')
+        if len(self.class_names) < 2:
+            raise ValueError(f'[{self.name}] 클래스는 2개 이상이어야 합니다.')
+        if len(set(self.class_codes)) != len(self.class_codes) or len(set(self.class_names)) != len(self.class_names):
+            raise ValueError(f'[{self.name}] 중복된 클래스가 있습니다.')
+        if min(self.input_size) <= 0:
+            raise ValueError(f'[{self.name}] 잘못된 입력 크기입니다: {self.input_size}')
+        # ViT 는 위치 임베딩 크기가 고정이라 같은 모델을 다른 해상도로 실행할 수 없음
+        if self.cascade is not None and self.cascade.checkpoint is None and self.arch != 'resnet50':
+            raise ValueError(f'[{self.name}] {self.arch} 모델은 해상도만 줄인 cascade 를 사용할 수 없습니다. '
+                             f'cascade 에 별도 체크포인트를 지정해주세요.')
+        return self
+
+    def get_cascade_spec(self) -> Optional["CropSpec"]:
+        # 별도 체크포인트를 쓰는 cascade 모델을 작물 모델과 같은 방식으로 생성/검증하기 위한 CropSpec
+        if self.cascade is None or self.cascade.checkpoint is None:
+            return None
+        return self.model_copy(update={
+            'name': f'{self.name}(cascade)',
+            'arch': self.cascade.arch,
+            'backbone': self.cascade.backbone,
+            'checkpoint': self.cascade.checkpoint,
+            'input_size': self.cascade.input_size,
+            'cascade': None
+        })
+
+    @property
+    def num_classes(self) -> int:
+        return len(self.class_names)
+
+
+class CropManifest(BaseModel):
+    crops: List[CropSpec]
+
+
+class CropRegistry:
+    def __init__(self, specs: List[CropSpec]):
+        # 매니페스트 순서를 유지 (crop_list 순서)
+        self._specs: Dict[str, CropSpec] = {}
+        for spec in specs:
+            if spec.name in self._specs:
+                raise ValueError(f'매니페스트에 중복된 작물이 있습니다: {spec.name}')
+            self._specs[spec.name] = spec
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._specs.keys())
+
+    def get(self, crop_name: str) -> CropSpec:
+        spec = self._specs.get(crop_name)
+        if spec is None:
+            raise KeyError(f'등록되지 않은 작물입니다: {crop_name}')
+        return spec
+
+    def __contains__(self, crop_name: str) -> bool:
+        return crop_name in self._specs
+
+    def __iter__(self) -> Iterator[CropSpec]:
+        return iter(self._specs.values())
+
+    def check_architectures(self, architectures: Iterable[str]) -> None:
+        architectures = set(architectures)
+        specs = list(self) + [spec.get_cascade_spec() for spec in self if spec.get_cascade_spec()]
+        unknown = [f'{spec.name}: {spec.arch}' for spec in specs if spec.arch not in architectures]
+        if unknown:
+            raise ValueError(f'지원하지 않는 모델 구조입니다: {unknown} (가능한 구조: {sorted(architectures)})')
+
+
+def load_crop_registry(path: str) -> CropRegistry:
+    # 매니페스트 형식이 잘못되었으면 여기서 예외가 발생해 서버가 시작되지 않음
+    with open(path, encoding='utf-8') as f:
+        manifest = CropManifest.model_validate(json.load(f))
+    return CropRegistry(manifest.crops)
+
+
+class CheckpointMismatchError(ValueError):
+    # 체크포인트와 매니페스트가 맞지 않음 (다시 로드해도 같은 결과이므로 서버 시작을 중단해야 함)
+    pass
+
+
+def find_inconsistencies(specs: Iterable[CropSpec],
+                         checkpoint_shapes: Dict[str, Optional[Dict[str, List[int]]]],
+                         classifier_weight_keys: Dict[str, str]) -> List[str]:
+    # checkpoint_shapes: 작물 -> {파라미터 이름: shape} (파일이 없으면 None, shape 를 읽을 수 없으면 {})
+    problems = []
+    for spec in specs:
+        shapes = checkpoint_shapes.get(spec.name)
+        if shapes is None:
+            problems.append(f'[{spec.name}] 체크포인트 파일이 없습니다: {spec.checkpoint}')
+            continue
+        key = classifier_weight_keys[spec.arch]
+        if key in shapes and shapes[key][0] != spec.num_classes:
+            problems.append(f'[{spec.name}] 체크포인트의 클래스 수({shapes[key][0]})와 '
+                            f'매니페스트의 클래스 수({spec.num_classes})가 다릅니다.')
+    return problems
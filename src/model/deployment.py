@@ -0,0 +1,147 @@
+# 서버 재시작 없이 작물 모델 버전 교체
+# 새 체크포인트를 백그라운드 스레드에서 로드 -> 더미 입력으로 warm-up -> 레지스트리에서 한 번에 교체
+# shadow 모드는 교체 대신 후보 모델을 실제 요청 일부에 같이 돌려서 일치율만 기록
+#
+# 교체는 요청을 받은 워커 프로세스에만 적용됨 (워커가 여러 개면 워커마다 호출하거나 매니페스트 수정 후 재시작)
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import torch
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+import config
+from model.classification0430 import crop_registry, model_registry, shadow_evaluator, diagnosis_result_cache
+from model.registry import ModelStats
+
+DEPLOYMENT_MODES = ['swap', 'shadow']
+
+
+class DeploymentJob(BaseModel):
+    crop: str
+    version: str
+    checkpoint: str
+    # swap: 로드 후 바로 교체, shadow: 로드 후 shadow 평가 시작
+    mode: str
+    sample_rate: Optional[float] = None
+    # loading -> warming_up -> done / failed
+    status: str
+    error: Optional[str] = None
+    previous_version: Optional[str] = None
+    load_seconds: Optional[float] = None
+    warmup_seconds: Optional[float] = None
+    started_time: datetime
+    finished_time: Optional[datetime] = None
+
+
+# 작물별 마지막 작업
+_jobs: Dict[str, DeploymentJob] = {}
+# shadow 평가중인 후보 모델의 로드 정보 (promote 할 때 레지스트리에 같이 반영)
+_candidate_stats: Dict[str, ModelStats] = {}
+# 실행중인 작업 참조 (완료 전에 GC 되지 않도록)
+_tasks = set()
+
+
+def resolve_checkpoint_path(checkpoint: str) -> str:
+    # 체크포인트는 torch.load(pickle)로 읽으므로 모델 폴더 밖의 파일은 허용하지 않음
+    model_dir = os.path.realpath(config.MODEL_CHECKPOINT_DIR)
+    path = os.path.realpath(os.path.join(model_dir, checkpoint))
+    if os.path.commonpath([model_dir, path]) != model_dir:
+        raise HTTPException(status_code=400, detail=f"체크포인트는 {config.MODEL_CHECKPOINT_DIR} 안에 있어야 합니다.")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"체크포인트 파일이 없습니다: {checkpoint}")
+    return path
+
+
+def warm_up(model, input_size, iterations: int) -> None:
+    # 첫 요청이 느려지지 않도록 실제 배치 크기들로 미리 forward (메모리 할당, 커널 선택 등)
+    width, height = input_size
+    with torch.no_grad():
+        for batch_size in sorted({1, config.INFERENCE_MAX_BATCH_SIZE}):
+            dummy_input = torch.zeros(batch_size, 3, height, width)
+            for _ in range(iterations):
+                model(dummy_input)
+
+
+def _load_and_warm_up(job: DeploymentJob):
+    start = time.perf_counter()
+    entry, stats = model_registry.load_version(job.crop, job.checkpoint, job.version)
+    job.load_seconds = time.perf_counter() - start
+
+    job.status = 'warming_up'
+    start = time.perf_counter()
+    warm_up(entry[0], entry[1], config.MODEL_WARMUP_ITERATIONS)
+    job.warmup_seconds = time.perf_counter() - start
+    return entry, stats
+
+
+async def _run(job: DeploymentJob) -> None:
+    try:
+        # 로드/warm-up 은 추론 스레드풀이 아닌 별도 스레드에서 실행 (서비스중인 요청 처리에 영향 최소화)
+        entry, stats = await asyncio.to_thread(_load_and_warm_up, job)
+        if job.mode == 'swap':
+            job.previous_version = model_registry.swap(job.crop, entry, stats)
+            # 이전 모델로 만든 진단 결과는 더 이상 유효하지 않음
+            diagnosis_result_cache.clear(job.crop)
+        else:
+            job.previous_version = model_registry.get_version(job.crop)
+            _candidate_stats[job.crop] = stats
+            shadow_evaluator.start(job.crop, entry, job.version, job.sample_rate)
+        job.status = 'done'
+    except Exception as ex:
+        print(f'모델 교체 실패: {job.crop} {job.version}', ex)
+        job.status = 'failed'
+        job.error = f'{type(ex).__name__}: {ex}'
+    finally:
+        job.finished_time = datetime.now()
+
+
+def start_job(crop: str, checkpoint: str, version: str, mode: str, sample_rate: Optional[float] = None) -> DeploymentJob:
+    if crop not in crop_registry:
+        raise HTTPException(status_code=404, detail=f"등록되지 않은 작물입니다: {crop}")
+    if mode not in DEPLOYMENT_MODES:
+        raise HTTPException(status_code=400, detail=f"지원하지 않는 모드입니다: {mode}")
+    if mode == 'shadow' and not (sample_rate and 0 < sample_rate <= 1):
+        raise HTTPException(status_code=400, detail="shadow 모드의 sample_rate 는 0 초과 1 이하여야 합니다.")
+    previous = _jobs.get(crop)
+    if previous and previous.status in ('loading', 'warming_up'):
+        raise HTTPException(status_code=409, detail=f"{crop} 모델을 이미 교체하는 중입니다. ({previous.version})")
+
+    job = DeploymentJob(
+        crop=crop,
+        version=version,
+        checkpoint=resolve_checkpoint_path(checkpoint),
+        mode=mode,
+        sample_rate=sample_rate,
+        status='loading',
+        started_time=datetime.now()
+    )
+    _jobs[crop] = job
+    task = asyncio.create_task(_run(job))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job
+
+
+def get_job(crop: str) -> Optional[DeploymentJob]:
+    return _jobs.get(crop)
+
+
+def stop_shadow(crop: str) -> None:
+    _candidate_stats.pop(crop, None)
+    if shadow_evaluator.stop(crop) is None:
+        raise HTTPException(status_code=404, detail=f"{crop} 작물은 shadow 평가중이 아닙니다.")
+
+
+def promote_shadow(crop: str) -> Optional[str]:
+    # shadow 평가중인 후보 모델을 다시 로드하지 않고 그대로 서비스 모델로 교체
+    entry = shadow_evaluator.stop(crop)
+    stats = _candidate_stats.pop(crop, None)
+    if entry is None or stats is None:
+        raise HTTPException(status_code=404, detail=f"{crop} 작물은 shadow 평가중이 아닙니다.")
+    previous = model_registry.swap(crop, entry, stats)
+    diagnosis_result_cache.clear(crop)
+    return previous
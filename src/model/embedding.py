@@ -0,0 +1,68 @@
+# 분류 forward 중에 나오는 중간 출력을 이미지 임베딩으로 같이 가져오기 (forward 를 한 번 더 하지 않음)
+# ResNet50: mid3 출력(ReLU 적용, 256차원), ViT: 분류 head 입력(pre-logits)
+# 모델마다 hook 을 한 번만 등록하고, capture() 로 켠 스레드의 forward 에서만 값을 기록
+# (추론 스레드풀의 여러 스레드가 같은 모델을 동시에 사용해도 서로의 임베딩이 섞이지 않음)
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+import torch
+from torch import nn
+from torch.nn import functional as F
+
+
+class _Captured:
+    def __init__(self):
+        # [N, dim] float32 텐서, 임베딩을 지원하지 않는 모델(onnx 등)이면 None
+        self.value: Optional[torch.Tensor] = None
+
+
+def find_embedding_layer(model) -> Optional[tuple]:
+    # (hook 을 걸 모듈, 'mid3' 또는 'head') 반환, 정밀도 래퍼(Bf16Model) 등으로 감싸진 경우 안쪽 모델에서 찾음
+    while isinstance(model, nn.Module):
+        if isinstance(getattr(model, 'mid3', None), nn.Module):
+            return model.mid3, 'mid3'
+        if isinstance(getattr(model, 'head', None), nn.Module):
+            return model.head, 'head'
+        model = getattr(model, 'model', None)
+    return None
+
+
+class EmbeddingCapture:
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _record(self, value: torch.Tensor) -> None:
+        captured = getattr(self._local, 'captured', None)
+        if captured is not None:
+            captured.value = value.detach().float()
+
+    def attach(self, model) -> bool:
+        # 모델에 hook 등록 (이미 등록된 모델은 건너뜀), 임베딩을 뽑을 수 없는 모델이면 False
+        layer = find_embedding_layer(model)
+        if layer is None:
+            return False
+        module, kind = layer
+        with self._lock:
+            if getattr(module, '_embedding_capture_attached', False):
+                return True
+            if kind == 'mid3':
+                module.register_forward_hook(lambda _, __, output: self._record(F.relu(output)))
+            else:
+                module.register_forward_pre_hook(lambda _, args: self._record(args[0]))
+            module._embedding_capture_attached = True
+        return True
+
+    @contextmanager
+    def capture(self, model):
+        # with 블록 안에서 현재 스레드가 실행한 forward 의 임베딩을 captured.value 로 받음
+        captured = _Captured()
+        if not self.attach(model):
+            yield captured
+            return
+        self._local.captured = captured
+        try:
+            yield captured
+        finally:
+            self._local.captured = None
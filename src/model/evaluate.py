@@ -0,0 +1,263 @@
+# 라벨된 로컬 이미지 폴더로 작물 모델의 정확도와 처리량 평가
+# 폴더 구조: <data>/<작물>/<클래스 코드>/이미지  (클래스 코드는 crops.json 의 class_codes, 예: 토마토/a5/001.jpg)
+# 서버와 같은 레지스트리 모델(INFERENCE_BACKEND, INFERENCE_PRECISION 설정 포함)과 같은 전처리를 사용하므로
+# 이미지별 결과는 predict_by_img_url 과 같고, 여러 장을 배치로 묶어서 계산함
+# 양자화/전처리 변경 전후 결과를 --baseline 으로 비교해서 정확도가 떨어지지 않았는지 확인
+#
+# 실행:  python -m model.evaluate --data ./eval_images --output eval.json
+# 비교:  python -m model.evaluate --data ./eval_images --baseline eval_prev.json --max-accuracy-drop 0.01
+import argparse
+import json
+import os
+import platform
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import torch
+from pydantic import BaseModel
+
+import config
+from model.classification0430 import crop_list, crop_registry, model_registry, select_input_size, \
+    preprocess_image_bytes, predict_batch_with_model, list_image_files
+
+
+class ClassMetrics(BaseModel):
+    code: str
+    name: str
+    # 해당 클래스로 라벨된 이미지 수
+    support: int
+    # 해당 클래스로 예측한 이미지가 없으면 None
+    precision: Optional[float]
+    # 해당 클래스 이미지가 없으면 None
+    recall: Optional[float]
+
+
+class CropEvaluation(BaseModel):
+    crop: str
+    model_version: Optional[str]
+    backend: str
+    image_count: int
+    # 읽기/디코딩에 실패해서 평가에서 제외한 이미지 수
+    failed_count: int
+    accuracy: float
+    top2_accuracy: float
+    classes: List[ClassMetrics]
+    # [라벨 클래스][예측 클래스] 이미지 수, 순서는 classes 와 같음
+    confusion_matrix: List[List[int]]
+    # 읽기 + 전처리 + forward 를 포함한 전체 처리량 (모델 로드 제외)
+    images_per_sec: float
+    # forward 만의 처리량
+    forward_images_per_sec: float
+
+
+def list_labeled_images(crop_dir: str, class_codes: List[str]) -> Tuple[List[Tuple[str, int]], List[str]]:
+    # (이미지 경로, 클래스 index) 목록과 class_codes 에 없는 폴더 이름 목록
+    items = []
+    unknown_dirs = []
+    for dir_name in sorted(os.listdir(crop_dir)):
+        class_dir = os.path.join(crop_dir, dir_name)
+        if not os.path.isdir(class_dir):
+            continue
+        if dir_name not in class_codes:
+            unknown_dirs.append(dir_name)
+            continue
+        label = class_codes.index(dir_name)
+        items.extend((path, label) for path in list_image_files(class_dir))
+    return items, unknown_dirs
+
+
+def load_batch(items: List[Tuple[str, int]], input_size) -> Tuple[Optional[torch.Tensor], List[int], List[str]]:
+    # 배치 하나를 미리 할당한 버퍼에 전처리, (입력, 라벨, 실패한 경로) 반환
+    width, height = input_size
+    buffer = np.empty((len(items), 3, height, width), dtype=np.float32)
+    loaded = []
+    failed_paths = []
+    for path, label in items:
+        try:
+            with open(path, 'rb') as f:
+                preprocess_image_bytes(f.read(), input_size, out=buffer[len(loaded):len(loaded) + 1])
+        except Exception as ex:
+            print(f'이미지 읽기 실패: {path}', ex)
+            failed_paths.append(path)
+            continue
+        loaded.append(label)
+    if not loaded:
+        return None, [], failed_paths
+    return torch.from_numpy(buffer[:len(loaded)]), loaded, failed_paths
+
+
+def iter_batches(items: List[Tuple[str, int]], input_size, batch_size: int, workers: int
+                 ) -> Iterator[Tuple[Optional[torch.Tensor], List[int], List[str]]]:
+    # 배치 단위로 스레드풀에서 읽기/전처리, 메인 스레드가 forward 하는 동안 최대 workers * 2 개 배치를 미리 준비
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for start in range(0, len(items), batch_size):
+            pending.append(pool.submit(load_batch, items[start:start + batch_size], input_size))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _safe_divide(numerator: int, denominator: int) -> Optional[float]:
+    return numerator / denominator if denominator else None
+
+
+def evaluate_crop(crop: str, crop_dir: str, batch_size: int, workers: int) -> Optional[CropEvaluation]:
+    spec = crop_registry.get(crop)
+    items, unknown_dirs = list_labeled_images(crop_dir, spec.class_codes)
+    if unknown_dirs:
+        print(f'[{crop}] class_codes 에 없는 폴더는 제외합니다: {", ".join(unknown_dirs)}')
+    if not items:
+        print(f'[{crop}] 평가할 이미지가 없습니다: {crop_dir}')
+        return None
+
+    # 모델 로드 시간은 처리량에서 제외
+    model, _ = model_registry.get(crop)
+    input_size = select_input_size(crop)
+    num_classes = spec.num_classes
+    confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+    top2_correct = 0
+    failed_count = 0
+    forward_seconds = 0.0
+
+    start = time.perf_counter()
+    for input_data, labels, failed_paths in iter_batches(items, input_size, batch_size, workers):
+        failed_count += len(failed_paths)
+        if input_data is None:
+            continue
+        forward_start = time.perf_counter()
+        results = predict_batch_with_model(model, crop, input_data)
+        forward_seconds += time.perf_counter() - forward_start
+        for label, result in zip(labels, results):
+            predicted = spec.class_names.index(result.disease_name1)
+            confusion[label, predicted] += 1
+            if spec.class_names[label] in (result.disease_name1, result.disease_name2):
+                top2_correct += 1
+    elapsed = time.perf_counter() - start
+
+    image_count = int(confusion.sum())
+    classes = [
+        ClassMetrics(
+            code=code,
+            name=name,
+            support=int(confusion[index].sum()),
+            precision=_safe_divide(int(confusion[index, index]), int(confusion[:, index].sum())),
+            recall=_safe_divide(int(confusion[index, index]), int(confusion[index].sum()))
+        )
+        for index, (code, name) in enumerate(zip(spec.class_codes, spec.class_names))
+    ]
+    return CropEvaluation(
+        crop=crop,
+        model_version=model_registry.get_version(crop),
+        backend=config.INFERENCE_BACKEND,
+        image_count=image_count,
+        failed_count=failed_count,
+        accuracy=_safe_divide(int(np.trace(confusion)), image_count) or 0.0,
+        top2_accuracy=_safe_divide(top2_correct, image_count) or 0.0,
+        classes=classes,
+        confusion_matrix=confusion.tolist(),
+        images_per_sec=image_count / elapsed if elapsed else 0.0,
+        forward_images_per_sec=image_count / forward_seconds if forward_seconds else 0.0
+    )
+
+
+def print_evaluation(evaluation: CropEvaluation) -> None:
+    print(f'[{evaluation.crop}] {evaluation.model_version} ({evaluation.backend}) '
+          f'{evaluation.image_count}장 accuracy={evaluation.accuracy:.4f} top2={evaluation.top2_accuracy:.4f} '
+          f'{evaluation.images_per_sec:.1f} img/s (forward {evaluation.forward_images_per_sec:.1f} img/s)')
+
+    def format_metric(value: Optional[float]) -> str:
+        return f'{value:9.4f}' if value is not None else f'{"-":>9}'
+
+    print(f'  {"code":<6}{"support":>8}{"precision":>10}{"recall":>10}  name')
+    for metrics in evaluation.classes:
+        print(f'  {metrics.code:<6}{metrics.support:>8} {format_metric(metrics.precision)} '
+              f'{format_metric(metrics.recall)}  {metrics.name}')
+
+    codes = [metrics.code for metrics in evaluation.classes]
+    print('  confusion matrix (행: 라벨, 열: 예측)')
+    print('  ' + ' ' * 6 + ''.join(f'{code:>6}' for code in codes))
+    for code, row in zip(codes, evaluation.confusion_matrix):
+        print(f'  {code:<6}' + ''.join(f'{count:>6}' for count in row))
+
+
+def find_accuracy_drops(evaluations: List[CropEvaluation], baseline_path: str, max_drop: float) -> List[str]:
+    # 기준 결과 대비 accuracy 또는 클래스별 recall 이 max_drop 보다 많이 떨어진 항목
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {result['crop']: result for result in json.load(f)['results']}
+
+    drops = []
+    for evaluation in evaluations:
+        previous = baseline.get(evaluation.crop)
+        if previous is None:
+            continue
+        if previous['accuracy'] - evaluation.accuracy > max_drop:
+            drops.append(f'{evaluation.crop}: accuracy {previous["accuracy"]:.4f} -> {evaluation.accuracy:.4f}')
+        previous_recalls = {metrics['code']: metrics['recall'] for metrics in previous['classes']}
+        for metrics in evaluation.classes:
+            previous_recall = previous_recalls.get(metrics.code)
+            if previous_recall is None or metrics.recall is None:
+                continue
+            if previous_recall - metrics.recall > max_drop:
+                drops.append(f'{evaluation.crop}/{metrics.code}({metrics.name}): '
+                             f'recall {previous_recall:.4f} -> {metrics.recall:.4f}')
+    return drops
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='라벨된 이미지 폴더로 작물 모델 정확도/처리량 평가')
+    parser.add_argument('--data', required=True, help='<작물>/<클래스 코드>/이미지 구조의 폴더')
+    parser.add_argument('--crops', default=','.join(crop_list), help='콤마 구분 작물 목록')
+    parser.add_argument('--batch-size', type=int, default=config.INFERENCE_MAX_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='읽기/전처리 스레드 수')
+    parser.add_argument('--output', default='eval_output.json')
+    parser.add_argument('--baseline', help='비교할 이전 결과 json')
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.01, help='허용하는 accuracy/recall 감소폭')
+    args = parser.parse_args(argv)
+
+    crops = [crop.strip() for crop in args.crops.split(',') if crop.strip()]
+    evaluations: List[CropEvaluation] = []
+    for crop in crops:
+        if crop not in crop_registry:
+            raise SystemExit(f'등록되지 않은 작물입니다: {crop}')
+        crop_dir = os.path.join(args.data, crop)
+        if not os.path.isdir(crop_dir):
+            print(f'[{crop}] 평가 폴더가 없어 건너뜁니다: {crop_dir}')
+            continue
+        evaluation = evaluate_crop(crop, crop_dir, args.batch_size, args.workers)
+        if evaluation is not None:
+            print_evaluation(evaluation)
+            evaluations.append(evaluation)
+
+    report: Dict = {
+        'created_time': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'cpu_count': os.cpu_count(),
+            'machine': platform.machine()
+        },
+        'batch_size': args.batch_size,
+        'workers': args.workers,
+        'results': [evaluation.model_dump() for evaluation in evaluations]
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'결과 저장: {args.output}')
+
+    if args.baseline:
+        drops = find_accuracy_drops(evaluations, args.baseline, args.max_accuracy_drop)
+        if drops:
+            print('정확도 저하 발견:')
+            for drop in drops:
+                print(f'  {drop}')
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# CPU를 많이 쓰는 추론 작업(디코딩, 전처리, forward)을 이벤트 루프 밖에서 실행하는 실행기
+# async 핸들러 안에서 바로 실행하면 그동안 같은 워커의 다른 요청이 전부 멈추기 때문
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+import torch
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+
+class ExecutorStats(BaseModel):
+    max_workers: int
+    max_pending: int
+    torch_num_threads: int
+    # 실행중 + 대기중인 작업 수
+    pending: int
+    rejected_count: int
+
+
+class InferenceExecutor:
+    def __init__(self, max_workers: int, max_pending: int, torch_num_threads: int = 0):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        # 워커 스레드끼리 코어를 나눠 쓰도록 intra-op 스레드 수를 줄임 (과도한 oversubscription 방지)
+        if torch_num_threads <= 0:
+            torch_num_threads = max(1, (os.cpu_count() or 1) // max_workers)
+        self.torch_num_threads = torch_num_threads
+        self._pool: ThreadPoolExecutor | None = None
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._pending = 0
+        self._rejected_count = 0
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            torch.set_num_threads(self.torch_num_threads)
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='inference')
+        return self._pool
+
+    @property
+    def is_saturated(self) -> bool:
+        return self._pending >= self.max_pending
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        # fn(*args, **kwargs)를 스레드풀에서 실행하고 결과를 기다림
+        if self.is_saturated:
+            self._rejected_count += 1
+            raise HTTPException(status_code=503, detail="진단 요청이 많아 처리할 수 없습니다. 잠시 후 다시 시도해주세요.")
+
+        self._pending += 1
+        try:
+            async with self._semaphore:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._get_pool(), partial(fn, *args, **kwargs))
+        finally:
+            self._pending -= 1
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def stats(self) -> ExecutorStats:
+        return ExecutorStats(
+            max_workers=self.max_workers,
+            max_pending=self.max_pending,
+            torch_num_threads=self.torch_num_threads,
+            pending=self._pending,
+            rejected_count=self._rejected_count
+        )
@@ -0,0 +1,113 @@
+# 워커 프로세스 메모리 사용량 측정 유틸
+#
+# 마스터/워커별 RSS, PSS 확인:  python -m model.memory <마스터 pid>
+import os
+import resource
+import sys
+from typing import List, Optional
+
+import torch.nn as nn
+from pydantic import BaseModel
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class ProcessMemory(BaseModel):
+    pid: int
+    # 프로세스가 점유한 전체 물리 메모리 (공유 페이지 포함)
+    rss_bytes: int
+    # 공유 페이지를 공유하는 프로세스 수로 나눠서 계산한 비례 메모리
+    # 워커들의 PSS 합이 실제로 노드에서 사용하는 메모리에 가까움
+    pss_bytes: int | None
+    shared_bytes: int | None
+    private_bytes: int | None
+
+
+def get_rss_bytes() -> int:
+    # 현재 프로세스의 RSS(상주 메모리) 바이트 수
+    # /proc 이 없는 환경(mac 등)에서는 최대 RSS 값으로 대체
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_module_bytes(module: nn.Module) -> int:
+    # 모델의 파라미터 + 버퍼가 차지하는 바이트 수
+    total = 0
+    for tensor in list(module.parameters()) + list(module.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def get_process_memory(pid: Optional[int] = None) -> ProcessMemory:
+    # /proc/<pid>/smaps_rollup 기준 (리눅스 4.14 이상), 없으면 RSS만 채움
+    pid = pid or os.getpid()
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[1].isdigit():
+                    # 단위 kB
+                    values[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    except OSError:
+        pass
+
+    if 'Rss' not in values:
+        with open(f'/proc/{pid}/statm') as f:
+            rss = int(f.read().split()[1]) * _PAGE_SIZE
+        return ProcessMemory(pid=pid, rss_bytes=rss, pss_bytes=None, shared_bytes=None, private_bytes=None)
+
+    return ProcessMemory(
+        pid=pid,
+        rss_bytes=values['Rss'],
+        pss_bytes=values.get('Pss'),
+        shared_bytes=values.get('Shared_Clean', 0) + values.get('Shared_Dirty', 0),
+        private_bytes=values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+    )
+
+
+def get_child_pids(parent_pid: int) -> List[int]:
+    # /proc/*/stat 의 ppid 를 보고 자식 프로세스(gunicorn/uvicorn 워커) 목록을 찾음
+    child_pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # comm 필드에 공백이 있을 수 있으므로 마지막 ')' 이후를 파싱
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == parent_pid:
+            child_pids.append(int(entry))
+    return sorted(child_pids)
+
+
+def _format_mb(value: int | None) -> str:
+    return '-' if value is None else f'{value / 1024 / 1024:.1f}'
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    master_pid = int(argv[0]) if argv else os.getpid()
+
+    rows = [('master', get_process_memory(master_pid))]
+    rows += [('worker', get_process_memory(pid)) for pid in get_child_pids(master_pid)]
+
+    print(f'{"role":<8}{"pid":>8}{"RSS(MB)":>12}{"PSS(MB)":>12}{"shared(MB)":>12}{"private(MB)":>13}')
+    for role, memory in rows:
+        print(f'{role:<8}{memory.pid:>8}{_format_mb(memory.rss_bytes):>12}{_format_mb(memory.pss_bytes):>12}'
+              f'{_format_mb(memory.shared_bytes):>12}{_format_mb(memory.private_bytes):>13}')
+
+    worker_rows = [memory for role, memory in rows if role == 'worker']
+    if worker_rows and all(memory.pss_bytes is not None for memory in worker_rows):
+        total_rss = sum(memory.rss_bytes for memory in worker_rows)
+        total_pss = sum(memory.pss_bytes for memory in worker_rows)
+        print(f'workers total RSS {_format_mb(total_rss)} MB / PSS {_format_mb(total_pss)} MB')
+
+
+if __name__ == '__main__':
+    main()
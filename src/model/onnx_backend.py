@@ -0,0 +1,151 @@
+# 작물 분류 모델의 ONNX 변환 및 onnxruntime 추론 백엔드
+# config.INFERENCE_BACKEND = 'onnx' 이면 model_registry 가 torch 모델 대신 여기의 OnnxModel 을 사용함
+#
+# 변환:  python -m model.onnx_backend export [--crop 토마토]
+# 검증:  python -m model.onnx_backend verify [--crop 토마토] [--samples 8]
+import argparse
+import os
+from typing import List, Optional, Tuple
+
+import onnxruntime as ort
+import torch
+import torch.nn as nn
+
+import config
+from model.classification0430 import crop_list, crop_registry, load_model, select_class_list, select_input_size, \
+    inference_executor
+
+ONNX_OPSET_VERSION = 14
+
+
+class _ExportWrapper(nn.Module):
+    # ViT_MAE는 보조 출력 자리에 None을 반환하므로 export 할 때는 텐서 출력만 남김
+    def __init__(self, model: nn.Module):
+        super(_ExportWrapper, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        out1, out2 = self.model(x)
+        if out2 is None:
+            return out1
+        return out1, out2
+
+
+class OnnxModel:
+    # torch 모델과 같은 방식으로 호출할 수 있는 onnxruntime 세션 래퍼
+    # model(input) -> (logits, aux 또는 None)
+    def __init__(self, path: str, intra_op_num_threads: int = 0):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_num_threads > 0:
+            options.intra_op_num_threads = intra_op_num_threads
+        self.path = path
+        self.session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        # 상주 메모리 지표용 (onnx 파일 크기로 근사)
+        self.nbytes = os.path.getsize(path)
+
+    def eval(self) -> "OnnxModel":
+        return self
+
+    def __call__(self, x: torch.Tensor) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        outputs = self.session.run(None, {self.input_name: x.cpu().numpy()})
+        out1 = torch.from_numpy(outputs[0])
+        out2 = torch.from_numpy(outputs[1]) if len(outputs) > 1 else None
+        return out1, out2
+
+
+def get_onnx_path(crop_name: str, checkpoint_path: Optional[str] = None) -> str:
+    # ./model/2_best_max_acc_v2.pt -> {ONNX_MODEL_DIR}/2_best_max_acc_v2.onnx
+    checkpoint_path = checkpoint_path or crop_registry.get(crop_name).checkpoint
+    file_name = os.path.splitext(os.path.basename(checkpoint_path))[0] + '.onnx'
+    return os.path.join(config.ONNX_MODEL_DIR, file_name)
+
+
+def export_onnx(crop_name: str, output_path: Optional[str] = None) -> str:
+    # 체크포인트를 읽어서 배치 크기가 가변인 onnx 모델로 저장
+    model, input_size = load_model(crop_name)
+    return export_model_to_onnx(model, input_size, output_path or get_onnx_path(crop_name))
+
+
+def export_model_to_onnx(model: nn.Module, input_size: Tuple[int, int], output_path: str) -> str:
+    model.eval()
+    wrapper = _ExportWrapper(model).eval()
+
+    width, height = input_size
+    dummy_input = torch.randn(1, 3, height, width)
+    with torch.no_grad():
+        has_aux = model(dummy_input)[1] is not None
+    output_names = ['logits', 'aux'] if has_aux else ['logits']
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    torch.onnx.export(
+        wrapper,
+        dummy_input,
+        output_path,
+        input_names=['input'],
+        output_names=output_names,
+        dynamic_axes={name: {0: 'batch'} for name in ['input'] + output_names},
+        opset_version=ONNX_OPSET_VERSION,
+        do_constant_folding=True
+    )
+    return output_path
+
+
+def load_onnx_model(crop_name: str, checkpoint_path: Optional[str] = None):
+    # model_registry 에서 사용하는 로더, load_model 과 같은 (model, input_size) 형태로 반환
+    path = get_onnx_path(crop_name, checkpoint_path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'onnx 모델이 없습니다. python -m model.onnx_backend export --crop {crop_name} 로 먼저 변환해주세요: {path}')
+    # 추론 실행기 스레드마다 세션이 동시에 실행되므로 torch 와 같은 스레드당 코어 수로 제한
+    return OnnxModel(path, intra_op_num_threads=inference_executor.torch_num_threads), select_input_size(crop_name)
+
+
+def verify_onnx(crop_name: str, samples: int = 8, atol: float = 1e-3) -> bool:
+    # 같은 입력에 대해 torch / onnx 두 백엔드의 top-2 결과와 확률이 같은지 비교
+    torch_model, input_size = load_model(crop_name)
+    torch_model.eval()
+    onnx_model = OnnxModel(get_onnx_path(crop_name))
+    class_list_name = select_class_list(crop_name)
+
+    width, height = input_size
+    input_data = torch.randn(samples, 3, height, width)
+    with torch.no_grad():
+        torch_probs = torch.softmax(torch_model(input_data)[0], dim=1)
+    onnx_probs = torch.softmax(onnx_model(input_data)[0], dim=1)
+
+    torch_top = torch_probs.topk(2, dim=1)
+    onnx_top = onnx_probs.topk(2, dim=1)
+    same_labels = torch.equal(torch_top.indices, onnx_top.indices)
+    max_diff = (torch_top.values - onnx_top.values).abs().max().item()
+
+    print(f'[{crop_name}] top-2 일치: {same_labels}, 최대 확률 차이: {max_diff:.6f}')
+    if not same_labels:
+        for row, (t, o) in enumerate(zip(torch_top.indices.tolist(), onnx_top.indices.tolist())):
+            if t != o:
+                print(f'  sample {row}: torch={[class_list_name[i] for i in t]} onnx={[class_list_name[i] for i in o]}')
+    return same_labels and max_diff <= atol
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='작물 분류 모델 ONNX 변환/검증')
+    parser.add_argument('command', choices=['export', 'verify'])
+    parser.add_argument('--crop', choices=crop_list, help='지정하지 않으면 전체 작물')
+    parser.add_argument('--samples', type=int, default=8, help='verify 에 사용할 랜덤 입력 수')
+    parser.add_argument('--atol', type=float, default=1e-3, help='verify 허용 확률 차이')
+    args = parser.parse_args(argv)
+
+    crops = [args.crop] if args.crop else crop_list
+    failed = []
+    for crop in crops:
+        if args.command == 'export':
+            print(f'[{crop}] onnx 변환 완료: {export_onnx(crop)}')
+        elif not verify_onnx(crop, samples=args.samples, atol=args.atol):
+            failed.append(crop)
+
+    if failed:
+        raise SystemExit(f'torch / onnx 결과 불일치: {failed}')
+
+
+if __name__ == '__main__':
+    main()
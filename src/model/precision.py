@@ -0,0 +1,156 @@
+# CPU 추론용 정밀도 모드 (fp32 / int8 / bf16)
+# 작물별 모드는 config.INFERENCE_PRECISION 으로 지정하고,
+# fp32가 아닌 모드는 아래 검증 명령으로 fp32 대비 top-1 일치율이 기준 이상인 경우에만 적용됨
+# 승인은 검증한 체크포인트(경로, 크기, 수정 시각)에만 유효하므로 모델 교체/버전 변경 후에는 다시 검증해야 함
+#
+# 검증:  python -m model.precision validate --crop 포도 --mode int8 --images ./samples/포도
+# 교체할 체크포인트 검증:  python -m model.precision validate --crop 포도 --mode int8 --images ./samples/포도 --checkpoint ./new.pt
+import argparse
+import copy
+import json
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import torch
+import torch.nn as nn
+
+import config
+from model.classification0430 import crop_list, crop_registry, load_model, preprocess_image_new, list_image_files
+
+PRECISION_MODES = ['fp32', 'int8', 'bf16']
+
+
+class Bf16Model(nn.Module):
+    # bfloat16 autocast 로 forward 하고 출력은 다시 float32 로 돌려줌
+    def __init__(self, model: nn.Module):
+        super(Bf16Model, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        with torch.autocast(device_type='cpu', dtype=torch.bfloat16):
+            out1, out2 = self.model(x)
+        return out1.float(), out2.float() if out2 is not None else None
+
+
+def apply_precision(model: nn.Module, mode: str) -> nn.Module:
+    if mode == 'fp32':
+        return model
+    if mode == 'int8':
+        # Linear 레이어(ResNet50의 mid1/mid2/mid3/fc1/fc2, ViT의 attention/mlp)를 동적 INT8 양자화
+        # Conv2d 는 동적 양자화를 지원하지 않아 fp32 로 남음
+        return torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    if mode == 'bf16':
+        return Bf16Model(model).eval()
+    raise ValueError(f'지원하지 않는 정밀도 모드입니다: {mode} (가능한 모드: {PRECISION_MODES})')
+
+
+def load_approvals() -> Dict[str, Dict[str, dict]]:
+    # {작물: {모드: 검증 결과}}
+    if not os.path.exists(config.PRECISION_APPROVAL_PATH):
+        return {}
+    with open(config.PRECISION_APPROVAL_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_approvals(approvals: Dict[str, Dict[str, dict]]) -> None:
+    with open(config.PRECISION_APPROVAL_PATH, 'w', encoding='utf-8') as f:
+        json.dump(approvals, f, ensure_ascii=False, indent=2)
+
+
+def checkpoint_fingerprint(checkpoint_path: str) -> dict:
+    # 승인한 체크포인트와 같은 파일인지 확인하는 값 (같은 경로에 다른 파일을 덮어쓴 경우도 구분)
+    stat = os.stat(checkpoint_path)
+    return {
+        'checkpoint': os.path.abspath(checkpoint_path),
+        'checkpoint_size': stat.st_size,
+        'checkpoint_mtime': stat.st_mtime
+    }
+
+
+def resolve_precision(crop_name: str, checkpoint_path: Optional[str] = None) -> str:
+    # 설정된 모드가 이 체크포인트로 검증을 통과하지 않았으면 fp32 로 대체
+    # checkpoint_path 가 없으면 매니페스트의 체크포인트 (모델 교체시 새 버전 경로를 넘김)
+    mode = config.INFERENCE_PRECISION.get(crop_name, 'fp32')
+    if mode == 'fp32':
+        return mode
+    approval = load_approvals().get(crop_name, {}).get(mode)
+    if approval is None:
+        print(f'[{crop_name}] {mode} 모드가 검증되지 않아 fp32로 실행합니다. python -m model.precision validate 를 먼저 실행해주세요.')
+        return 'fp32'
+    if approval.get('agreement', 0.0) < config.PRECISION_MIN_AGREEMENT:
+        print(f'[{crop_name}] {mode} 모드 일치율 {approval.get("agreement")} 이 기준 {config.PRECISION_MIN_AGREEMENT} 보다 낮아 fp32로 실행합니다.')
+        return 'fp32'
+    checkpoint_path = checkpoint_path or crop_registry.get(crop_name).checkpoint
+    fingerprint = checkpoint_fingerprint(checkpoint_path)
+    if any(approval.get(key) != value for key, value in fingerprint.items()):
+        print(f'[{crop_name}] {mode} 모드는 다른 체크포인트로 검증되어 fp32로 실행합니다: {checkpoint_path}')
+        return 'fp32'
+    return mode
+
+
+def measure_agreement(crop_name: str, mode: str, image_paths: List[str], batch_size: int = 16,
+                      checkpoint_path: Optional[str] = None) -> float:
+    # 같은 이미지들에 대해 fp32 모델과 mode 모델의 top-1 예측이 일치하는 비율
+    base_model, input_size = load_model(crop_name, checkpoint_path)
+    base_model.eval()
+    candidate = apply_precision(copy.deepcopy(base_model), mode).eval()
+
+    matched = 0
+    for start in range(0, len(image_paths), batch_size):
+        paths = image_paths[start:start + batch_size]
+        input_data = torch.cat([preprocess_image_new(path, input_size) for path in paths])
+        with torch.no_grad():
+            base_top1 = base_model(input_data)[0].argmax(dim=1)
+            candidate_top1 = candidate(input_data)[0].argmax(dim=1)
+        matched += (base_top1 == candidate_top1).sum().item()
+    return matched / len(image_paths)
+
+
+def validate(crop_name: str, mode: str, image_dir: str, threshold: float, checkpoint_path: Optional[str] = None) -> bool:
+    # 기준을 통과하면 승인 기록, 통과하지 못하면 기존 승인도 취소
+    # threshold 는 config.PRECISION_MIN_AGREEMENT 보다 낮게 줄 수 없음 (더 엄격하게만 가능)
+    image_paths = list_image_files(image_dir)
+    if not image_paths:
+        raise SystemExit(f'검증용 이미지가 없습니다: {image_dir}')
+    if threshold < config.PRECISION_MIN_AGREEMENT:
+        print(f'기준 {threshold} 은 PRECISION_MIN_AGREEMENT({config.PRECISION_MIN_AGREEMENT}) 보다 낮아 {config.PRECISION_MIN_AGREEMENT} 을 사용합니다.')
+        threshold = config.PRECISION_MIN_AGREEMENT
+    checkpoint_path = checkpoint_path or crop_registry.get(crop_name).checkpoint
+
+    agreement = measure_agreement(crop_name, mode, image_paths, checkpoint_path=checkpoint_path)
+    passed = agreement >= threshold
+    print(f'[{crop_name}] {mode} top-1 일치율: {agreement:.4f} ({len(image_paths)}장, 기준 {threshold}) -> {"통과" if passed else "실패"}')
+
+    approvals = load_approvals()
+    crop_approvals = approvals.setdefault(crop_name, {})
+    if passed:
+        crop_approvals[mode] = {
+            'agreement': agreement,
+            'threshold': threshold,
+            'samples': len(image_paths),
+            'validated_time': datetime.now().isoformat(),
+            **checkpoint_fingerprint(checkpoint_path)
+        }
+    else:
+        crop_approvals.pop(mode, None)
+    save_approvals(approvals)
+    return passed
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='정밀도 모드 정확도 검증')
+    parser.add_argument('command', choices=['validate'])
+    parser.add_argument('--crop', choices=crop_list, required=True)
+    parser.add_argument('--mode', choices=[mode for mode in PRECISION_MODES if mode != 'fp32'], required=True)
+    parser.add_argument('--images', required=True, help='검증용 샘플 이미지 폴더')
+    parser.add_argument('--threshold', type=float, default=config.PRECISION_MIN_AGREEMENT)
+    parser.add_argument('--checkpoint', help='검증할 체크포인트 (기본값: 매니페스트의 체크포인트)')
+    args = parser.parse_args(argv)
+
+    if not validate(args.crop, args.mode, args.images, args.threshold, args.checkpoint):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+# 새 체크포인트 배포 후 과거 진단 이미지(또는 로컬 이미지 폴더)를 일괄 재진단하는 배치 작업
+# 이미지 다운로드/디코딩/전처리는 스레드풀에서 미리 읽어두고(prefetch), 작물별로 배치를 모아 한 번에 forward
+# 결과는 배치마다 바로 기록하고 처리한 항목을 진행 파일에 남겨서, 중단 후 다시 실행하면 이어서 진행
+# (결과 기록 후 진행 파일에 남기기 전에 중단된 배치는 다시 처리되므로, 재시작시 진행 파일에 없는 결과는 지우고 시작)
+#
+# DB 진단기록:  python -m model.rediagnose --source db --crops 토마토,포도 --output rediagnose.csv
+# 퍼센트 갱신:  python -m model.rediagnose --source db --update-db
+# 로컬 폴더:    python -m model.rediagnose --source dir --images ./samples/포도 --crop 포도 --format parquet --output ./rediagnose
+import argparse
+import csv
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import requests
+import torch
+from pydantic import BaseModel
+
+from model.classification0430 import crop_list, model_registry, preprocess_image_bytes, select_input_size, \
+    select_class_list, forward_probs, top2_from_probs, list_image_files
+
+# 이미지 다운로드 타임아웃 (초)
+DOWNLOAD_TIMEOUT_SECONDS = 30
+
+
+class RediagnoseItem(BaseModel):
+    # 진행 파일에 기록되는 식별자 (db:<result_id>:<user_id> 또는 이미지 경로)
+    key: str
+    crop: str
+    # 이미지 URL 또는 로컬 경로
+    source: str
+    # DB 진단기록인 경우에만 채워짐
+    old_percent1: Optional[int] = None
+    old_percent2: Optional[int] = None
+    # 저장된 질병명, 퍼센트 갱신시 이 질병들의 새 확률을 사용
+    stored_disease_name1: Optional[str] = None
+    stored_disease_name2: Optional[str] = None
+
+
+class RediagnoseRow(BaseModel):
+    key: str
+    crop: str
+    disease_name1: Optional[str] = None
+    prob1: Optional[float] = None
+    disease_name2: Optional[str] = None
+    prob2: Optional[float] = None
+    # 저장된 질병명에 대한 새 퍼센트 (DB 진단기록만)
+    percent1: Optional[int] = None
+    percent2: Optional[int] = None
+    old_percent1: Optional[int] = None
+    old_percent2: Optional[int] = None
+    error: Optional[str] = None
+
+
+def iter_db_items(crops: List[str]) -> Iterator[RediagnoseItem]:
+    # 우리 DB 질병(disease_id1)으로 저장된 진단기록만 대상 (작물은 질병 정보에서 가져옴)
+    # NCPMS 코드만 있는 기록은 작물을 알 수 없어 제외
+    from sqlalchemy import select
+    from sqlalchemy.orm import aliased
+    from database.connection import SessionFactory
+    from database.orm import DiagnosisResult, Disease
+
+    disease1 = aliased(Disease)
+    disease2 = aliased(Disease)
+    query = (
+        select(DiagnosisResult, disease1.plant, disease1.kor_name, disease2.kor_name)
+        .join(disease1, DiagnosisResult.disease_id1 == disease1.disease_id)
+        .outerjoin(disease2, DiagnosisResult.disease_id2 == disease2.disease_id)
+        .where(disease1.plant.in_(crops))
+        .order_by(DiagnosisResult.result_id)
+        .execution_options(yield_per=500)
+    )
+    session = SessionFactory()
+    try:
+        for result, plant, disease_name1, disease_name2 in session.execute(query):
+            yield RediagnoseItem(
+                # DB 갱신에 필요한 복합키(result_id, user_id)를 key 에 포함
+                key=f'db:{result.result_id}:{result.user_id}',
+                crop=plant,
+                source=result.img_url,
+                old_percent1=result.percent1,
+                old_percent2=result.percent2,
+                stored_disease_name1=disease_name1,
+                stored_disease_name2=disease_name2
+            )
+    finally:
+        session.close()
+
+
+def iter_dir_items(root: str, crop: str) -> Iterator[RediagnoseItem]:
+    for path in list_image_files(root):
+        yield RediagnoseItem(key=path, crop=crop, source=path)
+
+
+def read_image_bytes(source: str) -> bytes:
+    if source.startswith(('http://', 'https://')):
+        response = requests.get(source, timeout=DOWNLOAD_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return response.content
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def load_input(item: RediagnoseItem) -> torch.Tensor:
+    # 스레드풀에서 실행 (다운로드 대기와 cv2 디코딩은 GIL을 놓으므로 병렬로 진행됨)
+    return preprocess_image_bytes(read_image_bytes(item.source), select_input_size(item.crop))
+
+
+def prefetch(items: Iterable[RediagnoseItem], workers: int,
+             depth: int) -> Iterator[Tuple[RediagnoseItem, Optional[torch.Tensor], Optional[str]]]:
+    # 최대 depth 개를 미리 요청해두고 입력 순서대로 (항목, 입력 텐서, 에러) 반환
+    # 메인 스레드가 forward 하는 동안 다음 이미지들을 준비
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append((item, pool.submit(load_input, item)))
+            if len(pending) >= depth:
+                yield _get_prefetched(*pending.popleft())
+        while pending:
+            yield _get_prefetched(*pending.popleft())
+
+
+def _get_prefetched(item: RediagnoseItem, future) -> Tuple[RediagnoseItem, Optional[torch.Tensor], Optional[str]]:
+    try:
+        return item, future.result(), None
+    except Exception as ex:
+        return item, None, f'{type(ex).__name__}: {ex}'
+
+
+def batch_by_crop(stream: Iterable[Tuple[RediagnoseItem, Optional[torch.Tensor], Optional[str]]], batch_size: int
+                  ) -> Iterator[Tuple[str, List[RediagnoseItem], Optional[torch.Tensor], List[str]]]:
+    # 작물별로 batch_size 개씩 모아서 (작물, 항목들, [N, C, H, W] 입력, []) 반환
+    # 읽기에 실패한 항목은 바로 (작물, [항목], None, [에러]) 로 반환
+    buffers: Dict[str, List[Tuple[RediagnoseItem, torch.Tensor]]] = {}
+    for item, input_data, error in stream:
+        if error is not None:
+            yield item.crop, [item], None, [error]
+            continue
+        buffer = buffers.setdefault(item.crop, [])
+        buffer.append((item, input_data))
+        if len(buffer) >= batch_size:
+            yield item.crop, [entry[0] for entry in buffer], torch.cat([entry[1] for entry in buffer]), []
+            buffers[item.crop] = []
+    for crop, buffer in buffers.items():
+        if buffer:
+            yield crop, [entry[0] for entry in buffer], torch.cat([entry[1] for entry in buffer]), []
+
+
+def _stored_percent(probs: List[float], class_list_name: List[str], disease_name: Optional[str]) -> Optional[int]:
+    if disease_name not in class_list_name:
+        return None
+    return round(probs[class_list_name.index(disease_name)] * 100)
+
+
+def rediagnose_batch(crop: str, items: List[RediagnoseItem], input_data: torch.Tensor) -> List[RediagnoseRow]:
+    model, _ = model_registry.get(crop)
+    class_list_name = select_class_list(crop)
+    probs = forward_probs(model, input_data)
+
+    rows = []
+    for item, prediction, row_probs in zip(items, top2_from_probs(probs, class_list_name), probs.tolist()):
+        rows.append(RediagnoseRow(
+            key=item.key,
+            crop=crop,
+            disease_name1=prediction.disease_name1,
+            prob1=prediction.prob1,
+            disease_name2=prediction.disease_name2,
+            prob2=prediction.prob2,
+            percent1=_stored_percent(row_probs, class_list_name, item.stored_disease_name1),
+            percent2=_stored_percent(row_probs, class_list_name, item.stored_disease_name2),
+            old_percent1=item.old_percent1,
+            old_percent2=item.old_percent2
+        ))
+    return rows
+
+
+class ProgressLog:
+    # 결과 기록이 끝난 항목의 key 를 한 줄씩 추가하는 파일
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.done = {line.rstrip('\n') for line in f if line.strip()}
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def mark(self, keys: List[str]) -> None:
+        self._file.writelines(f'{key}\n' for key in keys)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done.update(keys)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class CsvResultWriter:
+    def __init__(self, path: str, done: Set[str]):
+        # done: 진행 파일에 기록된 key, 이전 실행 결과 중 done 에 없는 행(실패 행, 기록 직후 중단된 배치)은 제거
+        # 제거된 항목은 이번 실행에서 다시 처리되므로 같은 key 의 행이 중복되지 않음
+        fieldnames = list(RediagnoseRow.model_fields)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self._drop_unconfirmed_rows(path, fieldnames, done)
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames)
+        if is_new:
+            self._writer.writeheader()
+
+    @staticmethod
+    def _drop_unconfirmed_rows(path: str, fieldnames: List[str], done: Set[str]) -> None:
+        temp_path = f'{path}.tmp'
+        written: Set[str] = set()
+        with open(path, encoding='utf-8', newline='') as source, \
+                open(temp_path, 'w', encoding='utf-8', newline='') as target:
+            writer = csv.DictWriter(target, fieldnames=fieldnames)
+            writer.writeheader()
+            for row in csv.DictReader(source):
+                if row['key'] in done and row['key'] not in written:
+                    writer.writerow(row)
+                    written.add(row['key'])
+        os.replace(temp_path, path)
+
+    def write(self, rows: List[RediagnoseRow]) -> None:
+        self._writer.writerows(row.model_dump() for row in rows)
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetResultWriter:
+    # 배치마다 part 파일 하나씩 기록 (중단되어도 이미 기록된 파일은 온전함)
+    def __init__(self, output_dir: str, done: Set[str]):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit('parquet 출력에는 pyarrow 가 필요합니다. (pip install pyarrow)')
+        self._pyarrow = pyarrow
+        self._parquet = pyarrow.parquet
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        # part 파일 하나는 배치 하나이고 배치의 key 는 함께 진행 파일에 기록되므로,
+        # done 에 없는 key 가 있는 part(실패 행, 기록 직후 중단된 배치)는 지우고 이번 실행에서 다시 기록
+        part_names = sorted(name for name in os.listdir(output_dir) if name.endswith('.parquet'))
+        for name in part_names:
+            part_path = os.path.join(output_dir, name)
+            keys = self._parquet.read_table(part_path, columns=['key']).column('key').to_pylist()
+            if not done.issuperset(keys):
+                os.remove(part_path)
+        # 지운 번호를 다시 쓰지 않도록 가장 큰 번호 다음부터 기록
+        self._part = max((int(name[len('part-'):-len('.parquet')]) for name in part_names), default=-1) + 1
+
+    def write(self, rows: List[RediagnoseRow]) -> None:
+        table = self._pyarrow.Table.from_pylist([row.model_dump() for row in rows])
+        self._parquet.write_table(table, os.path.join(self.output_dir, f'part-{self._part:05d}.parquet'))
+        self._part += 1
+
+    def close(self) -> None:
+        pass
+
+
+class DbPercentUpdater:
+    # 저장된 질병에 대한 새 퍼센트로 percent1/percent2 를 배치 단위로 일괄 갱신
+    def __init__(self):
+        from database.connection import SessionFactory
+        self._session = SessionFactory()
+
+    def write(self, rows: List[RediagnoseRow]) -> None:
+        from database.orm import DiagnosisResult
+
+        mappings = []
+        for row in rows:
+            if row.error is not None or row.percent1 is None:
+                continue
+            result_id, user_id = _parse_db_key(row.key)
+            mappings.append({'result_id': result_id, 'user_id': user_id,
+                             'percent1': row.percent1, 'percent2': row.percent2})
+        if mappings:
+            self._session.bulk_update_mappings(DiagnosisResult, mappings)
+            self._session.commit()
+
+    def close(self) -> None:
+        self._session.close()
+
+
+def _parse_db_key(key: str) -> Tuple[int, str]:
+    # db:<result_id>:<user_id>
+    _, result_id, user_id = key.split(':', 2)
+    return int(result_id), user_id
+
+
+def run(items: Iterable[RediagnoseItem], writers: list, progress: ProgressLog,
+        batch_size: int, workers: int, prefetch_depth: int, limit: int = 0) -> Tuple[int, int]:
+    # 처리한 항목 수, 실패한 항목 수 반환
+    # 실패한 항목은 진행 파일에 남기지 않으므로 다시 실행하면 재시도됨
+    pending_items = (item for item in items if item.key not in progress.done)
+    if limit > 0:
+        pending_items = (item for _, item in zip(range(limit), pending_items))
+
+    processed, failed, batch_count = 0, 0, 0
+    for crop, batch_items, input_data, errors in batch_by_crop(prefetch(pending_items, workers, prefetch_depth),
+                                                              batch_size):
+        if input_data is None:
+            rows = [RediagnoseRow(key=item.key, crop=crop, error=error) for item, error in zip(batch_items, errors)]
+            failed += len(rows)
+            print(f'이미지 읽기 실패: {batch_items[0].source} ({errors[0]})')
+        else:
+            rows = rediagnose_batch(crop, batch_items, input_data)
+            processed += len(rows)
+        for writer in writers:
+            writer.write(rows)
+        if input_data is not None:
+            progress.mark([item.key for item in batch_items])
+        batch_count += 1
+        if batch_count % 20 == 0:
+            print(f'재진단 {processed}건 완료 (실패 {failed}건)')
+    return processed, failed
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='진단 이미지 일괄 재진단')
+    parser.add_argument('--source', choices=['db', 'dir'], required=True)
+    parser.add_argument('--crops', default=','.join(crop_list), help='db: 콤마 구분 작물 목록')
+    parser.add_argument('--images', help='dir: 이미지 폴더')
+    parser.add_argument('--crop', choices=crop_list, help='dir: 이미지 폴더의 작물')
+    parser.add_argument('--output', default='rediagnose.csv', help='csv 파일 또는 parquet 폴더')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--no-output', action='store_true', help='결과 파일을 쓰지 않음 (--update-db 와 함께 사용)')
+    parser.add_argument('--update-db', action='store_true', help='db: 진단기록의 percent1/percent2 갱신')
+    parser.add_argument('--progress', help='진행 파일 (기본값: <output>.progress)')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=8, help='이미지 읽기/전처리 스레드 수')
+    parser.add_argument('--prefetch', type=int, default=64, help='미리 읽어둘 이미지 수')
+    parser.add_argument('--limit', type=int, default=0, help='이번 실행에서 처리할 최대 항목 수')
+    args = parser.parse_args(argv)
+
+    if args.source == 'dir':
+        if not args.images or not args.crop:
+            parser.error('--source dir 에는 --images 와 --crop 이 필요합니다.')
+        if args.update_db:
+            parser.error('--update-db 는 --source db 에서만 사용할 수 있습니다.')
+        items = iter_dir_items(args.images, args.crop)
+    else:
+        crops = [crop.strip() for crop in args.crops.split(',') if crop.strip()]
+        items = iter_db_items(crops)
+
+    if args.no_output and not args.update_db:
+        parser.error('--no-output 은 --update-db 와 함께 사용해주세요.')
+    progress = ProgressLog(args.progress or f'{args.output.rstrip(os.sep)}.progress')
+    writers = []
+    if not args.no_output:
+        writers.append(ParquetResultWriter(args.output, progress.done) if args.format == 'parquet'
+                       else CsvResultWriter(args.output, progress.done))
+    if args.update_db:
+        writers.append(DbPercentUpdater())
+    if progress.done:
+        print(f'이전 실행에서 처리한 {len(progress.done)}건은 건너뜁니다. ({progress.path})')
+    try:
+        processed, failed = run(items, writers, progress, args.batch_size, args.workers, args.prefetch, args.limit)
+    finally:
+        for writer in writers:
+            writer.close()
+        progress.close()
+    print(f'재진단 완료: {processed}건, 실패 {failed}건')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+# 작물별 분류 모델을 프로세스당 한 번만 로드해서 상주시키는 레지스트리
+# 요청마다 torch.load 로 체크포인트를 다시 읽지 않도록 하기 위함
+#
+# memory_budget_bytes 가 지정되면 처음 요청된 시점에 작물 모델을 로드하고,
+# 상주 모델 크기의 합이 예산을 넘으면 가장 오래 사용되지 않은 모델부터 내림 (LRU)
+#
+# 새 버전 체크포인트는 load_version 으로 서비스중인 모델과 별개로 로드한 뒤 swap 으로 한 번에 교체
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch.nn as nn
+from pydantic import BaseModel
+
+from model.crops import CheckpointMismatchError
+from model.memory import get_rss_bytes, get_module_bytes
+
+
+class ModelStats(BaseModel):
+    crop: str
+    version: Optional[str]
+    # None 이면 매니페스트의 체크포인트
+    checkpoint: Optional[str]
+    load_seconds: float
+    # 파라미터 + 버퍼 크기
+    param_bytes: int
+    # 로드 전후 프로세스 RSS 증가량 (할당자 상태에 따라 오차가 있음)
+    rss_delta_bytes: int
+    loaded_time: datetime
+
+
+class ModelCacheStats(BaseModel):
+    # 0이면 예산 제한 없음
+    memory_budget_bytes: int
+    used_bytes: int
+    loaded_crops: List[str]
+    hit_count: int
+    miss_count: int
+    eviction_count: int
+
+
+class ModelRegistry:
+    def __init__(self,
+                 loader: Callable[[str, Optional[str]], Tuple[nn.Module, Tuple[int, int]]],
+                 crops: List[str],
+                 memory_budget_bytes: int = 0,
+                 versions: Optional[Dict[str, str]] = None):
+        # loader(crop, checkpoint) -> (model, input_size) 형태의 함수 (classification0430.load_inference_model)
+        # checkpoint 가 None 이면 매니페스트의 체크포인트를 로드
+        self.loader = loader
+        self.crops = crops
+        self.memory_budget_bytes = memory_budget_bytes
+        # 작물별 서비스중인 버전과 체크포인트 (swap 으로 바뀌고, LRU 로 내렸다가 다시 로드할 때도 사용)
+        self._versions: Dict[str, Optional[str]] = dict(versions or {})
+        self._checkpoints: Dict[str, Optional[str]] = {}
+        # 최근에 사용한 모델일수록 뒤쪽에 위치
+        self._models: "OrderedDict[str, Tuple[nn.Module, int]]" = OrderedDict()
+        self._stats: Dict[str, ModelStats] = {}
+        # _models / _stats / 카운터 보호용
+        self._lock = threading.Lock()
+        # 같은 작물을 여러 스레드가 동시에 로드하지 않도록 작물별 잠금
+        self._load_locks: Dict[str, threading.Lock] = {crop: threading.Lock() for crop in crops}
+        self._hit_count = 0
+        self._miss_count = 0
+        self._eviction_count = 0
+
+    def _load(self, crop: str, checkpoint: Optional[str], version: Optional[str]
+              ) -> Tuple[Tuple[nn.Module, Tuple[int, int]], ModelStats]:
+        rss_before = get_rss_bytes()
+        start = time.perf_counter()
+        model, input_size = self.loader(crop, checkpoint)
+        model.eval()
+        load_seconds = time.perf_counter() - start
+
+        stats = ModelStats(
+            crop=crop,
+            version=version,
+            checkpoint=checkpoint,
+            load_seconds=load_seconds,
+            param_bytes=get_module_bytes(model) if isinstance(model, nn.Module) else getattr(model, 'nbytes', 0),
+            rss_delta_bytes=get_rss_bytes() - rss_before,
+            loaded_time=datetime.now()
+        )
+        print(f'모델 로드 완료: {crop} {version or ""} ({load_seconds:.2f}s)')
+        return (model, input_size), stats
+
+    def _get_loaded(self, crop: str) -> Optional[Tuple[nn.Module, int]]:
+        with self._lock:
+            entry = self._models.get(crop)
+            if entry is not None:
+                self._models.move_to_end(crop)
+                self._hit_count += 1
+            return entry
+
+    def _evict(self, keep: str) -> None:
+        # 예산을 넘으면 방금 로드한 모델(keep)을 제외하고 오래된 순서로 제거
+        # 모델을 사용중인 요청은 참조를 갖고 있으므로 요청이 끝난 뒤 메모리가 해제됨
+        if self.memory_budget_bytes <= 0:
+            return
+        while self._used_bytes() > self.memory_budget_bytes and len(self._models) > 1:
+            crop = next(iter(self._models))
+            if crop == keep:
+                self._models.move_to_end(crop)
+                continue
+            del self._models[crop]
+            del self._stats[crop]
+            self._eviction_count += 1
+            print(f'모델 메모리 예산 초과로 제거: {crop}')
+
+    def _used_bytes(self) -> int:
+        return sum(stats.param_bytes for stats in self._stats.values())
+
+    def get(self, crop: str) -> Tuple[nn.Module, int]:
+        # 로드된 모델이 있으면 그대로, 없으면 첫 사용시점에 로드
+        entry = self._get_loaded(crop)
+        if entry is not None:
+            return entry
+        if crop not in self.crops:
+            raise KeyError(f'등록되지 않은 작물입니다: {crop}')
+
+        with self._load_locks[crop]:
+            # 잠금을 기다리는 동안 다른 스레드가 로드했을 수 있음
+            entry = self._get_loaded(crop)
+            if entry is not None:
+                return entry
+            with self._lock:
+                self._miss_count += 1
+                checkpoint, version = self._checkpoints.get(crop), self._versions.get(crop)
+            entry, stats = self._load(crop, checkpoint, version)
+            with self._lock:
+                self._models[crop] = entry
+                self._stats[crop] = stats
+                self._evict(keep=crop)
+            return entry
+
+    def load_version(self, crop: str, checkpoint: str, version: str
+                     ) -> Tuple[Tuple[nn.Module, Tuple[int, int]], ModelStats]:
+        # 서비스중인 모델은 그대로 두고 새 체크포인트만 로드 (레지스트리에는 아직 반영하지 않음)
+        if crop not in self.crops:
+            raise KeyError(f'등록되지 않은 작물입니다: {crop}')
+        return self._load(crop, checkpoint, version)
+
+    def swap(self, crop: str, entry: Tuple[nn.Module, Tuple[int, int]], stats: ModelStats) -> Optional[str]:
+        # load_version 으로 준비한 모델로 교체하고 이전 버전을 반환
+        # 교체 전에 시작한 요청은 이전 모델 참조로 끝까지 실행되고, 이후 요청부터 새 모델을 사용
+        with self._load_locks[crop]:
+            with self._lock:
+                previous = self._versions.get(crop)
+                self._models[crop] = entry
+                self._models.move_to_end(crop)
+                self._stats[crop] = stats
+                self._versions[crop] = stats.version
+                self._checkpoints[crop] = stats.checkpoint
+                self._evict(keep=crop)
+        print(f'모델 교체 완료: {crop} {previous} -> {stats.version}')
+        return previous
+
+    def get_version(self, crop: str) -> Optional[str]:
+        with self._lock:
+            return self._versions.get(crop)
+
+    def load_all(self, crops: Optional[List[str]] = None) -> None:
+        # 서버 시작시(lifespan) 작물 모델을 미리 로드 (crops 가 없으면 전체)
+        # 실패한 작물은 첫 요청 때 다시 로드를 시도함
+        # 체크포인트와 매니페스트가 맞지 않는 경우는 다시 시도해도 실패하므로 예외를 그대로 전달 (서버 시작 중단)
+        for crop in self.crops if crops is None else crops:
+            try:
+                self.get(crop)
+            except CheckpointMismatchError:
+                raise
+            except Exception as ex:
+                print(f'모델 로드 실패: {crop}', ex)
+
+    def is_loaded(self, crop: str) -> bool:
+        return crop in self._models
+
+    def stats(self) -> List[ModelStats]:
+        with self._lock:
+            return list(self._stats.values())
+
+    def cache_stats(self) -> ModelCacheStats:
+        with self._lock:
+            return ModelCacheStats(
+                memory_budget_bytes=self.memory_budget_bytes,
+                used_bytes=self._used_bytes(),
+                loaded_crops=list(self._models.keys()),
+                hit_count=self._hit_count,
+                miss_count=self._miss_count,
+                eviction_count=self._eviction_count
+            )
@@ -0,0 +1,110 @@
+# 같은 사진을 다시 올린 경우 추론을 건너뛰기 위한 진단 결과 캐시
+# (작물, 모델 버전, 이미지 sha256) 으로 먼저 찾고, 설정시 perceptual hash(dHash)가 가까운 사진도 같은 결과로 처리
+# 키에 추론한 모델 버전이 들어가므로 모델 교체 전에 시작된 요청이 교체 후에 넣은 결과는 새 버전 조회에 사용되지 않음
+import hashlib
+import threading
+from typing import Any, Optional
+
+import cv2
+import numpy as np
+from pydantic import BaseModel
+
+from service.cache import LRUCache
+
+
+class ResultCacheStats(BaseModel):
+    size: int
+    max_size: int
+    ttl_seconds: float
+    lookup_count: int
+    exact_hit_count: int
+    perceptual_hit_count: int
+    hit_rate: float
+
+
+def get_content_hash(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def get_dhash(image: np.ndarray) -> int:
+    # 64bit difference hash: 9x8 흑백 축소 이미지에서 가로로 인접한 픽셀 밝기 비교
+    # 재촬영/재압축된 비슷한 사진은 해밍 거리가 작게 나옴
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, dsize=(9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+class DiagnosisResultCache:
+    def __init__(self, max_size: int, ttl_seconds: float, phash_max_distance: int = -1):
+        # phash_max_distance 가 0 이상이면 dHash 해밍 거리가 그 이하인 사진도 같은 사진으로 봄
+        self.phash_max_distance = phash_max_distance
+        self._exact = LRUCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        # (작물, 모델 버전, dHash) -> 결과
+        self._perceptual = LRUCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._lookup_count = 0
+        self._exact_hit_count = 0
+        self._perceptual_hit_count = 0
+
+    @property
+    def phash_enabled(self) -> bool:
+        return self.phash_max_distance >= 0
+
+    def get(self, crop: str, version: Optional[str], content_hash: str) -> Optional[Any]:
+        result = self._exact.get((crop, version, content_hash))
+        with self._lock:
+            self._lookup_count += 1
+            if result is not None:
+                self._exact_hit_count += 1
+        return result
+
+    def get_similar(self, crop: str, version: Optional[str], dhash: int) -> Optional[Any]:
+        # get() 에서 찾지 못한 요청만 호출 (조회 횟수는 get 에서 이미 집계됨)
+        if not self.phash_enabled:
+            return None
+        best_key, best_distance = None, self.phash_max_distance + 1
+        for key, _ in self._perceptual.items():
+            cached_crop, cached_version, cached_dhash = key
+            if cached_crop != crop or cached_version != version:
+                continue
+            distance = bin(cached_dhash ^ dhash).count('1')
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+        if best_key is None:
+            return None
+        result = self._perceptual.touch(best_key)
+        if result is not None:
+            with self._lock:
+                self._perceptual_hit_count += 1
+        return result
+
+    def put(self, crop: str, version: Optional[str], content_hash: str, dhash: Optional[int], result: Any) -> None:
+        # version 은 결과를 만든 모델 버전 (추론 전에 읽은 값)
+        self._exact.put((crop, version, content_hash), result)
+        if self.phash_enabled and dhash is not None:
+            self._perceptual.put((crop, version, dhash), result)
+
+    def clear(self, crop: Optional[str] = None) -> None:
+        # 모델이 바뀌면 기존 결과는 더 이상 유효하지 않음
+        for cache in (self._exact, self._perceptual):
+            if crop is None:
+                cache.clear()
+                continue
+            for key, _ in cache.items():
+                if key[0] == crop:
+                    cache.delete(key)
+
+    def stats(self) -> ResultCacheStats:
+        exact_stats = self._exact.stats()
+        with self._lock:
+            hit_count = self._exact_hit_count + self._perceptual_hit_count
+            return ResultCacheStats(
+                size=exact_stats.size,
+                max_size=exact_stats.max_size,
+                ttl_seconds=exact_stats.ttl_seconds,
+                lookup_count=self._lookup_count,
+                exact_hit_count=self._exact_hit_count,
+                perceptual_hit_count=self._perceptual_hit_count,
+                hit_rate=hit_count / self._lookup_count if self._lookup_count else 0.0
+            )
@@ -0,0 +1,104 @@
+# 새 버전 모델을 실제 요청 일부에 몰래 같이 돌려보는 shadow 평가
+# 응답은 항상 서비스중인 모델 결과를 사용하고, 후보 모델 결과는 일치율 집계에만 사용
+import random
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+
+class ShadowStats(BaseModel):
+    crop: str
+    serving_version: Optional[str]
+    candidate_version: str
+    sample_rate: float
+    started_time: datetime
+    sample_count: int
+    # 후보 모델의 top-1 질병이 서비스중인 모델과 같은 비율
+    top1_agreement: float
+    # top-2 질병 쌍(순서 무관)이 같은 비율
+    top2_agreement: float
+    # 같은 top-1 질병에 대한 두 모델의 확률 차이 평균
+    mean_prob_diff: float
+    error_count: int
+
+
+class _ShadowCandidate:
+    def __init__(self, entry: Tuple[Any, Tuple[int, int]], version: str, sample_rate: float):
+        self.entry = entry
+        self.version = version
+        self.sample_rate = sample_rate
+        self.started_time = datetime.now()
+        self.sample_count = 0
+        self.top1_match_count = 0
+        self.top2_match_count = 0
+        self.prob_diff_sum = 0.0
+        self.error_count = 0
+
+
+class ShadowEvaluator:
+    def __init__(self):
+        self._candidates: Dict[str, _ShadowCandidate] = {}
+        self._lock = threading.Lock()
+
+    def start(self, crop: str, entry: Tuple[Any, Tuple[int, int]], version: str, sample_rate: float) -> None:
+        # 같은 작물의 이전 후보가 있으면 교체 (집계도 새로 시작)
+        with self._lock:
+            self._candidates[crop] = _ShadowCandidate(entry, version, sample_rate)
+
+    def stop(self, crop: str) -> Optional[Tuple[Any, Tuple[int, int]]]:
+        # 후보 모델을 내리고 반환 (promote 할 때 다시 로드하지 않도록)
+        with self._lock:
+            candidate = self._candidates.pop(crop, None)
+        return candidate.entry if candidate else None
+
+    def get_version(self, crop: str) -> Optional[str]:
+        candidate = self._candidates.get(crop)
+        return candidate.version if candidate else None
+
+    def sample(self, crop: str) -> Optional[Tuple[Any, Tuple[int, int]]]:
+        # 이번 요청을 shadow 로 돌릴지 결정, 돌릴 경우 후보 모델 반환
+        candidate = self._candidates.get(crop)
+        if candidate is None or random.random() >= candidate.sample_rate:
+            return None
+        return candidate.entry
+
+    def record(self, crop: str, entry: Tuple[Any, Tuple[int, int]], serving: Any, shadow: Any) -> None:
+        # serving / shadow 는 PredictionResult (top-2 질병과 확률)
+        with self._lock:
+            candidate = self._candidates.get(crop)
+            # 집계 도중 후보가 바뀌었으면 버림
+            if candidate is None or candidate.entry is not entry:
+                return
+            candidate.sample_count += 1
+            if serving.disease_name1 == shadow.disease_name1:
+                candidate.top1_match_count += 1
+                candidate.prob_diff_sum += abs(serving.prob1 - shadow.prob1)
+            if {serving.disease_name1, serving.disease_name2} == {shadow.disease_name1, shadow.disease_name2}:
+                candidate.top2_match_count += 1
+
+    def record_error(self, crop: str) -> None:
+        with self._lock:
+            candidate = self._candidates.get(crop)
+            if candidate is not None:
+                candidate.error_count += 1
+
+    def stats(self, serving_versions: Dict[str, Optional[str]]) -> List[ShadowStats]:
+        with self._lock:
+            return [
+                ShadowStats(
+                    crop=crop,
+                    serving_version=serving_versions.get(crop),
+                    candidate_version=candidate.version,
+                    sample_rate=candidate.sample_rate,
+                    started_time=candidate.started_time,
+                    sample_count=candidate.sample_count,
+                    top1_agreement=candidate.top1_match_count / candidate.sample_count if candidate.sample_count else 0.0,
+                    top2_agreement=candidate.top2_match_count / candidate.sample_count if candidate.sample_count else 0.0,
+                    mean_prob_diff=candidate.prob_diff_sum / candidate.top1_match_count
+                    if candidate.top1_match_count else 0.0,
+                    error_count=candidate.error_count
+                )
+                for crop, candidate in self._candidates.items()
+            ]
@@ -0,0 +1,220 @@
+# 진단 이미지 임베딩의 근사 최근접 이웃 검색용 IVF 인덱스 (numpy 만 사용)
+# 벡터는 L2 정규화해서 저장하고 내적(코사인 유사도)이 큰 순서로 검색
+# - 학습 전(train_min 개 미만): 리스트 하나에 모두 넣고 전체 비교 (flat)
+# - 학습 후: k-means 중심 nlist 개로 나눠두고 query 와 가까운 nprobe 개 리스트만 비교
+# - 추가된 벡터는 가장 가까운 중심의 리스트 끝에 붙이고, 학습 시점보다 4배 이상 커지면 다시 학습 (needs_training)
+#   학습(train)과 저장(export -> write)은 시간이 걸리므로 호출하는 쪽에서 요청 처리와 별개로 실행하고,
+#   k-means 는 잠금 밖에서 계산하므로 학습 중에도 검색/추가는 계속 가능
+# 메모리를 줄이기 위해 벡터는 float16 으로 보관 (비교할 때만 float32 로 변환)
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+RETRAIN_GROWTH = 4
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLES_PER_CENTROID = 64
+MAX_NLIST = 4096
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class _InvertedList:
+    def __init__(self, dim: int):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, dim), dtype=np.float16)
+        self.size = 0
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        required = self.size + len(ids)
+        if required > len(self.ids):
+            # 용량을 2배씩 늘려서 추가할 때마다 전체를 복사하지 않도록 함
+            capacity = max(required, len(self.ids) * 2, 16)
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_vectors = np.empty((capacity, self.vectors.shape[1]), dtype=np.float16)
+            grown_ids[:self.size] = self.ids[:self.size]
+            grown_vectors[:self.size] = self.vectors[:self.size]
+            self.ids, self.vectors = grown_ids, grown_vectors
+        self.ids[self.size:required] = ids
+        self.vectors[self.size:required] = vectors
+        self.size = required
+
+
+class IvfIndex:
+    def __init__(self, dim: int, nprobe: int = 8, train_min: int = 1000):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.train_min = train_min
+        # [nlist, dim] 정규화된 중심, 학습 전에는 None
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_count = 0
+        self._lists: List[_InvertedList] = [_InvertedList(dim)]
+        self._lock = threading.RLock()
+
+    @property
+    def count(self) -> int:
+        return sum(inverted_list.size for inverted_list in self._lists)
+
+    @property
+    def nlist(self) -> int:
+        return len(self._lists)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        if self.centroids is None:
+            return np.zeros(len(vectors), dtype=np.int64)
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+
+    def _append(self, ids: np.ndarray, vectors: np.ndarray, assignments: np.ndarray) -> None:
+        order = np.argsort(assignments, kind='stable')
+        ids, vectors, assignments = ids[order], vectors[order], assignments[order]
+        list_indices, starts = np.unique(assignments, return_index=True)
+        ends = list(starts[1:]) + [len(assignments)]
+        for list_index, start, end in zip(list_indices, starts, ends):
+            self._lists[list_index].append(ids[start:end], vectors[start:end])
+
+    def add(self, ids, vectors) -> None:
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = normalize(vectors).reshape(-1, self.dim)
+        with self._lock:
+            self._append(ids, vectors, self._assign(vectors))
+
+    @property
+    def needs_training(self) -> bool:
+        with self._lock:
+            count = self.count
+            if self.centroids is None:
+                return count >= self.train_min
+            return count >= self.trained_count * RETRAIN_GROWTH
+
+    def _all(self) -> Tuple[np.ndarray, np.ndarray]:
+        ids = np.concatenate([inverted_list.ids[:inverted_list.size] for inverted_list in self._lists])
+        vectors = np.concatenate([inverted_list.vectors[:inverted_list.size] for inverted_list in self._lists])
+        return ids, vectors
+
+    @staticmethod
+    def _kmeans(vectors: np.ndarray) -> np.ndarray:
+        # spherical k-means 로 정규화된 중심 [nlist, dim] 계산
+        nlist = int(np.clip(np.sqrt(len(vectors)), 1, MAX_NLIST))
+        rng = np.random.default_rng(0)
+        sample_size = min(len(vectors), nlist * KMEANS_SAMPLES_PER_CENTROID)
+        sample = vectors[rng.choice(len(vectors), size=sample_size, replace=False)].astype(np.float32)
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            # 배정된 벡터가 없는 중심은 이전 값 유지
+            empty = np.bincount(assignments, minlength=nlist) == 0
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums)
+        return centroids
+
+    def train(self) -> None:
+        # 중심을 다시 구하고 전체 벡터를 다시 배정
+        # 잠금은 벡터 복사와 교체할 때만 잡고, k-means 와 배정은 잠금 밖에서 계산
+        with self._lock:
+            ids, vectors = self._all()
+            # 학습중에 추가되는 벡터는 리스트 끝에 붙으므로 지금 크기 이후가 추가분
+            sizes = [inverted_list.size for inverted_list in self._lists]
+            lists = self._lists
+        if len(ids) == 0:
+            return
+        centroids = self._kmeans(vectors)
+        assignments = np.argmax(vectors.astype(np.float32) @ centroids.T, axis=1)
+
+        trained = IvfIndex(self.dim, self.nprobe, self.train_min)
+        trained.centroids = centroids
+        trained._lists = [_InvertedList(self.dim) for _ in range(len(centroids))]
+        trained._append(ids, vectors, assignments)
+        with self._lock:
+            if self._lists is not lists:
+                # 다른 학습이 먼저 끝남
+                return
+            for inverted_list, size in zip(lists, sizes):
+                if inverted_list.size > size:
+                    added_vectors = inverted_list.vectors[size:inverted_list.size]
+                    trained._append(inverted_list.ids[size:inverted_list.size], added_vectors,
+                                    trained._assign(added_vectors.astype(np.float32)))
+            self.centroids = centroids
+            self.trained_count = len(ids)
+            self._lists = trained._lists
+
+    def search(self, vector, k: int) -> List[Tuple[int, float]]:
+        # (id, 코사인 유사도) 를 유사도 내림차순으로 최대 k 개 반환
+        query = normalize(vector).reshape(self.dim)
+        with self._lock:
+            if self.centroids is None:
+                probe = [0]
+            else:
+                nprobe = min(self.nprobe, len(self._lists))
+                probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            candidate_ids = []
+            candidate_scores = []
+            for list_index in probe:
+                inverted_list = self._lists[list_index]
+                if inverted_list.size == 0:
+                    continue
+                candidate_ids.append(inverted_list.ids[:inverted_list.size])
+                candidate_scores.append(inverted_list.vectors[:inverted_list.size].astype(np.float32) @ query)
+        if not candidate_ids:
+            return []
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def export(self) -> Dict[str, np.ndarray]:
+        # 저장할 배열 복사본 (파일 쓰기는 write 로 잠금 밖에서)
+        with self._lock:
+            ids, vectors = self._all()
+            assignments = np.concatenate([np.full(inverted_list.size, list_index, dtype=np.int64)
+                                          for list_index, inverted_list in enumerate(self._lists)])
+            centroids = self.centroids if self.centroids is not None else np.empty((0, self.dim), np.float32)
+            return {'ids': ids, 'vectors': vectors, 'assignments': assignments, 'centroids': centroids,
+                    'trained_count': np.array(self.trained_count)}
+
+    @staticmethod
+    def write(path: str, arrays: Dict[str, np.ndarray], metadata: Optional[dict] = None) -> None:
+        # 프로세스마다 다른 임시 파일에 쓴 뒤 교체 (저장 도중 죽어도, 여러 워커가 동시에 저장해도 스냅샷은 온전함)
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(path), suffix='.tmp',
+                                         delete=False) as f:
+            temp_path = f.name
+            try:
+                np.savez(f, metadata=np.array(json.dumps(metadata or {})), **arrays)
+            except BaseException:
+                f.close()
+                os.remove(temp_path)
+                raise
+        try:
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def save(self, path: str, metadata: Optional[dict] = None) -> None:
+        self.write(path, self.export(), metadata)
+
+    @classmethod
+    def load(cls, path: str, nprobe: int = 8, train_min: int = 1000) -> Tuple["IvfIndex", dict]:
+        with np.load(path) as data:
+            vectors = data['vectors']
+            index = cls(dim=vectors.shape[1], nprobe=nprobe, train_min=train_min)
+            if len(data['centroids']):
+                index.centroids = data['centroids']
+                index._lists = [_InvertedList(index.dim) for _ in range(len(index.centroids))]
+            index.trained_count = int(data['trained_count'])
+            if len(vectors):
+                index._append(data['ids'], vectors, data['assignments'])
+            metadata = json.loads(str(data['metadata']))
+        return index, metadata
@@ -45,4 +45,15 @@ class CreateDiagnosisResultRequest(BaseModel):
 class GetClassificationRequest(BaseModel):
     plant: str
     # img: UploadFile = File(...)
-    # img: Any
\ No newline at end of file
+    # img: Any
+
+
+class DeployModelRequest(BaseModel):
+    # MODEL_CHECKPOINT_DIR 기준 체크포인트 경로 (예: 2_best_max_acc_v3.pt)
+    checkpoint: str
+    version: str
+
+
+class ShadowModelRequest(DeployModelRequest):
+    # 후보 모델로도 추론할 요청 비율 (0 초과 1 이하)
+    sample_rate: float
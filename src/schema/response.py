@@ -88,6 +88,27 @@ class ClassificationResultSchema(BaseModel):
     class Config:
         from_attributes = True
 
+# 여러장 진단 결과, 종합 판정 질병 정보 + 저장된 진단기록 id
+class MultiClassificationResultSchema(ClassificationResultSchema):
+    percent1: int
+    percent2: int
+    image_count: int
+    diagnosis_result_ids: List[int]
+
+# 비슷한 과거 진단, similarity 는 진단 이미지 임베딩의 코사인 유사도
+class SimilarCaseSchema(BaseModel):
+    diagnosis_result_id: int
+    similarity: float
+    img_url: str
+    percent1: Optional[int]
+    # DB에 있는 질병만 이름을 채움 (NCPMS 질병은 disease_code1 로 조회)
+    diseaseName: Optional[str]
+    disease_code1: str
+    created_time: datetime
+
+class SimilarCasesListSchema(BaseModel):
+    similarCases: List[SimilarCaseSchema]
+
 class DiseaseInfoSchema(BaseModel):
     diseaseName: str
     condition: str
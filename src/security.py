@@ -1,6 +1,9 @@
 # api에서 dependency로 사용할수있는 함수를 모아둔 파일
 
-from fastapi import Depends, HTTPException
+import hmac
+
+import config
+from fastapi import Depends, HTTPException, Header
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
 
@@ -12,4 +15,12 @@ def get_access_token(
     if auth_header is None:
         raise HTTPException(status_code=401, detail="Not Authorized")
 
-    return auth_header.credentials  # access_token
\ No newline at end of file
+    return auth_header.credentials  # access_token
+
+
+def verify_admin_token(x_admin_token: str | None = Header(None)) -> None:
+    # /admin API 용, ADMIN_TOKEN 이 설정되지 않은 서버에서는 항상 거부
+    if not config.ADMIN_TOKEN or x_admin_token is None:
+        raise HTTPException(status_code=401, detail="Not Authorized")
+    if not hmac.compare_digest(x_admin_token.encode(), config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
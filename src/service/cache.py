@@ -0,0 +1,144 @@
+# 프로세스 내 LRU + TTL 캐시
+# 여러 스레드(추론 스레드풀 등)에서 접근해도 안전하도록 잠금 사용
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+
+class CacheStats(BaseModel):
+    size: int
+    max_size: int
+    ttl_seconds: float
+    hit_count: int
+    miss_count: int
+    hit_rate: float
+    eviction_count: int
+    expired_count: int
+
+
+class LRUCache:
+    def __init__(self, max_size: int, ttl_seconds: float):
+        # max_size 를 넘으면 가장 오래 사용되지 않은 항목부터 제거
+        # ttl_seconds 가 지난 항목은 조회시 없는 것으로 처리 (0 이하면 만료 없음)
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # key -> (저장 시각, 값)
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hit_count = 0
+        self._miss_count = 0
+        self._eviction_count = 0
+        self._expired_count = 0
+
+    def _is_expired(self, stored_time: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - stored_time > self.ttl_seconds
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._miss_count += 1
+                return default
+            if self._is_expired(entry[0], time.monotonic()):
+                del self._data[key]
+                self._expired_count += 1
+                self._miss_count += 1
+                return default
+            self._data.move_to_end(key)
+            self._hit_count += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._eviction_count += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def items(self) -> Iterator[Tuple[Hashable, Any]]:
+        # 만료되지 않은 항목의 스냅샷 (hit/miss 집계에는 포함하지 않음)
+        now = time.monotonic()
+        with self._lock:
+            snapshot: List[Tuple[Hashable, Any]] = [
+                (key, value) for key, (stored_time, value) in self._data.items()
+                if not self._is_expired(stored_time, now)
+            ]
+        return iter(snapshot)
+
+    def touch(self, key: Hashable) -> Optional[Any]:
+        # items() 로 찾은 항목을 사용했을 때 LRU 순서만 갱신
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            lookups = self._hit_count + self._miss_count
+            return CacheStats(
+                size=len(self._data),
+                max_size=self.max_size,
+                ttl_seconds=self.ttl_seconds,
+                hit_count=self._hit_count,
+                miss_count=self._miss_count,
+                hit_rate=self._hit_count / lookups if lookups else 0.0,
+                eviction_count=self._eviction_count,
+                expired_count=self._expired_count
+            )
+
+
+class SingleFlightStats(BaseModel):
+    in_flight: int
+    # 실제로 실행한 호출 수
+    call_count: int
+    # 이미 진행중인 같은 키의 호출 결과를 같이 받은 횟수
+    shared_count: int
+
+
+class SingleFlight:
+    # 같은 키의 동시 호출을 하나로 합침 (이벤트 루프 안에서만 사용)
+    # 먼저 시작된 호출을 별도 task 로 실행하므로, 기다리던 요청 하나가 취소되어도 나머지는 결과를 받음
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._call_count = 0
+        self._shared_count = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self._call_count += 1
+        else:
+            self._shared_count += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def stats(self) -> SingleFlightStats:
+        return SingleFlightStats(
+            in_flight=len(self._calls),
+            call_count=self._call_count,
+            shared_count=self._shared_count
+        )
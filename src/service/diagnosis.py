@@ -0,0 +1,189 @@
+# 사진 진단 요청 처리 파이프라인
+# 인증 -> (업로드 || 추론) -> 질병 조회 -> 진단기록 저장 순서로 진행
+# 단계별 결과는 요청마다 새로 만들어지는 파이프라인 객체에만 보관하므로
+# 한 워커에서 여러 진단이 동시에 진행되어도 서로의 결과를 덮어쓰지 않음
+import asyncio
+
+import config
+from database.connection import get_db, SessionFactory
+from database.orm import DiagnosisResult, DiagnosisEmbedding, User
+from database.repository import UserRepository, DiagnosisResultRepository, DiagnosisEmbeddingRepository
+from fastapi import Depends, HTTPException
+from model.classification0430 import predict_bytes, embed_bytes, PredictionResult, crop_registry, model_registry
+from schema.request import CreateDiagnosisResultRequest
+from schema.response import ClassificationResultSchema
+from service.disease import DiseaseResolution, resolve_disease
+from service.disease_table import disease_table
+from service.firebase import upload_image_bytes_to_firebase_storage, delete_image_from_firebase_storage, \
+    FirebaseStorageSchema
+from service.healthy import healthy_fast_path
+from service.user import UserService
+from sqlalchemy.orm import Session
+
+
+def to_percent(prob: float) -> int:
+    # 모델 확률(0~1)을 진단기록에 저장하는 정수 퍼센트(0~100)로 변환
+    return round(prob * 100)
+
+
+# 실행중인 임베딩 계산 작업 참조 (완료 전에 GC 되지 않도록)
+_embedding_tasks = set()
+
+
+async def backfill_embedding(result_id: int, crop: str, image_bytes: bytes) -> None:
+    # cascade 작은 모델 결과를 그대로 사용한 진단은 작물 모델 임베딩이 없으므로 응답과 별개로 작물 모델로 계산해서 저장
+    # (확신하는 진단도 유사 사례 인덱스에 들어가도록), 요청 세션은 응답 후 닫히므로 별도 세션 사용
+    try:
+        prediction = await embed_bytes(image_bytes, crop)
+        if prediction.embedding is None:
+            return
+        session = SessionFactory()
+        try:
+            DiagnosisEmbeddingRepository(session=session).save_embedding(DiagnosisEmbedding.create(
+                result_id=result_id,
+                crop=crop,
+                model_version=model_registry.get_version(crop),
+                embedding=prediction.embedding
+            ))
+        finally:
+            session.close()
+    except Exception as ex:
+        print('진단 임베딩 저장 실패', ex)
+
+
+class DiagnosisPipeline:
+    # 라우터에서 Depends() 로 주입받으면 요청마다 새 객체가 생성됨
+    def __init__(self,
+                 diagnosis_result_repo: DiagnosisResultRepository = Depends(),
+                 user_service: UserService = Depends(),
+                 user_repo: UserRepository = Depends(),
+                 db: Session = Depends(get_db)):
+        self.diagnosis_result_repo = diagnosis_result_repo
+        self.user_service = user_service
+        self.user_repo = user_repo
+        self.db = db
+
+        self.user_id: str | None = None
+        self.plant: str | None = None
+        self.image_bytes: bytes | None = None
+        self.uploaded_img_info: FirebaseStorageSchema | None = None
+        self.prediction: PredictionResult | None = None
+        self.resolution: DiseaseResolution | None = None
+        self.diagnosis_result: DiagnosisResult | None = None
+
+    async def run(self, access_token: str, plant: str, image_bytes: bytes,
+                  filename: str, content_type: str) -> ClassificationResultSchema:
+        self.authenticate(access_token)
+        if plant not in crop_registry:
+            raise HTTPException(status_code=404, detail=f"진단 가능한 작물이 아닙니다. 입력된 작물명 {plant}")
+        self.plant = plant
+        self.image_bytes = image_bytes
+
+        # 업로드와 추론은 서로 의존하지 않으므로 동시에 진행
+        await self.upload_and_predict(plant, image_bytes, filename, content_type)
+        try:
+            await self.resolve(plant)
+            self.persist()
+        except Exception:
+            # 진단기록이 남지 않으면 업로드한 이미지도 지움
+            await delete_image_from_firebase_storage(self.uploaded_img_info.file_name)
+            raise
+        return self.resolution.result
+
+    def authenticate(self, access_token: str) -> str:
+        user_id: str = self.user_service.decode_jwt(access_token=access_token)["id"]
+
+        user: User | None = self.user_repo.get_user_by_id(user_id=user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User Not Found")
+        self.user_id = user_id
+        return user_id
+
+    async def upload(self, image_bytes: bytes, filename: str, content_type: str) -> FirebaseStorageSchema:
+        self.uploaded_img_info = await upload_image_bytes_to_firebase_storage(image_bytes, filename, content_type)
+        print({"img_url": self.uploaded_img_info.image_url})
+        return self.uploaded_img_info
+
+    async def predict(self, plant: str, image_bytes: bytes) -> PredictionResult:
+        self.prediction = await predict_bytes(image_bytes, plant)
+        return self.prediction
+
+    async def upload_and_predict(self, plant: str, image_bytes: bytes, filename: str, content_type: str) -> None:
+        uploaded, predicted = await asyncio.gather(
+            self.upload(image_bytes, filename, content_type),
+            self.predict(plant, image_bytes),
+            return_exceptions=True
+        )
+        if isinstance(uploaded, BaseException):
+            print('에러가 발생 했습니다', uploaded)
+            raise HTTPException(status_code=500, detail="이미지 업로드 실패.")
+        if isinstance(predicted, BaseException):
+            # 분류에 실패하면 이미 올라간 이미지를 지움
+            print('에러가 발생 했습니다', predicted)
+            await delete_image_from_firebase_storage(self.uploaded_img_info.file_name)
+            if isinstance(predicted, HTTPException):
+                raise predicted
+            raise HTTPException(status_code=500, detail="진단에 실패했습니다.")
+
+    async def resolve(self, plant: str) -> DiseaseResolution:
+        # 0. 정상으로 확신하는 결과면 고정 정상 응답 사용 (질병 조회 생략)
+        #    그 외에는 서버 시작시 만들어둔 (작물, 클래스명) 매핑 테이블에서 조회, 없으면 1, 2 진행
+        # 1. disease_id1, disease_id2 에 대한 질병을
+        #    우리서버 db에서 검색해서 있으면 치환 없으면 NCPMS 에서 검색
+        # 2. disease_code1 = disease_id1, disease_code2 = disease_id2
+        resolution = healthy_fast_path.resolve(plant, self.prediction)
+        if resolution:
+            self.resolution = resolution
+            return resolution
+        resolution = disease_table.resolve(plant, self.prediction.disease_name1, self.prediction.disease_name2)
+        if resolution:
+            self.resolution = resolution
+            return resolution
+        resolution = await resolve_disease(plant, self.prediction.disease_name1, self.prediction.disease_name2, self.db)
+        if not resolution:
+            print(f'확인되지 않는 질병: {self.prediction.disease_name1}')
+            raise HTTPException(status_code=404, detail="확인되지 않는 질병입니다")
+        self.resolution = resolution
+        return resolution
+
+    def persist(self) -> DiagnosisResult:
+        # wonjun-plan
+        # is_approved는 추후 승인과정이 생기면 변경해야함
+        diagnosis_result: DiagnosisResult = DiagnosisResult.create(
+            CreateDiagnosisResultRequest(
+                user_id=self.user_id,
+                img_url=self.uploaded_img_info.image_url,
+                is_approved=False,
+                percent1=to_percent(self.prediction.prob1),
+                percent2=to_percent(self.prediction.prob2),
+                disease_code1=self.resolution.disease_code1,
+                disease_code2=self.resolution.disease_code2,
+                disease_id1=self.resolution.disease_id1,
+                disease_id2=self.resolution.disease_id2
+            )
+        )
+        self.diagnosis_result = self.diagnosis_result_repo.save_diagnosis_result(diagnosis_result)
+        self.persist_embedding()
+        return self.diagnosis_result
+
+    def persist_embedding(self) -> None:
+        # 유사 사례 검색용 임베딩 저장, 실패해도 진단 결과에는 영향 없음
+        if not config.SIMILAR_CASES_ENABLED:
+            return
+        if self.prediction.embedding is None:
+            if self.prediction.from_cascade:
+                task = asyncio.create_task(backfill_embedding(self.diagnosis_result.result_id, self.plant,
+                                                              self.image_bytes))
+                _embedding_tasks.add(task)
+                task.add_done_callback(_embedding_tasks.discard)
+            return
+        try:
+            DiagnosisEmbeddingRepository(session=self.db).save_embedding(DiagnosisEmbedding.create(
+                result_id=self.diagnosis_result.result_id,
+                crop=self.plant,
+                model_version=model_registry.get_version(self.plant),
+                embedding=self.prediction.embedding
+            ))
+        except Exception as ex:
+            print('진단 임베딩 저장 실패', ex)
+            self.db.rollback()
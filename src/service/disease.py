@@ -1,44 +1,85 @@
 # coding=utf-8
 # 위에 utf 표시 안하면 오류남 => api/disease 에선 안 났는데 왜인지 모르겠음
 # 질병정보 관련 외부 API 요청등의 유틸함수 모음
-from typing import Optional
+import asyncio
+from typing import Any, Dict, Optional
 
-import requests
+import config
 from database.connection import get_db
 from database.repository import DiseaseRepository
 from fastapi import HTTPException, Depends
+from pydantic import BaseModel
 from schema.response import ClassificationResultSchema
+from service.cache import SingleFlight
+from service.ncpms_cache import ncpms_cache, make_cache_key
+from service.ncpms_client import ncpms_client
 from sqlalchemy.orm import Session
 
-ncpms_service_url = 'http://ncpms.rda.go.kr/npmsAPI/service?apiKey=2023e65d3f3a1856c7ebec0195585bdcd581'
 
+# 여러 요청에서 동시에 같은 NCPMS 조회를 하면 원격 호출(또는 캐시 조회) 한 번의 결과를 같이 사용
+ncpms_single_flight = SingleFlight()
+
+
+async def ncpms_get(params: Dict[str, Any]) -> dict:
+    # NCPMS API 응답 json 의 'service' 부분
+    return await ncpms_single_flight.do(make_cache_key(params), lambda: _ncpms_get(params))
+
+
+async def _ncpms_get(params: Dict[str, Any]) -> dict:
+    # 같은 요청은 캐시(메모리 -> SQLite)에서 반환, 오래된 응답은 반환 후 백그라운드에서 갱신
+    if not config.NCPMS_CACHE_ENABLED:
+        return await ncpms_client.get(params)
+    return await ncpms_cache.get(params, lambda: ncpms_client.get(params))
 
-def get_ClassificationResultSchema_from_NCPMS_API(plantName:str, disease_name: str | None)-> ClassificationResultSchema | None:
-    # [요청1]
-    url1 = f"{ncpms_service_url}&serviceCode=SVC01&serviceType=AA003&cropName={plantName}"
-    response1 = requests.get(url1)
-    if len(response1.json()['service']['list']) < 1:
-        raise HTTPException(status_code=404, detail="잘못된 작물명이 사용되었습니다.")
-    else:
-        url1 = f"{ncpms_service_url}&serviceCode=SVC01&serviceType=AA003&cropName={plantName}&sickNameKor={disease_name}"
-        response1 = requests.get(url1)
 
-        if len(response1.json()['service']['list']) < 1:
-            # raise HTTPException(status_code=404, detail=f"해당 병에 대한 정보가 없습니다. 분류된 질병명: {disease_name}")
-            return
-    sickKey = response1.json()['service']['list'][0]['sickKey']  # sickKey 추출
+class NcpmsResolver:
+    # 요청 하나 안에서 같은 NCPMS 조회는 한 번만 수행 (요청마다 새로 생성해서 사용)
+    # 진단 한 번에 작물 확인(SVC01) 을 질병마다 반복하거나 같은 질병을 다시 검색하던 호출을 합침
+    def __init__(self):
+        self._memo: Dict[str, asyncio.Future] = {}
+
+    async def get(self, params: Dict[str, Any]) -> dict:
+        key = make_cache_key(params)
+        task = self._memo.get(key)
+        if task is None:
+            task = asyncio.ensure_future(ncpms_get(params))
+            self._memo[key] = task
+        return await asyncio.shield(task)
+
+    async def find_sick(self, plantName: str, disease_name: str | None) -> Optional[dict]:
+        # 작물의 질병 검색 결과 첫 항목 (sickKey, thumbImg 등), 없는 질병이면 None
+        # 작물명 확인과 질병 검색은 서로 의존하지 않으므로 동시에 요청
+        crop_service, service1 = await asyncio.gather(
+            self.get({'serviceCode': 'SVC01', 'serviceType': 'AA003', 'cropName': plantName}),
+            self.get({'serviceCode': 'SVC01', 'serviceType': 'AA003', 'cropName': plantName,
+                      'sickNameKor': disease_name})
+        )
+        if len(crop_service['list']) < 1:
+            raise HTTPException(status_code=404, detail="잘못된 작물명이 사용되었습니다.")
+        if len(service1['list']) < 1:
+            return None
+        return service1['list'][0]
+
+
+async def get_ClassificationResultSchema_from_NCPMS_API(plantName:str, disease_name: str | None,
+                                                        resolver: Optional[NcpmsResolver] = None)-> ClassificationResultSchema | None:
+    resolver = resolver or NcpmsResolver()
+    # [요청1]
+    sick = await resolver.find_sick(plantName, disease_name)
+    if sick is None:
+        # raise HTTPException(status_code=404, detail=f"해당 병에 대한 정보가 없습니다. 분류된 질병명: {disease_name}")
+        return
+    sickKey = sick['sickKey']  # sickKey 추출
 
     # [요청2]
-    url2 = f"{ncpms_service_url}&serviceCode=SVC05&sickKey={sickKey}"
-    response2 = requests.get(url2)
-    data2 = response2.json()['service']
+    data2 = await resolver.get({'serviceCode': 'SVC05', 'sickKey': sickKey})
 
     # data2에서 필요한 정보 추출
     diseaseName = data2['sickNameKor']
     condition = data2['developmentCondition']
     symptoms = data2['symptoms']
     preventionMethod = data2['preventionMethod']
-    diseaseImg = response1.json()['service']['list'][0]['thumbImg']
+    diseaseImg = sick['thumbImg']
     plant_name = data2['cropName']
 
     data = {
@@ -53,13 +94,13 @@ def get_ClassificationResultSchema_from_NCPMS_API(plantName:str, disease_name: s
 
     return result
 
-def get_ClassificationResultSchema_from_NCPMS_API_by_code(disease_code:str)->ClassificationResultSchema:
+async def get_ClassificationResultSchema_from_NCPMS_API_by_code(disease_code:str,
+                                                                resolver: Optional[NcpmsResolver] = None)->ClassificationResultSchema:
+    resolver = resolver or NcpmsResolver()
 
     sickKey = disease_code
 
-    url2 = f"{ncpms_service_url}&serviceCode=SVC05&sickKey={sickKey}"
-    response2 = requests.get(url2)
-    data2 = response2.json()['service']
+    data2 = await resolver.get({'serviceCode': 'SVC05', 'sickKey': sickKey})
 
     # data2에서 필요한 정보 추출
     diseaseName = data2['sickNameKor']
@@ -82,23 +123,18 @@ def get_ClassificationResultSchema_from_NCPMS_API_by_code(disease_code:str)->Cla
 
     return result
 
-def get_disease_id_from_NCPMS_API(plantName:str, disease_name: str | None)->str:
+async def get_disease_id_from_NCPMS_API(plantName:str, disease_name: str | None,
+                                        resolver: Optional[NcpmsResolver] = None)->str:
+    resolver = resolver or NcpmsResolver()
 
     if disease_name == '정상':
         todo = 1
 
-    url1 = f"{ncpms_service_url}&serviceCode=SVC01&serviceType=AA003&cropName={plantName}"
-    response1 = requests.get(url1)
-    if len(response1.json()['service']['list']) < 1:
-        raise HTTPException(status_code=404, detail="잘못된 작물명이 사용되었습니다.")
-    else:
-        url1 = f"{ncpms_service_url}&serviceCode=SVC01&serviceType=AA003&cropName={plantName}&sickNameKor={disease_name}"
-        response1 = requests.get(url1)
-
-        if len(response1.json()['service']['list']) < 1:
-            # raise HTTPException(status_code=404, detail="해당 병에 대한 정보가 없습니다.")
-            return ''
-    sickKey = response1.json()['service']['list'][0]['sickKey']  # sickKey 추출
+    sick = await resolver.find_sick(plantName, disease_name)
+    if sick is None:
+        # raise HTTPException(status_code=404, detail="해당 병에 대한 정보가 없습니다.")
+        return ''
+    sickKey = sick['sickKey']  # sickKey 추출
 
     return sickKey
 
@@ -160,3 +196,47 @@ def get_disease_id_from_DB(plantName: str, disease_name: str, db: Session = Depe
     else:
         # 검색 결과가 없을 경우 None 반환
         return
+
+
+
+class DiseaseResolution(BaseModel):
+    # 분류 결과 질병명을 실제 질병 정보로 바꾼 결과
+    # DB에 있는 질병이면 disease_id 와 disease_code 가 같고, NCPMS 질병이면 disease_code 만 있음 (sickKey)
+    result: ClassificationResultSchema
+    disease_id1: Optional[str]
+    disease_id2: Optional[str]
+    disease_code1: Optional[str]
+    disease_code2: Optional[str]
+
+
+async def resolve_disease(plantName: str, disease_name1: str, disease_name2: str, db: Session) -> Optional[DiseaseResolution]:
+    # 우리 서버 DB에서 먼저 찾고, 없으면 NCPMS에서 조회
+    # 어디에서도 확인되지 않는 질병이면 None 반환
+    result = get_disease_info_from_DB_by_name(plantName, disease_name1, db)
+    if result:
+        disease_id1 = get_disease_id_from_DB(plantName, disease_name1, db)
+        disease_id2 = get_disease_id_from_DB(plantName, disease_name2, db)
+        return DiseaseResolution(
+            result=result,
+            disease_id1=disease_id1,
+            disease_id2=disease_id2,
+            disease_code1=disease_id1,
+            disease_code2=disease_id2
+        )
+
+    # 1순위 질병의 검색 결과는 질병 정보 조회와 질병 코드 조회에서 같이 사용 (NCPMS 호출 최대 4번)
+    resolver = NcpmsResolver()
+    result = await get_ClassificationResultSchema_from_NCPMS_API(plantName, disease_name1, resolver)
+    if not result:
+        return None
+    disease_code1, disease_code2 = await asyncio.gather(
+        get_disease_id_from_NCPMS_API(plantName, disease_name1, resolver),
+        get_disease_id_from_NCPMS_API(plantName, disease_name2, resolver)
+    )
+    return DiseaseResolution(
+        result=result,
+        disease_id1=None,
+        disease_id2=None,
+        disease_code1=disease_code1,
+        disease_code2=disease_code2
+    )
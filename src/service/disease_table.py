@@ -0,0 +1,195 @@
+# 분류 결과 (작물, 클래스명) -> 질병 정보 매핑 테이블
+# 분류 모델의 클래스는 작물별로 고정되어 있으므로 서버 시작시 resolve_disease 와 같은 순서(DB -> NCPMS)로
+# 모든 클래스를 미리 확인해두고, 진단 요청은 dict 조회만으로 질병 정보를 채움
+# - 시작시 확인하지 못한 클래스(NCPMS 오류 등)는 요청시 기존 조회 경로(resolve_disease) 사용
+# - DISEASE_TABLE_REFRESH_SECONDS 가 지나면 조회 후 백그라운드에서 다시 만듦 (NCPMS 동기화 결과 반영)
+import asyncio
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import config
+from database.connection import SessionFactory
+from database.repository import DiseaseRepository
+from pydantic import BaseModel
+from schema.response import ClassificationResultSchema
+from service.disease import DiseaseResolution, NcpmsResolver, get_ClassificationResultSchema_from_NCPMS_API, \
+    get_disease_id_from_NCPMS_API
+
+
+class DiseaseTableStats(BaseModel):
+    enabled: bool
+    label_count: int
+    # 확인하지 못해서 요청시 기존 경로로 조회하는 '작물/클래스명'
+    unresolved: List[str]
+    loaded_time: Optional[datetime]
+    hit_count: int
+    miss_count: int
+
+
+class _ResolvedLabel:
+    def __init__(self, result: Optional[ClassificationResultSchema], disease_id: Optional[str],
+                 sick_key: Optional[str]):
+        # DB 또는 NCPMS 질병 정보, 어디에도 없는 질병이면 None
+        self.result = result
+        # DB 질병 id, DB에 없으면 None
+        self.disease_id = disease_id
+        # NCPMS sickKey, DB에서 찾아서 NCPMS 를 조회하지 않았으면 None, NCPMS 에도 없으면 ''
+        self.sick_key = sick_key
+
+
+class DiseaseTable:
+    def __init__(self, enabled: bool, refresh_seconds: float):
+        self.enabled = enabled
+        self.refresh_seconds = refresh_seconds
+        self._labels: Dict[Tuple[str, str], _ResolvedLabel] = {}
+        self._crop_classes: Dict[str, List[str]] = {}
+        self._unresolved: List[str] = []
+        self._loaded_at: Optional[float] = None
+        self._loaded_time: Optional[datetime] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self._hit_count = 0
+        self._miss_count = 0
+
+    def _load_from_db(self, crop_classes: Dict[str, List[str]]) -> Dict[Tuple[str, str], _ResolvedLabel]:
+        session = SessionFactory()
+        try:
+            disease_repository = DiseaseRepository(session=session)
+            labels = {}
+            for crop, class_names in crop_classes.items():
+                for class_name in class_names:
+                    disease = disease_repository.get_disease_by_plant_and_disease_name(crop, class_name)
+                    if disease is None:
+                        continue
+                    labels[(crop, class_name)] = _ResolvedLabel(
+                        result=ClassificationResultSchema(
+                            diseaseName=disease.kor_name,
+                            condition=disease.environment,
+                            symptoms=disease.description,
+                            preventionMethod=disease.solution,
+                            diseaseImg=disease.img_url,
+                            plant_name=crop
+                        ),
+                        disease_id=disease.disease_id,
+                        sick_key=None
+                    )
+            return labels
+        finally:
+            session.close()
+
+    async def _load_from_ncpms(self, crop: str, class_name: str, resolver: NcpmsResolver) -> _ResolvedLabel:
+        # 같은 resolver 를 쓰므로 질병 정보와 sickKey 조회에서 같은 검색 결과를 사용
+        result = await get_ClassificationResultSchema_from_NCPMS_API(crop, class_name, resolver)
+        sick_key = await get_disease_id_from_NCPMS_API(crop, class_name, resolver)
+        return _ResolvedLabel(result=result, disease_id=None, sick_key=sick_key)
+
+    async def load(self, crop_classes: Dict[str, List[str]]) -> None:
+        # DB 조회는 이벤트 루프 밖에서, DB에 없는 클래스만 작물별로 NCPMS 에서 동시에 조회
+        labels = await asyncio.to_thread(self._load_from_db, crop_classes)
+        missing = [(crop, class_name) for crop, class_names in crop_classes.items()
+                   for class_name in class_names if (crop, class_name) not in labels]
+        resolvers = {crop: NcpmsResolver() for crop in crop_classes}
+        resolved = await asyncio.gather(*[self._load_from_ncpms(crop, class_name, resolvers[crop])
+                                          for crop, class_name in missing], return_exceptions=True)
+        unresolved = []
+        for key, label in zip(missing, resolved):
+            if isinstance(label, BaseException):
+                print(f'질병 매핑 실패: {key[0]}/{key[1]}', label)
+                unresolved.append(f'{key[0]}/{key[1]}')
+                continue
+            labels[key] = label
+
+        self._labels = labels
+        self._crop_classes = crop_classes
+        self._unresolved = unresolved
+        self._loaded_at = time.monotonic()
+        self._loaded_time = datetime.now()
+
+    async def _refresh(self) -> None:
+        try:
+            await self.load(self._crop_classes)
+        except Exception as ex:
+            print('질병 매핑 테이블 갱신 실패', ex)
+            # 실패해도 다음 갱신 주기까지는 이전 테이블 사용
+            self._loaded_at = time.monotonic()
+
+    def _schedule_refresh(self) -> None:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        self._refresh_task = asyncio.create_task(self._refresh())
+
+    def _lookup(self, plant: str, disease_name1: str, disease_name2: str) -> Optional[DiseaseResolution]:
+        # resolve_disease 결과와 같은 값을 만들 수 있을 때만 반환
+        label1 = self._labels.get((plant, disease_name1))
+        label2 = self._labels.get((plant, disease_name2))
+        if label1 is None or label1.result is None or label2 is None:
+            return None
+        if label1.disease_id:
+            # DB 질병: 2순위도 DB id 로 기록
+            return DiseaseResolution(
+                result=label1.result,
+                disease_id1=label1.disease_id,
+                disease_id2=label2.disease_id,
+                disease_code1=label1.disease_id,
+                disease_code2=label2.disease_id
+            )
+        if label2.sick_key is None:
+            # NCPMS 질병인데 2순위는 DB에서만 확인해서 sickKey 를 모름
+            return None
+        return DiseaseResolution(
+            result=label1.result,
+            disease_id1=None,
+            disease_id2=None,
+            disease_code1=label1.sick_key,
+            disease_code2=label2.sick_key
+        )
+
+    def get_codes(self, plant: str, disease_name1: str,
+                  disease_name2: str) -> Optional[Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]]:
+        # 질병 정보 없이 진단기록에 남길 (disease_id1, disease_id2, disease_code1, disease_code2) 만 반환
+        # (_lookup 과 같은 규칙, 1순위의 code 를 모르면 None)
+        label1 = self._labels.get((plant, disease_name1))
+        label2 = self._labels.get((plant, disease_name2))
+        if label1 is None:
+            return None
+        if label1.disease_id:
+            disease_id2 = label2.disease_id if label2 else None
+            return label1.disease_id, disease_id2, label1.disease_id, disease_id2
+        if not label1.sick_key:
+            return None
+        return None, None, label1.sick_key, label2.sick_key if label2 else None
+
+    def resolve(self, plant: str, disease_name1: str, disease_name2: str) -> Optional[DiseaseResolution]:
+        # 테이블에 있으면 질병 정보 반환, 없으면 None (기존 조회 경로 사용)
+        if not self.enabled:
+            return None
+        resolution = self._lookup(plant, disease_name1, disease_name2)
+        with self._lock:
+            if resolution:
+                self._hit_count += 1
+            else:
+                self._miss_count += 1
+        self._schedule_refresh()
+        return resolution
+
+    def shutdown(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+
+    def stats(self) -> DiseaseTableStats:
+        with self._lock:
+            return DiseaseTableStats(
+                enabled=self.enabled,
+                label_count=len(self._labels),
+                unresolved=list(self._unresolved),
+                loaded_time=self._loaded_time,
+                hit_count=self._hit_count,
+                miss_count=self._miss_count
+            )
+
+
+disease_table = DiseaseTable(config.DISEASE_TABLE_ENABLED, config.DISEASE_TABLE_REFRESH_SECONDS)
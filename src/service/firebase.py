@@ -1,4 +1,5 @@
 # coding=utf-8
+import asyncio
 import datetime
 import io
 from typing import Optional
@@ -37,23 +38,38 @@ async def upload_image_to_firebase_storage(image_file: UploadFile, prefix: Optio
     # 이미지 파일 스트림의 offset을 0으로 초기화
     await image_file.seek(0)
 
+    return await upload_image_bytes_to_firebase_storage(
+        image_stream, image_file.filename, image_file.content_type, prefix
+    )
+
+
+async def upload_image_bytes_to_firebase_storage(image_stream: bytes, original_filename: str, content_type: str,
+                                                 prefix: Optional[str] = '') -> FirebaseStorageSchema:
+    # 이미 읽어둔 이미지 바이트를 업로드
+    # upload_from_string / make_public 은 블로킹 호출이므로 별도 스레드에서 실행
+    # -> 이벤트 루프를 막지 않고 추론 등 다른 작업과 동시에 진행됨
+    return await asyncio.to_thread(_upload_image_bytes, image_stream, original_filename, content_type, prefix)
+
+
+def _upload_image_bytes(image_stream: bytes, original_filename: str, content_type: str,
+                        prefix: Optional[str] = '') -> FirebaseStorageSchema:
     # 허용하는 이미지 MIME 타입들
     allowed_content_types = ["image/jpeg", "image/png", "image/gif"]
 
     try:
         # 업로드된 파일의 MIME 타입이 허용하는 목록에 없다면, 오류 메시지를 반환
-        if image_file.content_type not in allowed_content_types:
-            raise ValueError(f"Unsupported image type: {image_file.content_type}")
+        if content_type not in allowed_content_types:
+            raise ValueError(f"Unsupported image type: {content_type}")
 
         # Firebase Storage에 저장할 파일명 생성 (UUID 사용)
-        filename = f"{prefix}-{uuid.uuid4()}-{image_file.filename}"
+        filename = f"{prefix}-{uuid.uuid4()}-{original_filename}"
 
         # Firebase Storage 경로 설정
         bucket = storage.bucket()
         blob = bucket.blob(filename)
 
         # 파일을 Firebase Storage에 업로드
-        blob.upload_from_string(image_stream, content_type=image_file.content_type)
+        blob.upload_from_string(image_stream, content_type=content_type)
 
         # 파일을 공개적으로 접근 가능하게 설정
         blob.make_public()
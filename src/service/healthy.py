@@ -0,0 +1,93 @@
+# 정상 판정 fast path
+# 보조 head(fc2) 와 분류 head 가 모두 정상으로 확신한 진단은 질병 조회(DB/NCPMS) 없이
+# 미리 만들어둔 고정 정상 응답을 그대로 사용
+# 진단기록에 남길 질병 id/code 만 질병 매핑 테이블(disease_table, 메모리)에서 채움
+import threading
+from typing import Dict, List, Optional
+
+import config
+from model.crops import load_crop_registry
+from pydantic import BaseModel
+from schema.response import ClassificationResultSchema
+from service.disease import DiseaseResolution
+from service.disease_table import disease_table
+
+HEALTHY_DISEASE_NAME = '정상'
+
+
+class HealthyFastPathStats(BaseModel):
+    enabled: bool
+    threshold: float
+    # 정상 응답을 바로 쓸 수 있는 작물
+    # (매핑 테이블에 정상의 id/code 가 없으면 진단기록을 남길 수 없으므로 기존 조회 경로 사용)
+    loaded_crops: List[str]
+    checked_count: int
+    fast_path_count: int
+    fast_path_rate: float
+
+
+class HealthyFastPath:
+    def __init__(self, enabled: bool, threshold: float, crops: List[str]):
+        self.enabled = enabled
+        self.threshold = threshold
+        # 작물별 고정 정상 응답
+        self._responses: Dict[str, ClassificationResultSchema] = {
+            crop: ClassificationResultSchema(
+                diseaseName=HEALTHY_DISEASE_NAME,
+                condition='',
+                symptoms='',
+                preventionMethod='',
+                diseaseImg='',
+                plant_name=crop
+            )
+            for crop in crops
+        }
+        self._lock = threading.Lock()
+        self._checked_count = 0
+        self._fast_path_count = 0
+
+    def is_confident(self, prediction) -> bool:
+        # prediction 은 PredictionResult, 보조 head 가 없는 모델은 항상 False
+        return (prediction.disease_name1 == HEALTHY_DISEASE_NAME
+                and prediction.healthy_prob is not None
+                and prediction.healthy_prob >= self.threshold)
+
+    def resolve(self, plant: str, prediction) -> Optional[DiseaseResolution]:
+        # 확신하는 정상 판정이면 고정 정상 응답 반환, 아니면 None (기존 조회 경로 사용)
+        if not self.enabled:
+            return None
+        resolution = None
+        response = self._responses.get(plant)
+        if response is not None and self.is_confident(prediction):
+            codes = disease_table.get_codes(plant, HEALTHY_DISEASE_NAME, prediction.disease_name2)
+            if codes is not None:
+                disease_id1, disease_id2, disease_code1, disease_code2 = codes
+                resolution = DiseaseResolution(
+                    result=response,
+                    disease_id1=disease_id1,
+                    disease_id2=disease_id2,
+                    disease_code1=disease_code1,
+                    disease_code2=disease_code2
+                )
+        with self._lock:
+            self._checked_count += 1
+            if resolution:
+                self._fast_path_count += 1
+        return resolution
+
+    def stats(self) -> HealthyFastPathStats:
+        with self._lock:
+            return HealthyFastPathStats(
+                enabled=self.enabled,
+                threshold=self.threshold,
+                loaded_crops=[crop for crop in self._responses
+                              if disease_table.get_codes(crop, HEALTHY_DISEASE_NAME, HEALTHY_DISEASE_NAME)],
+                checked_count=self._checked_count,
+                fast_path_count=self._fast_path_count,
+                fast_path_rate=self._fast_path_count / self._checked_count if self._checked_count else 0.0
+            )
+
+
+# 모델을 로드하지 않도록 작물 목록은 매니페스트에서 직접 읽음
+healthy_fast_path = HealthyFastPath(config.HEALTHY_FAST_PATH_ENABLED, config.HEALTHY_FAST_PATH_THRESHOLD,
+                                    load_crop_registry(config.CROP_MANIFEST_PATH).names)
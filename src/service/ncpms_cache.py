@@ -0,0 +1,201 @@
+# NCPMS API 응답 캐시 (프로세스 내 LRU -> SQLite 파일 순서로 조회)
+# 키는 서비스 코드와 요청 파라미터(apiKey 제외), 값은 응답 json 의 'service' 부분
+# - 저장된 지 ttl 이내: 그대로 반환
+# - ttl 이 지났으면: 이전 응답을 바로 반환하고 백그라운드에서 다시 조회 (stale-while-revalidate)
+# - 캐시에 없거나 max_stale 도 지났으면: 원격 API 를 기다려서 조회, 실패하면 남아있는 이전 응답이라도 반환
+# SQLite 파일은 같은 서버의 워커 프로세스끼리 공유됨 (WAL 모드), 파일 읽기/쓰기는 이벤트 루프 밖에서 실행
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import config
+from pydantic import BaseModel
+from service.cache import LRUCache
+
+class NcpmsCacheStats(BaseModel):
+    memory_size: int
+    memory_max_size: int
+    ttl_seconds: float
+    max_stale_seconds: float
+    memory_hit_count: int
+    disk_hit_count: int
+    # 캐시에 없거나 너무 오래되어 원격 API 응답을 기다린 횟수
+    remote_fetch_count: int
+    # ttl 이 지난 응답을 반환하고 백그라운드에서 갱신한 횟수
+    stale_hit_count: int
+    refresh_count: int
+    refresh_error_count: int
+    # SQLite 저장 실패 횟수 (여러 워커가 같은 파일에 쓰다가 잠긴 경우 등), 실패해도 응답은 그대로 반환
+    disk_write_error_count: int
+
+
+def make_cache_key(params: Dict[str, Any]) -> str:
+    return json.dumps(params, sort_keys=True, ensure_ascii=False)
+
+
+class NcpmsCache:
+    def __init__(self, path: str, memory_size: int, ttl_seconds: float, max_stale_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        # 0 이하면 오래된 응답도 항상 반환 (원격 API 는 백그라운드에서만 호출)
+        self.max_stale_seconds = max_stale_seconds
+        # 메모리 캐시는 신선도와 관계없이 크기로만 관리 (값에 저장 시각을 같이 보관)
+        self._memory = LRUCache(max_size=memory_size, ttl_seconds=0)
+        self._connection: Optional[sqlite3.Connection] = None
+        # SQLite 연결은 워커 스레드에서만 사용 (조회/commit 동안 이벤트 루프의 카운터 잠금을 막지 않도록 잠금 분리)
+        self._db_lock = threading.Lock()
+        # 이벤트 루프에서 잡는 잠금, 메모리 상태(카운터, 갱신중인 키)에만 사용
+        self._lock = threading.Lock()
+        # 갱신중인 키 (같은 키를 동시에 여러 번 갱신하지 않도록)
+        self._refreshing = set()
+        # 실행중인 백그라운드 갱신 작업 참조 (완료 전에 GC 되지 않도록)
+        self._refresh_tasks = set()
+        self._memory_hit_count = 0
+        self._disk_hit_count = 0
+        self._remote_fetch_count = 0
+        self._stale_hit_count = 0
+        self._refresh_count = 0
+        self._refresh_error_count = 0
+        self._disk_write_error_count = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # 첫 사용시 연결 (import 만으로 파일이 생기지 않도록), self._db_lock 안에서 호출
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS ncpms_cache ('
+                'cache_key TEXT PRIMARY KEY, service_code TEXT, payload TEXT NOT NULL, stored_time REAL NOT NULL)'
+            )
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, Any]]:
+        with self._db_lock:
+            row = self._connect().execute(
+                'SELECT stored_time, payload FROM ncpms_cache WHERE cache_key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _write_disk(self, key: str, service_code: Optional[str], entry: Tuple[float, Any]) -> None:
+        with self._db_lock:
+            connection = self._connect()
+            connection.execute(
+                'INSERT OR REPLACE INTO ncpms_cache (cache_key, service_code, payload, stored_time) VALUES (?, ?, ?, ?)',
+                (key, service_code, json.dumps(entry[1], ensure_ascii=False), entry[0])
+            )
+            connection.commit()
+
+    async def _write(self, key: str, service_code: Optional[str], payload: Any) -> None:
+        # 원격 API 응답은 이미 받았으므로 파일 저장에 실패해도 메모리 캐시만 쓰고 계속 진행
+        entry = (time.time(), payload)
+        self._memory.put(key, entry)
+        try:
+            await asyncio.to_thread(self._write_disk, key, service_code, entry)
+        except Exception as ex:
+            print(f'NCPMS 캐시 저장 실패: {key}', ex)
+            with self._lock:
+                self._disk_write_error_count += 1
+
+    async def _lookup(self, key: str) -> Optional[Tuple[float, Any]]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            with self._lock:
+                self._memory_hit_count += 1
+            return entry
+        entry = await asyncio.to_thread(self._read_disk, key)
+        if entry is not None:
+            self._memory.put(key, entry)
+            with self._lock:
+                self._disk_hit_count += 1
+        return entry
+
+    async def _refresh(self, key: str, service_code: Optional[str], fetch: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            await self._write(key, service_code, await fetch())
+            with self._lock:
+                self._refresh_count += 1
+        except Exception as ex:
+            print(f'NCPMS 캐시 갱신 실패: {key}', ex)
+            with self._lock:
+                self._refresh_error_count += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _schedule_refresh(self, key: str, service_code: Optional[str], fetch: Callable[[], Awaitable[Any]]) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        task = asyncio.create_task(self._refresh(key, service_code, fetch))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def get(self, params: Dict[str, Any], fetch: Callable[[], Awaitable[Any]]) -> Any:
+        # fetch 는 원격 API 를 호출해서 params 에 대한 응답을 반환하는 코루틴 함수
+        key = make_cache_key(params)
+        service_code = params.get('serviceCode')
+        entry = await self._lookup(key)
+        if entry is not None:
+            stored_time, payload = entry
+            age = time.time() - stored_time
+            if age <= self.ttl_seconds:
+                return payload
+            if self.max_stale_seconds <= 0 or age <= self.ttl_seconds + self.max_stale_seconds:
+                with self._lock:
+                    self._stale_hit_count += 1
+                self._schedule_refresh(key, service_code, fetch)
+                return payload
+
+        with self._lock:
+            self._remote_fetch_count += 1
+        try:
+            payload = await fetch()
+        except Exception:
+            if entry is not None:
+                print(f'NCPMS 조회 실패, 이전 응답 사용: {key}')
+                return entry[1]
+            raise
+        await self._write(key, service_code, payload)
+        return payload
+
+    def shutdown(self) -> None:
+        for task in list(self._refresh_tasks):
+            task.cancel()
+        with self._db_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def stats(self) -> NcpmsCacheStats:
+        with self._lock:
+            return NcpmsCacheStats(
+                memory_size=len(self._memory),
+                memory_max_size=self._memory.max_size,
+                ttl_seconds=self.ttl_seconds,
+                max_stale_seconds=self.max_stale_seconds,
+                memory_hit_count=self._memory_hit_count,
+                disk_hit_count=self._disk_hit_count,
+                remote_fetch_count=self._remote_fetch_count,
+                stale_hit_count=self._stale_hit_count,
+                refresh_count=self._refresh_count,
+                refresh_error_count=self._refresh_error_count,
+                disk_write_error_count=self._disk_write_error_count
+            )
+
+
+ncpms_cache = NcpmsCache(
+    path=config.NCPMS_CACHE_PATH,
+    memory_size=config.NCPMS_CACHE_MEMORY_SIZE,
+    ttl_seconds=config.NCPMS_CACHE_TTL_SECONDS,
+    max_stale_seconds=config.NCPMS_CACHE_MAX_STALE_SECONDS
+)
@@ -0,0 +1,141 @@
+# NCPMS API 비동기 클라이언트
+# - 워커마다 하나의 httpx.AsyncClient 로 연결을 재사용 (keep-alive)
+# - 호출마다 timeout, 워커 전체 동시 요청 수 제한 (NCPMS 가 느려져도 요청이 무한히 쌓이지 않도록)
+# - 연결 실패/timeout/5xx/429 는 지수 백오프 + jitter 로 재시도
+import asyncio
+import random
+from typing import Any, Dict, Optional
+
+import httpx
+from pydantic import BaseModel
+
+import config
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class NcpmsClientStats(BaseModel):
+    max_in_flight: int
+    in_flight: int
+    request_count: int
+    retry_count: int
+    timeout_count: int
+    error_count: int
+
+
+class NcpmsClient:
+    def __init__(self, service_url: str, api_key: str, timeout_seconds: float, max_in_flight: int,
+                 max_retries: int, backoff_seconds: float):
+        self.service_url = service_url
+        self.api_key = api_key
+        self.timeout_seconds = timeout_seconds
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        # 이벤트 루프에 묶이므로 첫 호출시 생성 (루프가 바뀌면 다시 생성)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 루프가 바뀌어 교체된 이전 클라이언트를 닫는 작업 참조 (완료 전에 GC 되지 않도록)
+        self._close_tasks = set()
+        self._in_flight = 0
+        self._request_count = 0
+        self._retry_count = 0
+        self._timeout_count = 0
+        self._error_count = 0
+
+    async def _close_stale(self, client: httpx.AsyncClient) -> None:
+        try:
+            await client.aclose()
+        except Exception as ex:
+            # 이전 루프에 묶인 연결은 이미 끊겼을 수 있음
+            print('이전 NCPMS 클라이언트 종료 실패', ex)
+
+    def _close_previous(self) -> None:
+        # 교체되는 클라이언트의 연결 풀을 닫음
+        # 이전 루프가 다른 스레드에서 아직 실행중이면 그 루프에서, 이미 끝났으면 현재 루프에서 닫음
+        client, loop = self._client, self._loop
+        if client is None:
+            return
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._close_stale(client), loop)
+            return
+        task = asyncio.create_task(self._close_stale(client))
+        self._close_tasks.add(task)
+        task.add_done_callback(self._close_tasks.discard)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._close_previous()
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout_seconds,
+                limits=httpx.Limits(max_connections=self.max_in_flight,
+                                    max_keepalive_connections=self.max_in_flight)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._loop = loop
+        return self._client
+
+    async def _request(self, client: httpx.AsyncClient, params: Dict[str, Any]) -> httpx.Response:
+        async with self._semaphore:
+            self._in_flight += 1
+            self._request_count += 1
+            try:
+                return await client.get(self.service_url, params={'apiKey': self.api_key, **params})
+            finally:
+                self._in_flight -= 1
+
+    async def get(self, params: Dict[str, Any]) -> dict:
+        # NCPMS API 응답 json 의 'service' 부분
+        client = self._get_client()
+        attempt = 0
+        while True:
+            try:
+                response = await self._request(client, params)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response.json()['service']
+                error: Exception = httpx.HTTPStatusError(f'NCPMS 응답 코드 {response.status_code}',
+                                                         request=response.request, response=response)
+            except httpx.HTTPStatusError:
+                # 재시도해도 같은 결과인 4xx 응답
+                self._error_count += 1
+                raise
+            except httpx.TimeoutException as ex:
+                self._timeout_count += 1
+                error = ex
+            except httpx.TransportError as ex:
+                error = ex
+            if attempt >= self.max_retries:
+                self._error_count += 1
+                raise error
+            # full jitter: 0 ~ backoff * 2^attempt 사이에서 임의로 대기
+            attempt += 1
+            self._retry_count += 1
+            await asyncio.sleep(random.uniform(0, self.backoff_seconds * 2 ** (attempt - 1)))
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> NcpmsClientStats:
+        return NcpmsClientStats(
+            max_in_flight=self.max_in_flight,
+            in_flight=self._in_flight,
+            request_count=self._request_count,
+            retry_count=self._retry_count,
+            timeout_count=self._timeout_count,
+            error_count=self._error_count
+        )
+
+
+ncpms_client = NcpmsClient(
+    service_url=config.NCPMS_SERVICE_URL,
+    api_key=config.NCPMS_API_KEY,
+    timeout_seconds=config.NCPMS_REQUEST_TIMEOUT_SECONDS,
+    max_in_flight=config.NCPMS_MAX_IN_FLIGHT,
+    max_retries=config.NCPMS_MAX_RETRIES,
+    backoff_seconds=config.NCPMS_RETRY_BACKOFF_SECONDS
+)
@@ -0,0 +1,203 @@
+# NCPMS 질병 정보를 Disease 테이블로 동기화하는 배치 작업
+# 진단/진단기록 요청은 Disease 테이블(작물, 질병명 index)에서 먼저 찾으므로, 미리 동기화해두면 NCPMS 를 기다리지 않음
+# - 작물별 질병 목록(SVC01)을 페이지 단위로 모두 가져오고 질병마다 상세 정보(SVC05)를 조회해서 한 번의 commit 으로 저장
+# - disease_id 는 NCPMS sickKey (NCPMS 로 확인된 진단기록의 disease_code 와 같은 값)
+# - 작물별 마지막 동기화 시각을 NcpmsSyncState 에 기록
+#   증분 실행(기본): 마지막 동기화 후 NCPMS_SYNC_INTERVAL_SECONDS 가 지난 작물만, DB에 없는 질병의 상세 정보만 조회
+#   전체 실행(--full): 모든 작물의 모든 질병을 다시 조회해서 갱신
+# - 같은 작물/질병명으로 직접 등록해둔 질병(sickKey 가 아닌 id)이 있으면 덮어쓰지 않음
+#
+# 실행:  python -m service.ncpms_sync
+# 전체:  python -m service.ncpms_sync --full --crops 토마토,포도
+import argparse
+import asyncio
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import config
+from database.connection import SessionFactory
+from database.orm import Disease
+from database.repository import DiseaseRepository, NcpmsSyncStateRepository
+from model.crops import load_crop_registry
+from pydantic import BaseModel
+from service.ncpms_client import ncpms_client
+from sqlalchemy.orm import Session
+
+# NCPMS 요청 파라미터 -> 응답 json 의 'service' 부분
+FetchFunction = Callable[[Dict[str, Any]], Awaitable[dict]]
+
+# Disease 컬럼 <- NCPMS 상세 정보(SVC05) 필드
+DETAIL_FIELDS = {
+    'environment': 'developmentCondition',
+    'description': 'symptoms',
+    'solution': 'preventionMethod'
+}
+
+
+class CropSyncResult(BaseModel):
+    crop: str
+    # 증분 실행에서 마지막 동기화 후 시간이 충분히 지나지 않아 건너뜀
+    skipped: bool = False
+    # NCPMS 질병 목록의 질병 수 (같은 질병명 중복 제외)
+    listed_count: int = 0
+    inserted_count: int = 0
+    updated_count: int = 0
+    # 직접 등록한 질병과 작물/질병명이 같아서 건너뛴 수
+    conflict_count: int = 0
+    # 상세 정보 조회에 실패한 수, 실패가 있으면 동기화 시각을 남기지 않아 다음 증분 실행에서 다시 조회
+    error_count: int = 0
+
+
+def _truncate(value: Any, column) -> Optional[str]:
+    # 컬럼 길이를 넘는 NCPMS 설명은 잘라서 저장
+    if value is None:
+        return None
+    value = str(value)
+    return value[:column.type.length] if column.type.length else value
+
+
+def disease_from_ncpms(crop: str, item: dict, detail: dict) -> Disease:
+    # item: 질병 목록(SVC01) 항목, detail: 상세 정보(SVC05)
+    # 이미지는 진단 응답과 같은 목록 썸네일을 우선 사용
+    columns = Disease.__table__.c
+    image_list = detail.get('imageList') or []
+    img_url = item.get('thumbImg') or (image_list[0].get('image') if image_list else None)
+    return Disease.create(
+        disease_id=str(item['sickKey']),
+        kor_name=_truncate(item.get('sickNameKor') or detail.get('sickNameKor'), columns.kor_name),
+        eng_name=_truncate(item.get('sickNameEng') or detail.get('sickNameEng'), columns.eng_name),
+        plant=_truncate(crop, columns.plant),
+        environment=_truncate(detail.get(DETAIL_FIELDS['environment']), columns.environment),
+        description=_truncate(detail.get(DETAIL_FIELDS['description']), columns.description),
+        solution=_truncate(detail.get(DETAIL_FIELDS['solution']), columns.solution),
+        img_url=_truncate(img_url, columns.img_url)
+    )
+
+
+async def fetch_sick_list(fetch: FetchFunction, crop: str, page_size: int) -> List[dict]:
+    # 작물의 전체 질병 목록 (totalCount 만큼 페이지를 넘기며 조회)
+    items = []
+    start_point = 1
+    while True:
+        service = await fetch({'serviceCode': 'SVC01', 'serviceType': 'AA003', 'cropName': crop,
+                               'displayCount': page_size, 'startPoint': start_point})
+        page = service.get('list') or []
+        items.extend(page)
+        if not page or len(items) >= int(service.get('totalCount') or 0):
+            return items
+        start_point += len(page)
+
+
+class NcpmsCatalogSync:
+    def __init__(self, fetch: FetchFunction, page_size: int, interval_seconds: float):
+        self.fetch = fetch
+        self.page_size = page_size
+        self.interval_seconds = interval_seconds
+
+    def _is_fresh(self, session: Session, crop: str, now: datetime) -> bool:
+        state = NcpmsSyncStateRepository(session=session).get_state(crop)
+        return state is not None and (now - state.synced_time).total_seconds() < self.interval_seconds
+
+    async def sync_crop(self, crop: str, session: Session, full: bool = False,
+                        now: Optional[datetime] = None) -> CropSyncResult:
+        now = now or datetime.now()
+        if not full and self._is_fresh(session, crop, now):
+            return CropSyncResult(crop=crop, skipped=True)
+        result = CropSyncResult(crop=crop)
+
+        # 같은 질병명이 여러 번 나오면 첫 항목만 사용 (요청 처리시 NCPMS 검색 결과 첫 항목을 쓰던 것과 같음)
+        items: Dict[str, dict] = {}
+        for item in await fetch_sick_list(self.fetch, crop, self.page_size):
+            items.setdefault(item.get('sickNameKor'), item)
+        result.listed_count = len(items)
+
+        disease_repository = DiseaseRepository(session=session)
+        names = {disease.kor_name: disease.disease_id for disease in disease_repository.get_diseases_by_plant(crop)}
+        existing = {disease.disease_id: disease
+                    for disease in disease_repository.get_diseases_by_ids([str(item['sickKey'])
+                                                                           for item in items.values()])}
+        targets = []
+        for name, item in items.items():
+            sick_key = str(item['sickKey'])
+            if names.get(name, sick_key) != sick_key:
+                result.conflict_count += 1
+                continue
+            if not full and sick_key in existing:
+                continue
+            targets.append(item)
+
+        # 상세 정보는 동시에 조회 (동시 요청 수는 NCPMS 클라이언트에서 제한)
+        details = await asyncio.gather(*[self.fetch({'serviceCode': 'SVC05', 'sickKey': item['sickKey']})
+                                         for item in targets], return_exceptions=True)
+        diseases = []
+        for item, detail in zip(targets, details):
+            if isinstance(detail, BaseException):
+                print(f'NCPMS 질병 상세 조회 실패: {crop} {item.get("sickNameKor")}', detail)
+                result.error_count += 1
+                continue
+            disease = disease_from_ncpms(crop, item, detail)
+            current = existing.get(disease.disease_id)
+            if current is None:
+                diseases.append(disease)
+                result.inserted_count += 1
+            else:
+                for column in Disease.__table__.columns.keys():
+                    setattr(current, column, getattr(disease, column))
+                diseases.append(current)
+                result.updated_count += 1
+        disease_repository.save_diseases(diseases)
+
+        if result.error_count == 0:
+            NcpmsSyncStateRepository(session=session).save_state(crop, now, result.listed_count)
+        return result
+
+    async def sync(self, crops: List[str], session: Session, full: bool = False) -> List[CropSyncResult]:
+        # 작물별로 순서대로 동기화 (같은 세션을 사용하므로), 한 작물이 실패해도 나머지는 계속 진행
+        results = []
+        for crop in crops:
+            try:
+                results.append(await self.sync_crop(crop, session, full=full))
+            except Exception as ex:
+                session.rollback()
+                print(f'NCPMS 질병 목록 동기화 실패: {crop}', ex)
+                results.append(CropSyncResult(crop=crop, error_count=1))
+        return results
+
+
+ncpms_catalog_sync = NcpmsCatalogSync(
+    fetch=ncpms_client.get,
+    page_size=config.NCPMS_SYNC_PAGE_SIZE,
+    interval_seconds=config.NCPMS_SYNC_INTERVAL_SECONDS
+)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    # 모델을 로드하지 않도록 작물 목록은 매니페스트에서 직접 읽음
+    parser = argparse.ArgumentParser(description='NCPMS 질병 정보를 Disease 테이블로 동기화')
+    parser.add_argument('--crops', default=','.join(load_crop_registry(config.CROP_MANIFEST_PATH).names),
+                        help='콤마 구분 작물 목록')
+    parser.add_argument('--full', action='store_true', help='마지막 동기화 시각과 관계없이 모든 질병을 다시 조회')
+    args = parser.parse_args(argv)
+    crops = [crop.strip() for crop in args.crops.split(',') if crop.strip()]
+
+    async def run() -> List[CropSyncResult]:
+        session = SessionFactory()
+        try:
+            return await ncpms_catalog_sync.sync(crops, session, full=args.full)
+        finally:
+            session.close()
+            await ncpms_client.aclose()
+
+    results = asyncio.run(run())
+    for result in results:
+        if result.skipped:
+            print(f'[{result.crop}] 최근에 동기화되어 건너뜀')
+            continue
+        print(f'[{result.crop}] 목록 {result.listed_count}개, 추가 {result.inserted_count}, 갱신 {result.updated_count}, '
+              f'이름 충돌 {result.conflict_count}, 실패 {result.error_count}')
+    if any(result.error_count for result in results):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+# 비슷한 과거 진단 검색
+# 작물별로 현재 서비스중인 모델 버전의 임베딩만 IVF 인덱스에 넣어두고 검색
+# - 시작시 스냅샷을 읽고, 스냅샷 이후 추가분(스냅샷이 없으면 전체)은 백그라운드에서 DB에서 가져옴
+# - 검색할 때 SIMILARITY_REFRESH_SECONDS 가 지났으면 추가분 반영을 예약만 하고 현재 인덱스로 바로 검색
+#   (다른 워커에서 저장된 진단도 이 방식으로 반영됨)
+# - 모델 버전이 바뀌면 해당 작물 인덱스는 새 버전의 임베딩으로 다시 만들고, 다 만들어지면 교체
+# - DB 조회, 인덱스 재학습, 스냅샷 저장은 모두 검색 요청이 아닌 백그라운드 스레드 하나에서 작물별로 한 번씩 실행
+import os
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import config
+from database.connection import SessionFactory
+from database.repository import DiagnosisEmbeddingRepository
+from model.similarity import IvfIndex
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+REFRESH_BATCH_SIZE = 5000
+
+
+class SimilarityIndexStats(BaseModel):
+    crop: str
+    model_version: Optional[str]
+    count: int
+    nlist: int
+    trained: bool
+    # 인덱스에 반영된 마지막 DiagnosisEmbedding id
+    watermark: int
+
+
+class _CropIndex:
+    def __init__(self, model_version: Optional[str], index: Optional[IvfIndex] = None, watermark: int = 0):
+        self.model_version = model_version
+        # 첫 임베딩을 읽을 때 차원을 알 수 있으므로 그 전에는 None
+        self.index = index
+        self.watermark = watermark
+        self.refreshed_time = 0.0
+        self.added_since_snapshot = 0
+        # 추가분 반영과 스냅샷 복사가 같은 작물에서 겹치지 않도록 (검색은 IvfIndex 잠금만 사용)
+        self.lock = threading.Lock()
+
+
+class SimilarCaseIndex:
+    def __init__(self, snapshot_dir: str, nprobe: int, train_min: int, refresh_seconds: float, snapshot_every: int):
+        self.snapshot_dir = snapshot_dir
+        self.nprobe = nprobe
+        self.train_min = train_min
+        self.refresh_seconds = refresh_seconds
+        self.snapshot_every = snapshot_every
+        self._indexes: Dict[str, _CropIndex] = {}
+        # self._indexes 교체와 self._maintaining 에만 사용
+        self._lock = threading.Lock()
+        self._maintenance = ThreadPoolExecutor(max_workers=1, thread_name_prefix='similarity')
+        # 추가분 반영/재학습/스냅샷이 예약되어 있는 작물 (같은 작물을 중복으로 예약하지 않음)
+        self._maintaining = set()
+
+    def _snapshot_path(self, crop: str) -> str:
+        return os.path.join(self.snapshot_dir, f'{crop}.npz')
+
+    def load_snapshots(self, crops: List[str]) -> None:
+        for crop in crops:
+            path = self._snapshot_path(crop)
+            if not os.path.exists(path):
+                continue
+            try:
+                index, metadata = IvfIndex.load(path, nprobe=self.nprobe, train_min=self.train_min)
+            except Exception as ex:
+                print(f'유사 사례 인덱스 스냅샷 로드 실패: {crop}', ex)
+                continue
+            self._indexes[crop] = _CropIndex(metadata.get('model_version'), index, metadata.get('watermark', 0))
+
+    def backfill(self, versions: Dict[str, Optional[str]]) -> None:
+        # 서버 시작시 작물별 스냅샷 이후 추가분(스냅샷이 없으면 전체)을 백그라운드에서 반영
+        for crop, model_version in versions.items():
+            self._schedule_maintenance(crop, model_version)
+
+    def snapshot(self, crop: str) -> None:
+        # 인덱스와 watermark 가 맞도록 작물 잠금 안에서 복사하고, 파일 쓰기는 잠금 밖에서
+        entry = self._indexes.get(crop)
+        if entry is None:
+            return
+        with entry.lock:
+            if entry.index is None:
+                return
+            arrays = entry.index.export()
+            metadata = {'model_version': entry.model_version, 'watermark': entry.watermark}
+            added_since_snapshot = entry.added_since_snapshot
+            entry.added_since_snapshot = 0
+        try:
+            IvfIndex.write(self._snapshot_path(crop), arrays, metadata)
+        except BaseException:
+            with entry.lock:
+                entry.added_since_snapshot += added_since_snapshot
+            raise
+
+    def _maintain(self, crop: str, model_version: Optional[str]) -> None:
+        try:
+            session = SessionFactory()
+            try:
+                entry = self.refresh(crop, model_version, session)
+            finally:
+                session.close()
+            if entry.index is not None and entry.index.needs_training:
+                entry.index.train()
+            if entry.added_since_snapshot >= self.snapshot_every:
+                self.snapshot(crop)
+        except Exception as ex:
+            print(f'유사 사례 인덱스 갱신/재학습/스냅샷 실패: {crop}', ex)
+        finally:
+            with self._lock:
+                self._maintaining.discard(crop)
+
+    def _schedule_maintenance(self, crop: str, model_version: Optional[str]) -> None:
+        with self._lock:
+            if crop in self._maintaining:
+                return
+            try:
+                self._maintenance.submit(self._maintain, crop, model_version)
+            except RuntimeError:
+                # 종료중 (snapshot_all 에서 저장)
+                return
+            self._maintaining.add(crop)
+
+    def snapshot_all(self) -> None:
+        # 아직 시작하지 않은 작업은 취소하고 진행중인 작업이 끝나기를 기다린 뒤 모든 작물 저장
+        self._maintenance.shutdown(wait=True, cancel_futures=True)
+        for crop in list(self._indexes):
+            try:
+                self.snapshot(crop)
+            except Exception as ex:
+                print(f'유사 사례 인덱스 스냅샷 저장 실패: {crop}', ex)
+
+    def refresh(self, crop: str, model_version: Optional[str], session: Session) -> _CropIndex:
+        # 마지막으로 읽은 임베딩 이후 추가분을 인덱스에 반영 (백그라운드 스레드에서 호출)
+        # 모델 버전이 바뀌었으면 새 버전 인덱스를 따로 만들어서 다 읽은 뒤 교체
+        entry = self._indexes.get(crop)
+        if entry is None or entry.model_version != model_version:
+            entry = _CropIndex(model_version)
+        with entry.lock:
+            embedding_repository = DiagnosisEmbeddingRepository(session=session)
+            while True:
+                rows = embedding_repository.get_embeddings_after(crop, model_version, entry.watermark,
+                                                                 REFRESH_BATCH_SIZE)
+                if not rows:
+                    break
+                if entry.index is None:
+                    entry.index = IvfIndex(dim=rows[0].dim, nprobe=self.nprobe, train_min=self.train_min)
+                vectors = []
+                result_ids = []
+                for row in rows:
+                    if row.dim != entry.index.dim:
+                        continue
+                    vectors.append(array('f', row.vector))
+                    result_ids.append(row.result_id)
+                if result_ids:
+                    entry.index.add(result_ids, vectors)
+                entry.watermark = rows[-1].embedding_id
+                entry.added_since_snapshot += len(rows)
+            entry.refreshed_time = time.monotonic()
+        with self._lock:
+            self._indexes[crop] = entry
+        return entry
+
+    def search(self, crop: str, model_version: Optional[str], embedding: List[float],
+               k: int) -> List[Tuple[int, float]]:
+        # (DiagnosisResult.result_id, 코사인 유사도) 목록, 유사도 내림차순
+        # DB 는 읽지 않음, 인덱스가 오래되었거나 없으면 백그라운드 갱신만 예약
+        entry = self._indexes.get(crop)
+        if (entry is None or entry.model_version != model_version
+                or time.monotonic() - entry.refreshed_time >= self.refresh_seconds):
+            self._schedule_maintenance(crop, model_version)
+        if entry is None or entry.model_version != model_version:
+            return []
+        if entry.index is None or entry.index.dim != len(embedding):
+            return []
+        return entry.index.search(embedding, k)
+
+    def stats(self) -> List[SimilarityIndexStats]:
+        return [
+            SimilarityIndexStats(
+                crop=crop,
+                model_version=entry.model_version,
+                count=entry.index.count if entry.index else 0,
+                nlist=entry.index.nlist if entry.index else 0,
+                trained=entry.index is not None and entry.index.centroids is not None,
+                watermark=entry.watermark
+            )
+            for crop, entry in list(self._indexes.items())
+        ]
+
+
+similar_case_index = SimilarCaseIndex(
+    snapshot_dir=config.SIMILARITY_INDEX_DIR,
+    nprobe=config.SIMILARITY_NPROBE,
+    train_min=config.SIMILARITY_TRAIN_MIN,
+    refresh_seconds=config.SIMILARITY_REFRESH_SECONDS,
+    snapshot_every=config.SIMILARITY_SNAPSHOT_EVERY
+)
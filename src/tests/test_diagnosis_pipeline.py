@@ -0,0 +1,65 @@
+import asyncio
+import random
+
+from model.classification0430 import PredictionResult
+from schema.response import ClassificationResultSchema
+from service.diagnosis import DiagnosisPipeline
+from service.disease import DiseaseResolution
+from service.firebase import FirebaseStorageSchema
+
+DIAGNOSIS_COUNT = 20
+
+
+# 이미지 바이트 i 번 -> 질병명 i 번으로 분류되도록 가짜 단계 구성
+# 각 단계에 임의 지연을 넣어 여러 진단의 단계가 섞여서 실행되게 함
+async def fake_upload(image_bytes: bytes, filename: str, content_type: str) -> FirebaseStorageSchema:
+    await asyncio.sleep(random.random() / 100)
+    index = image_bytes.decode()
+    return FirebaseStorageSchema(image_url=f'url-{index}', file_name=f'file-{index}')
+
+
+async def fake_predict(image_bytes: bytes, crop: str) -> PredictionResult:
+    await asyncio.sleep(random.random() / 100)
+    index = int(image_bytes.decode())
+    return PredictionResult(prob1=index / 100, prob2=0.0, disease_name1=f'질병{index}', disease_name2='정상')
+
+
+def fake_resolve(plantName: str, disease_name1: str, disease_name2: str, db) -> DiseaseResolution:
+    result = ClassificationResultSchema(diseaseName=disease_name1, condition='', symptoms='',
+                                        preventionMethod='', diseaseImg='', plant_name=plantName)
+    return DiseaseResolution(result=result, disease_id1=disease_name1, disease_id2=None,
+                             disease_code1=disease_name1, disease_code2=None)
+
+
+def make_pipeline(mocker) -> DiagnosisPipeline:
+    user_service = mocker.Mock()
+    user_service.decode_jwt.side_effect = lambda access_token: {"id": access_token}
+    diagnosis_result_repo = mocker.Mock()
+    diagnosis_result_repo.save_diagnosis_result.side_effect = lambda diagnosis_result: diagnosis_result
+    return DiagnosisPipeline(diagnosis_result_repo=diagnosis_result_repo, user_service=user_service,
+                             user_repo=mocker.Mock(), db=mocker.Mock())
+
+
+# 같은 워커에서 동시에 진행된 진단끼리 결과가 섞이지 않는지 확인
+def test_concurrent_diagnoses_do_not_cross_over(mocker):
+    mocker.patch("service.diagnosis.upload_image_bytes_to_firebase_storage", side_effect=fake_upload)
+    mocker.patch("service.diagnosis.predict_bytes", side_effect=fake_predict)
+    mocker.patch("service.diagnosis.resolve_disease", side_effect=fake_resolve)
+
+    pipelines = [make_pipeline(mocker) for _ in range(DIAGNOSIS_COUNT)]
+
+    async def run_all():
+        return await asyncio.gather(*[
+            pipeline.run(f'user-{i}', '토마토', str(i).encode(), f'{i}.jpg', 'image/jpeg')
+            for i, pipeline in enumerate(pipelines)
+        ])
+
+    results = asyncio.run(run_all())
+
+    for i, (pipeline, result) in enumerate(zip(pipelines, results)):
+        assert result.diseaseName == f'질병{i}'
+        saved = pipeline.diagnosis_result
+        assert saved.user_id == f'user-{i}'
+        assert saved.img_url == f'url-{i}'
+        assert saved.disease_id1 == f'질병{i}'
+        assert saved.percent1 == i
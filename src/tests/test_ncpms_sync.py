@@ -0,0 +1,111 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database.orm import Base, Disease, NcpmsSyncState
+from database.repository import DiseaseRepository, NcpmsSyncStateRepository
+from service.ncpms_sync import NcpmsCatalogSync
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'ncpms')
+
+
+# 기록해둔 NCPMS 응답으로 원격 API 대신 응답 (SVC01 은 displayCount/startPoint 로 페이지를 나눠서 반환)
+class RecordedNcpms:
+    def __init__(self):
+        with open(os.path.join(FIXTURE_DIR, 'svc01.json'), encoding='utf-8') as f:
+            self.sick_lists = json.load(f)
+        with open(os.path.join(FIXTURE_DIR, 'svc05.json'), encoding='utf-8') as f:
+            self.details = json.load(f)
+        self.calls = []
+
+    async def get(self, params: dict) -> dict:
+        self.calls.append(params)
+        if params['serviceCode'] == 'SVC01':
+            items = self.sick_lists.get(params['cropName'], [])
+            start = params['startPoint'] - 1
+            return {'totalCount': len(items), 'list': items[start:start + params['displayCount']]}
+        return self.details[params['sickKey']]
+
+    def detail_keys(self) -> list:
+        return [params['sickKey'] for params in self.calls if params['serviceCode'] == 'SVC05']
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine, tables=[Disease.__table__, NcpmsSyncState.__table__])
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def test_sync_inserts_catalog(session):
+    ncpms = RecordedNcpms()
+    sync = NcpmsCatalogSync(fetch=ncpms.get, page_size=2, interval_seconds=3600)
+
+    result = asyncio.run(sync.sync_crop('토마토', session))
+
+    # 같은 질병명(잎마름역병)은 첫 항목만 사용
+    assert result.listed_count == 3
+    assert result.inserted_count == 3
+    assert sorted(ncpms.detail_keys()) == ['D00001143', 'D00001149', 'D00001163']
+
+    disease = DiseaseRepository(session=session).get_disease_by_plant_and_disease_name('토마토', '잎곰팡이병')
+    assert disease.disease_id == 'D00001143'
+    assert disease.eng_name == 'Leaf mold'
+    assert disease.environment == '시설재배에서 습도가 높을 때 많이 발생한다.'
+    assert disease.solution == '환기를 자주 하여 습도를 낮춘다.'
+    assert disease.img_url.endswith('D00001143_thumb.jpg')
+    # 목록 썸네일이 없으면 상세 정보 이미지 사용
+    assert DiseaseRepository(session=session).get_disease_by_id('D00001163').img_url.endswith('D00001163_1.jpg')
+
+    state = NcpmsSyncStateRepository(session=session).get_state('토마토')
+    assert state.disease_count == 3
+
+
+def test_incremental_sync_only_fetches_new_diseases(session):
+    sync = NcpmsCatalogSync(fetch=RecordedNcpms().get, page_size=2, interval_seconds=3600)
+    synced_time = datetime(2024, 5, 1)
+    asyncio.run(sync.sync_crop('토마토', session, now=synced_time))
+    DiseaseRepository(session=session).delete_disease('D00001163')
+
+    # 마지막 동기화 후 interval 이 지나지 않았으면 건너뜀
+    ncpms = RecordedNcpms()
+    sync.fetch = ncpms.get
+    result = asyncio.run(sync.sync_crop('토마토', session, now=synced_time + timedelta(minutes=10)))
+    assert result.skipped
+    assert ncpms.calls == []
+
+    # 지났으면 목록은 다시 받고 DB에 없는 질병의 상세 정보만 조회
+    result = asyncio.run(sync.sync_crop('토마토', session, now=synced_time + timedelta(hours=2)))
+    assert result.inserted_count == 1
+    assert result.updated_count == 0
+    assert ncpms.detail_keys() == ['D00001163']
+    assert NcpmsSyncStateRepository(session=session).get_state('토마토').synced_time == synced_time + timedelta(hours=2)
+
+    # 전체 동기화는 모든 질병을 갱신
+    ncpms.calls.clear()
+    result = asyncio.run(sync.sync_crop('토마토', session, full=True, now=synced_time + timedelta(hours=2)))
+    assert result.updated_count == 3
+    assert len(ncpms.detail_keys()) == 3
+
+
+def test_sync_keeps_manually_registered_disease(session):
+    DiseaseRepository(session=session).create_disease(Disease.create(
+        disease_id='custom-powdery-mildew', kor_name='흰가루병', eng_name='', plant='토마토',
+        environment='직접 등록한 발생환경', description='', solution='', img_url=''))
+    sync = NcpmsCatalogSync(fetch=RecordedNcpms().get, page_size=50, interval_seconds=3600)
+
+    result = asyncio.run(sync.sync_crop('토마토', session))
+
+    assert result.conflict_count == 1
+    assert result.inserted_count == 2
+    disease = DiseaseRepository(session=session).get_disease_by_plant_and_disease_name('토마토', '흰가루병')
+    assert disease.disease_id == 'custom-powdery-mildew'
+    assert disease.environment == '직접 등록한 발생환경'